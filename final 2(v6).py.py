@@ -1,2237 +1,5275 @@
-
-from flask import Flask, render_template_string, make_response, request
-from flask_socketio import SocketIO, emit, join_room
-from datetime import datetime
-import uuid
-import base64
-import logging
-import os
-import time
-import socket
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-app = Flask(__name__, static_folder='static', static_url_path='/static')
-app.config['SECRET_KEY'] = os.urandom(24).hex()
-socketio = SocketIO(app, cors_allowed_origins="*", logger=True, engineio_logger=True)
-
-# Store connected users, chat history, and files
-users = {}  # {user_id: {'sid': sid, 'room': room, 'username': username, 'connection_time': timestamp}}
-chat_history = {}  # Per-room chat history
-files = {}  # {file_id: {name, data, timestamp}}
-
-# Function to detect local IP address
-def get_local_ip():
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        local_ip = s.getsockname()[0]
-        s.close()
-        return local_ip
-    except Exception as e:
-        logger.error(f"Error detecting local IP: {str(e)}")
-        return "127.0.0.1"  # Fallback to localhost
-
-# Clean up old files (older than 1 hour)
-def cleanup_files():
-    current_time = time.time()
-    expired = [fid for fid, info in files.items() if current_time - info['timestamp'] > 3600]
-    for fid in expired:
-        del files[fid]
-    logger.info(f"Cleaned up {len(expired)} expired files")
-
-# HTML/JavaScript client code for Edge 2 Meet
-INDEX_HTML = r'''
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Edge 2 Meet</title>
-    <script src="https://cdn.tailwindcss.com"></script>
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.7.5/socket.io.min.js"></script>
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.2/css/all.min.css">
-    <style>
-        @import url('https://fonts.googleapis.com/css2?family=Poppins:wght@400;500;600;700&display=swap');
-
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-
-        body {
-            background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%);
-            color: #e2e8f0;
-            font-family: 'Poppins', sans-serif;
-            min-height: 100vh;
-            overflow-x: hidden;
-        }
-
-        #header {
-            position: fixed;
-            top: 0;
-            left: 0;
-            right: 0;
-            height: 80px;
-            background: rgba(15, 23, 42, 0.95);
-            backdrop-filter: blur(8px);
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            padding: 0 24px;
-            z-index: 200;
-            box-shadow: 0 2px 8px rgba(0, 0, 0, 0.3);
-        }
-
-        #header h1 {
-            font-size: 1.75rem;
-            font-weight: 600;
-            color: #fff;
-            margin-right: 16px;
-        }
-
-        .left-logo {
-            position: absolute;
-            left: 24px;
-            top: 20px;
-        }
-
-        .right-logo {
-            position: absolute;
-            right: 24px;
-            top: 20px;
-        }
-
-        #logo {
-            width: 40px;
-            height: 40px;
-            object-fit: contain;
-            transition: transform 0.3s ease;
-        }
-
-        #logo:hover {
-            transform: rotate(360deg);
-        }
-
-        #info-box {
-            background: rgba(30, 41, 59, 0.9);
-            backdrop-filter: blur(6px);
-            border-radius: 12px;
-            padding: 8px 16px;
-            display: flex;
-            align-items: center;
-            gap: 12px;
-            box-shadow: 0 4px 12px rgba(0, 0, 0, 0.3);
-            font-size: 0.9rem;
-            font-weight: 500;
-            color: #fff;
-            transition: transform 0.3s ease;
-        }
-
-        #info-box:hover {
-            transform: scale(1.05);
-        }
-
-        #recording-logo {
-            display: none;
-            color: #f43f5e;
-            animation: pulse 1.5s infinite;
-        }
-
-        #recording-logo.active {
-            display: inline-block;
-        }
-
-        #videos {
-            display: grid;
-            gap: 16px;
-            padding: 16px;
-            background: rgba(30, 41, 59, 0.8);
-            border-radius: 16px;
-            margin: 96px 16px 96px;
-            width: calc(100% - 32px);
-            box-sizing: border-box;
-            box-shadow: 0 6px 24px rgba(0, 0, 0, 0.4);
-            transition: width 0.3s ease;
-            /* Ensure no scrolling */
-            overflow: hidden;
-            /* Fix the height to fit the viewport */
-            height: calc(100vh - 80px - 80px - 32px); /* Subtract header (80px), toolbar (80px), and padding/margins (32px) */
-        }
-
-        #videos.chat-active {
-            width: calc(100% - 400px);
-        }
-
-        .video-container {
-            position: relative;
-            width: 100%;
-            aspect-ratio: 16 / 9;
-            border-radius: 12px;
-            overflow: hidden;
-            transition: transform 0.3s ease;
-        }
-
-        video {
-            width: 100%;
-            height: 100%;
-            background: #000;
-            border-radius: 12px;
-            border: 2px solid #475569;
-            object-fit: cover;
-            transition: border-color 0.3s ease, box-shadow 0.3s ease;
-        }
-
-        video.speaking {
-            border-color: #22c55e;
-            box-shadow: 0 0 20px rgba(34, 197, 94, 0.6);
-        }
-
-        video:hover {
-            transform: scale(1.02);
-        }
-
-        .user-name {
-            position: absolute;
-            top: 8px;
-            left: 8px;
-            background: rgba(0, 0, 0, 0.7);
-            color: #fff;
-            padding: 4px 12px;
-            border-radius: 8px;
-            font-size: 0.85rem;
-            font-weight: 500;
-        }
-
-        .mute-indicator {
-            position: absolute;
-            bottom: 8px;
-            right: 8px;
-            background: rgba(0, 0, 0, 0.7);
-            padding: 6px;
-            border-radius: 50%;
-            color: #fff;
-            font-size: 1rem;
-            display: none;
-        }
-
-        .mute-indicator.active {
-            display: block;
-        }
-
-        .mute-indicator.audio {
-            right: 38px;
-        }
-
-        #chat-section {
-            position: fixed;
-            top: 0;
-            right: 0;
-            height: 100vh;
-            width: 360px;
-            background: rgba(30, 41, 59, 0.95);
-            backdrop-filter: blur(8px);
-            border-left: 1px solid #475569;
-            padding: 16px;
-            transform: translateX(100%);
-            transition: transform 0.3s ease;
-            z-index: 200;
-            box-shadow: -4px 0 12px rgba(0, 0, 0, 0.4);
-        }
-
-        #chat-section.active {
-            transform: translateX(0);
-        }
-
-        #chat-header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            padding: 12px 0;
-            border-bottom: 1px solid #475569;
-        }
-
-        #chat-close {
-            cursor: pointer;
-            color: #94a3b8;
-            transition: color 0.2s ease;
-        }
-
-        #chat-close:hover {
-            color: #fff;
-        }
-
-        #chat-messages {
-            height: calc(100% - 120px);
-            overflow-y: auto;
-            margin-bottom: 16px;
-            display: flex;
-            flex-direction: column-reverse;
-            padding: 12px;
-        }
-
-        .message {
-            max-width: 80%;
-            margin: 8px 0;
-            padding: 12px 16px;
-            border-radius: 12px;
-            font-size: 0.9rem;
-            line-height: 1.4;
-            box-shadow: 0 2px 6px rgba(0, 0, 0, 0.2);
-            transition: transform 0.2s ease;
-        }
-
-        .message:hover {
-            transform: translateY(-2px);
-        }
-
-        .message .text {
-            word-break: break-word;
-        }
-
-        .message .timestamp {
-            font-size: 0.7rem;
-            color: #94a3b8;
-            margin-top: 4px;
-            text-align: right;
-        }
-
-        .sent {
-            align-self: flex-end;
-            background: #3b82f6;
-            color: #fff;
-        }
-
-        .received {
-            align-self: flex-start;
-            background: #475569;
-            color: #e2e8f0;
-        }
-
-        #chat-input {
-            background: #2d3748;
-            border: 1px solid #475569;
-            border-radius: 8px 0 0 8px;
-            padding: 10px;
-            color: #fff;
-            font-size: 0.9rem;
-        }
-
-        #send-chat {
-            background: #3b82f6;
-            border-radius: 0 8px 8px 0;
-            padding: 10px 16px;
-            transition: background 0.2s ease;
-        }
-
-        #send-chat:hover {
-            background: #2563eb;
-        }
-
-        #chat-alert {
-            position: absolute;
-            top: 16px;
-            left: 16px;
-            padding: 8px 16px;
-            background: #22c55e;
-            color: #fff;
-            border-radius: 8px;
-            font-size: 0.8rem;
-            display: none;
-            z-index: 250;
-            animation: pulse 2s infinite;
-        }
-
-        #bottom-toolbar {
-            position: fixed;
-            bottom: 0;
-            left: 0;
-            right: 0;
-            background: rgba(15, 23, 42, 0.95);
-            backdrop-filter: blur(8px);
-            padding: 12px;
-            display: flex;
-            justify-content: center;
-            gap: 12px;
-            flex-wrap: wrap;
-            z-index: 100;
-            box-shadow: 0 -2px 10px rgba(0, 0, 0, 0.3);
-        }
-
-        .control-btn, .action-btn {
-            display: flex;
-            align-items: center;
-            gap: 8px;
-            padding: 10px 16px;
-            border-radius: 10px;
-            background: #3b82f6;
-            color: #fff;
-            font-size: 0.9rem;
-            font-weight: 500;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 6px rgba(0, 0, 0, 0.2);
-        }
-
-        .control-btn:hover, .action-btn:hover {
-            background: #2563eb;
-            transform: translateY(-2px);
-            box-shadow: 0 4px 12px rgba(0, 0, 0, 0.3);
-        }
-
-        .control-btn.active {
-            background: #f43f5e;
-        }
-
-        .control-btn.active:hover {
-            background: #e11d48;
-        }
-
-        .action-btn {
-            background: #475569;
-        }
-
-        .action-btn:hover {
-            background: #334155;
-        }
-
-        #leave-meeting-btn {
-            background: #f43f5e;
-        }
-
-        #leave-meeting-btn:hover {
-            background: #e11d48;
-        }
-
-        .badge {
-            display: flex;
-            align-items: center;
-            gap: 8px;
-            background: rgba(30, 41, 59, 0.9);
-            padding: 8px 16px;
-            border-radius: 9999px;
-            border: 1px solid #475569;
-            font-size: 0.9rem;
-            cursor: pointer;
-            transition: all 0.2s ease;
-        }
-
-        .badge:hover {
-            background: #475569;
-            transform: scale(1.05);
-        }
-
-        #toggle-chat {
-            position: relative;
-        }
-
-        #unread-badge {
-            position: absolute;
-            top: -8px;
-            right: -8px;
-            background: #f43f5e;
-            color: #fff;
-            border-radius: 50%;
-            width: 20px;
-            height: 20px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-size: 0.7rem;
-            display: none;
-        }
-
-        #room-modal {
-            position: fixed;
-            top: 0;
-            left: 0;
-            width: 100%;
-            height: 100%;
-            background: rgba(0, 0, 0, 0.85);
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            z-index: 1000;
-            animation: fadeIn 0.3s ease;
-        }
-
-        #room-modal.hidden {
-            display: none;
-        }
-
-        #main-ui {
-            display: none;
-            animation: fadeIn 0.3s ease;
-        }
-
-        #main-ui.active {
-            display: flex;
-        }
-
-        #participants-modal {
-            position: fixed;
-            top: 0;
-            left: 0;
-            width: 100%;
-            height: 100%;
-            background: rgba(0, 0, 0, 0.85);
-            display: none;
-            align-items: center;
-            justify-content: center;
-            z-index: 1000;
-        }
-
-        #participants-modal.active {
-            display: flex;
-        }
-
-        #participants-list {
-            background: rgba(30, 41, 59, 0.95);
-            padding: 24px;
-            border-radius: 16px;
-            max-width: 400px;
-            width: 90%;
-            max-height: 80vh;
-            overflow-y: auto;
-            border: 1px solid #475569;
-            box-shadow: 0 6px 24px rgba(0, 0, 0, 0.4);
-        }
-
-        #participants-list h3 {
-            font-size: 1.5rem;
-            font-weight: 600;
-            color: #fff;
-            margin-bottom: 16px;
-        }
-
-        #participants-list ul {
-            list-style: none;
-            padding: 0;
-        }
-
-        #participants-list li {
-            padding: 12px 0;
-            border-bottom: 1px solid #475569;
-            display: flex;
-            justify-content: space-between;
-            font-size: 0.9rem;
-            color: #e2e8f0;
-        }
-
-        #participants-close {
-            margin-top: 16px;
-            padding: 10px 20px;
-            background: #3b82f6;
-            border-radius: 10px;
-            text-align: center;
-            cursor: pointer;
-            color: #fff;
-            font-weight: 500;
-            transition: background 0.2s ease;
-        }
-
-        #participants-close:hover {
-            background: #2563eb;
-        }
-
-        #file-transfer-section {
-            position: fixed;
-            bottom: 96px;
-            right: 16px;
-            background: rgba(30, 41, 59, 0.95);
-            backdrop-filter: blur(8px);
-            padding: 16px;
-            border-radius: 12px;
-            width: 300px;
-            box-shadow: 0 4px 16px rgba(0, 0, 0, 0.4);
-            z-index: 150;
-            transition: all 0.3s ease;
-        }
-
-        #file-transfer-section.hidden {
-            display: none;
-        }
-
-        #file-input {
-            background: #2d3748;
-            border: 1px solid #475569;
-            border-radius: 8px;
-            padding: 8px;
-            color: #fff;
-            font-size: 0.85rem;
-        }
-
-        #error-message, #notification {
-            position: fixed;
-            top: 16px;
-            right: 16px;
-            padding: 12px 24px;
-            border-radius: 10px;
-            z-index: 300;
-            display: none;
-            max-width: 300px;
-            font-size: 0.9rem;
-            animation: slideIn 0.3s ease;
-        }
-
-        #error-message {
-            background: #f43f5e;
-            color: #fff;
-        }
-
-        #notification {
-            background: #22c55e;
-            color: #fff;
-        }
-
-        #settings-modal {
-            position: fixed;
-            top: 0;
-            left: 0;
-            width: 100%;
-            height: 100%;
-            background: rgba(0, 0, 0, 0.85);
-            display: none;
-            align-items: center;
-            justify-content: center;
-            z-index: 1000;
-        }
-
-        #settings-modal.active {
-            display: flex;
-        }
-
-        #settings-content {
-            background: rgba(30, 41, 59, 0.95);
-            padding: 24px;
-            border-radius: 16px;
-            max-width: 400px;
-            width: 90%;
-            border: 1px solid #475569;
-            box-shadow: 0 6px 24px rgba(0, 0, 0, 0.4);
-        }
-
-        #settings-content h3 {
-            font-size: 1.5rem;
-            font-weight: 600;
-            color: #fff;
-            margin-bottom: 16px;
-        }
-
-        #settings-content label {
-            display: block;
-            margin-bottom: 8px;
-            font-size: 0.9rem;
-            color: #e2e8f0;
-        }
-
-        #settings-content select {
-            width: 100%;
-            padding: 10px;
-            background: #2d3748;
-            border: 1px solid #475569;
-            border-radius: 8px;
-            color: #e2e8f0;
-            font-size: 0.9rem;
-            margin-bottom: 16px;
-        }
-
-        #settings-close {
-            margin-top: 16px;
-            padding: 10px 20px;
-            background: #3b82f6;
-            border-radius: 10px;
-            text-align: center;
-            cursor: pointer;
-            color: #fff;
-            font-weight: 500;
-            transition: background 0.2s ease;
-        }
-
-        #settings-close:hover {
-            background: #2563eb;
-        }
-
-        @media (max-width: 768px) {
-            #videos {
-                margin: 88px 8px 80px;
-                padding: 8px;
-                gap: 8px;
-                width: calc(100% - 16px);
-            }
-
-            #videos.chat-active {
-                width: 100%;
-            }
-
-            #chat-section {
-                width: 100%;
-                max-width: 100%;
-            }
-
-            #header {
-                padding: 0 16px;
-                height: 72px;
-            }
-
-            .left-logo {
-                top: 16px;
-            }
-
-            .right-logo {
-                top: 16px;
-            }
-
-            #info-box {
-                font-size: 0.8rem;
-                padding: 6px 12px;
-            }
-
-            .control-btn, .action-btn {
-                padding: 8px 12px;
-                font-size: 0.8rem;
-            }
-
-            #file-transfer-section {
-                width: 280px;
-                right: 8px;
-            }
-        }
-
-        @media (max-width: 480px) {
-            #header h1 {
-                font-size: 1.4rem;
-            }
-
-            #logo {
-                width: 32px;
-                height: 32px;
-            }
-
-            #info-box {
-                font-size: 0.75rem;
-                padding: 4px 8px;
-            }
-
-            .badge {
-                padding: 6px 12px;
-                font-size: 0.8rem;
-            }
-
-            #participants-list, #settings-content {
-                padding: 16px;
-                max-width: 90%;
-            }
-        }
-
-        @keyframes fadeIn {
-            from { opacity: 0; }
-            to { opacity: 1; }
-        }
-
-        @keyframes slideIn {
-            from { transform: translateX(100%); opacity: 0; }
-            to { transform: translateX(0); opacity: 1; }
-        }
-
-        @keyframes pulse {
-            0% { transform: scale(1); }
-            50% { transform: scale(1.1); }
-            100% { transform: scale(1); }
-        }
-
-        @keyframes pop {
-            0% { transform: scale(0.8); opacity: 0; }
-            50% { transform: scale(1.05); opacity: 1; }
-            100% { transform: scale(1); opacity: 1; }
-        }
-    </style>
-</head>
-<body>
-    <div id="error-message"></div>
-    <div id="notification"></div>
-    <div id="header">
-        <img src="/static/edge2systems_logo.jpg" alt="Edge 2 Systems Logo" id="logo" class="left-logo">
-        <h1>Edge 2 Meet</h1>
-        <div id="info-box">
-            <i id="recording-logo" class="fas fa-record-vinyl"></i>
-            <span id="room-id-display"></span>
-            <span id="vc-timer">00:00:00</span>
-        </div>
-        <img src="/static/indiannavy_logo.jpg" alt="Indian Navy Logo" id="logo" class="right-logo">
-    </div>
-    <div id="room-modal">
-        <div class="bg-gray-800 p-8 rounded-xl shadow-2xl w-full max-w-md">
-            <h2 class="text-2xl font-bold mb-6 text-center text-white">Join a Room</h2>
-            <div class="flex flex-col gap-4">
-                <input id="room-id" type="text" class="p-3 bg-gray-700 border border-gray-600 rounded-lg text-white placeholder-gray-400 focus:outline-none focus:ring-2 focus:ring-blue-500" placeholder="Enter Room ID">
-                <input id="username-input-room" type="text" class="p-3 bg-gray-700 border border-gray-600 rounded-lg text-white placeholder-gray-400 focus:outline-none focus:ring-2 focus:ring-blue-500" placeholder="Enter your name">
-                <button id="join-room" class="p-3 bg-blue-500 hover:bg-blue-600 rounded-lg flex items-center justify-center gap-2 text-white font-medium">
-                    <i class="fas fa-sign-in-alt"></i> Join Room
-                </button>
-            </div>
-        </div>
-    </div>
-    <div id="participants-modal">
-        <div id="participants-list">
-            <h3>Participants: <span id="participant-count-modal">0</span></h3>
-            <ul id="participants-items"></ul>
-            <div id="participants-close">Close</div>
-        </div>
-    </div>
-    <div id="settings-modal">
-        <div id="settings-content">
-            <h3>Settings</h3>
-            <label for="microphone-select">Microphone:</label>
-            <select id="microphone-select">
-                <option value="">Select Microphone</option>
-            </select>
-            <label for="camera-select">Camera:</label>
-            <select id="camera-select">
-                <option value="">Select Camera</option>
-            </select>
-            <label for="quality-select">Video Quality:</label>
-            <select id="quality-select">
-                <option value="high">High (1080p, 60fps)</option>
-                <option value="standard" selected>Standard (720p, 30fps)</option>
-                <option value="medium">Medium (480p, 30fps)</option>
-                <option value="low">Low (360p, 15fps)</option>
-            </select>
-            <div id="settings-close">Close</div>
-        </div>
-    </div>
-    <div id="main-ui" class="flex flex-col items-center p-4">
-        <div class="w-full max-w-full flex flex-col items-center space-y-6">
-            <div id="videos"></div>
-        </div>
-    </div>
-    <div id="chat-section">
-        <div id="chat-header">
-            <h3 class="text-lg font-semibold">Chat</h3>
-            <i id="chat-close" class="fas fa-times fa-lg"></i>
-        </div>
-        <div id="chat-alert"></div>
-        <div id="chat-messages"></div>
-        <div class="flex">
-            <input id="chat-input" type="text" class="flex-1" placeholder="Type a message...">
-            <button id="send-chat" class="flex items-center gap-2">
-                <i class="fas fa-paper-plane"></i>
-            </button>
-        </div>
-    </div>
-    <div id="bottom-toolbar">
-        <div class="badge" id="participant-count">
-            <i class="fas fa-users"></i> Participants: 0
-        </div>
-        <button id="mute-audio" class="control-btn">
-            <i class="fas fa-microphone"></i> Mute Audio
-        </button>
-        <button id="mute-video" class="control-btn">
-            <i class="fas fa-video"></i> Mute Video
-        </button>
-        <button id="share-screen" class="control-btn">
-            <i class="fas fa-desktop"></i> Share Screen
-        </button>
-        <button id="record" class="control-btn">
-            <i class="fas fa-record-vinyl"></i> Start Recording
-        </button>
-        <button id="toggle-chat" class="control-btn">
-            <i class="fas fa-comments"></i> Chat
-            <span id="unread-badge">0</span>
-        </button>
-        <button id="toggle-file-transfer" class="control-btn">
-            <i class="fas fa-file-upload"></i> File Transfer
-        </button>
-        <button id="settings-btn" class="control-btn">
-            <i class="fas fa-cog"></i> Settings
-        </button>
-        <button id="leave-meeting-btn" class="control-btn">
-            <i class="fas fa-phone-slash"></i> Leave Meeting
-        </button>
-    </div>
-    <div id="file-transfer-section" class="hidden">
-        <div class="flex flex-col gap-3">
-            <input type="file" id="file-input">
-            <button id="send-file" class="control-btn">
-                <i class="fas fa-paper-plane"></i> Send File
-            </button>
-            <button id="cancel-file" class="action-btn">
-                <i class="fas fa-times"></i> Cancel
-            </button>
-        </div>
-    </div>
-
-    <script>
-        const serverIp = window.location.hostname;
-        const socket = io(`http://${serverIp}:5000`, { 
-            transports: ['websocket'], 
-            reconnection: true, 
-            reconnectionAttempts: 5, 
-            reconnectionDelay: 1000 
-        });
-        const localVideo = document.createElement('video');
-        let localStream;
-        let screenStream;
-        let mediaRecorder;
-        let recordedChunks = [];
-        const peers = {};
-        const userId = Math.random().toString(36).substring(2);
-        let username = `User ${userId.substring(0, 6)}`;
-        let participantCount = 0;
-        let isAudioMuted = false;
-        let isVideoMuted = false;
-        let isScreenSharing = false;
-        let isRecording = false;
-        let isChatVisible = false;
-        let isFileTransferVisible = false;
-        let roomId = null;
-        let unreadMessages = 0;
-        const pendingIceCandidates = {};
-        const users = {};
-        const audioContext = new (window.AudioContext || window.webkitAudioContext)();
-        const analyserNodes = {};
-        let currentMicrophone = '';
-        let currentCamera = '';
-        let currentVideoQuality = 'standard';
-        let vcStartTime = null;
-        let vcTimerInterval = null;
-
-        function startVCTimer() {
-            vcStartTime = Date.now();
-            const vcTimerDisplay = document.getElementById('vc-timer');
-            vcTimerInterval = setInterval(() => {
-                const elapsed = Date.now() - vcStartTime;
-                const hours = Math.floor(elapsed / 3600000);
-                const minutes = Math.floor((elapsed % 3600000) / 60000);
-                const seconds = Math.floor((elapsed % 60000) / 1000);
-                vcTimerDisplay.textContent = `${hours.toString().padStart(2, '0')}:${minutes.toString().padStart(2, '0')}:${seconds.toString().padStart(2, '0')}`;
-            }, 1000);
-        }
-
-        function stopVCTimer() {
-            if (vcTimerInterval) {
-                clearInterval(vcTimerInterval);
-                vcTimerInterval = null;
-            }
-            document.getElementById('vc-timer').textContent = '00:00:00';
-            vcStartTime = null;
-        }
-
-        function showError(message) {
-            const errorDiv = document.getElementById('error-message');
-            errorDiv.textContent = message;
-            errorDiv.style.display = 'block';
-            setTimeout(() => errorDiv.style.display = 'none', 5000);
-        }
-
-        function showNotification(message) {
-            const notificationDiv = document.getElementById('notification');
-            notificationDiv.textContent = message;
-            notificationDiv.style.display = 'block';
-            setTimeout(() => notificationDiv.style.display = 'none', 3000);
-        }
-
-        function updateVideoSizes() {
-            try {
-                const containers = document.querySelectorAll('#videos .video-container');
-                const count = containers.length;
-                const videosContainer = document.getElementById('videos');
-
-                if (!videosContainer) return;
-
-                videosContainer.classList.toggle('chat-active', isChatVisible);
-
-                if (count === 0) {
-                    videosContainer.style.display = 'none';
-                    return;
-                }
-
-                const headerHeight = 80;
-                const infoBoxHeight = 48;
-                const toolbarHeight = 80;
-                const gap = 16;
-                const padding = 16;
-                const availableHeight = window.innerHeight - headerHeight - infoBoxHeight - toolbarHeight - 2 * padding;
-                const availableWidth = isChatVisible 
-                    ? window.innerWidth - 360 - 2 * padding 
-                    : window.innerWidth - 2 * padding;
-
-                let cols, rows;
-                if (count <= 3) {
-                    cols = count;
-                    rows = 1;
-                } else {
-                    cols = 3;
-                    rows = Math.ceil((count - 3) / 3) + 1;
-                }
-
-                const totalGapsX = gap * (cols - 1);
-                let videoWidth = (availableWidth - totalGapsX) / cols;
-                let videoHeight = videoWidth * (9 / 16);
-                let totalHeight = videoHeight * rows + gap * (rows - 1);
-
-                if (totalHeight > availableHeight) {
-                    videoHeight = (availableHeight - gap * (rows - 1)) / rows;
-                    videoWidth = videoHeight * (16 / 9);
-                }
-
-                cols = Math.max(cols, 1);
-                rows = Math.max(rows, 1);
-
-                videosContainer.style.display = 'grid';
-                videosContainer.style.gridTemplateColumns = `repeat(${cols}, ${videoWidth}px)`;
-                videosContainer.style.gridTemplateRows = `repeat(${rows}, ${videoHeight}px)`;
-                videosContainer.style.gap = `${gap}px`;
-                videosContainer.style.padding = `${padding}px`;
-                videosContainer.style.height = `${totalHeight + 2 * padding}px`;
-                videosContainer.style.width = isChatVisible ? 'calc(100% - 360px)' : 'calc(100% - 32px)';
-                videosContainer.style.boxSizing = 'border-box';
-                videosContainer.style.overflow = 'hidden';
-
-                const sortedContainers = Array.from(containers).sort((a, b) => {
-                    const idA = a.id.replace('video-container-', '');
-                    const idB = b.id.replace('video-container-', '');
-                    return idA.localeCompare(idB);
-                });
-
-                videosContainer.innerHTML = '';
-                sortedContainers.forEach(container => {
-                    container.style.width = '100%';
-                    container.style.height = '100%';
-                    container.style.aspectRatio = '16 / 9';
-                    const video = container.querySelector('video');
-                    if (video) {
-                        video.style.width = '100%';
-                        video.style.height = '100%';
-                        video.style.objectFit = 'cover';
-                    }
-                    videosContainer.appendChild(container);
-                });
-            } catch (err) {
-                showError('Failed to update video layout');
-            }
-        }
-
-        function showParticipantsList() {
-            const modal = document.getElementById('participants-modal');
-            const list = document.getElementById('participants-items');
-            const countSpan = document.getElementById('participant-count-modal');
-            list.innerHTML = '';
-            countSpan.textContent = participantCount;
-            Object.entries(users).forEach(([id, user]) => {
-                const li = document.createElement('li');
-                const connectionTime = user.connection_time ? 
-                    new Date(user.connection_time).toLocaleString('en-US', { 
-                        hour: '2-digit', 
-                        minute: '2-digit', 
-                        second: '2-digit', 
-                        hour12: true 
-                    }) : 'Unknown';
-                li.innerHTML = `<span>${user.username || 'Unknown'}</span><span>${connectionTime}</span>`;
-                list.appendChild(li);
-            });
-            modal.classList.add('active');
-        }
-
-        function updateMuteIndicators(user_id, audioMuted, videoMuted) {
-            const container = document.getElementById(`video-container-${user_id}`);
-            if (container) {
-                let audioIndicator = container.querySelector('.mute-indicator.audio');
-                let videoIndicator = container.querySelector('.mute-indicator.video');
-                
-                if (!audioIndicator) {
-                    audioIndicator = document.createElement('i');
-                    audioIndicator.className = 'fas fa-microphone-slash mute-indicator audio';
-                    container.appendChild(audioIndicator);
-                }
-                if (!videoIndicator) {
-                    videoIndicator = document.createElement('i');
-                    videoIndicator.className = 'fas fa-video-slash mute-indicator video';
-                    container.appendChild(videoIndicator);
-                }
-
-                audioIndicator.classList.toggle('active', audioMuted);
-                videoIndicator.classList.toggle('active', videoMuted);
-            }
-        }
-
-        function monitorAudioLevels(user_id, stream) {
-            try {
-                const analyser = audioContext.createAnalyser();
-                analyser.fftSize = 256;
-                const source = audioContext.createMediaStreamSource(stream);
-                source.connect(analyser);
-                analyserNodes[user_id] = analyser;
-
-                const dataArray = new Uint8Array(analyser.frequencyBinCount);
-                const video = document.getElementById(`video-${user_id}`);
-
-                function checkAudioLevel() {
-                    if (!analyserNodes[user_id] || !video) return;
-                    analyser.getByteFrequencyData(dataArray);
-                    const average = dataArray.reduce((sum, val) => sum + val, 0) / dataArray.length;
-                    const threshold = 8;
-                    if (average > threshold && !users[user_id]?.audioMuted) {
-                        video.classList.add('speaking');
-                    } else {
-                        video.classList.remove('speaking');
-                    }
-                    requestAnimationFrame(checkAudioLevel);
-                }
-                checkAudioLevel();
-            } catch (err) {
-                showError(`Failed to monitor audio for user ${user_id}`);
-            }
-        }
-
-        async function populateDeviceDropdowns() {
-            try {
-                const devices = await navigator.mediaDevices.enumerateDevices();
-                const microphoneSelect = document.getElementById('microphone-select');
-                const cameraSelect = document.getElementById('camera-select');
-                
-                microphoneSelect.innerHTML = '<option value="">Select Microphone</option>';
-                cameraSelect.innerHTML = '<option value="">Select Camera</option>';
-
-                const microphones = devices.filter(device => device.kind === 'audioinput');
-                const cameras = devices.filter(device => device.kind === 'videoinput');
-
-                microphones.forEach(device => {
-                    const option = document.createElement('option');
-                    option.value = device.deviceId;
-                    option.text = device.label || `Microphone ${microphoneSelect.options.length}`;
-                    if (device.deviceId === currentMicrophone) option.selected = true;
-                    microphoneSelect.appendChild(option);
-                });
-
-                cameras.forEach(device => {
-                    const option = document.createElement('option');
-                    option.value = device.deviceId;
-                    option.text = device.label || `Camera ${cameraSelect.options.length}`;
-                    if (device.deviceId === currentCamera) option.selected = true;
-                    cameraSelect.appendChild(option);
-                });
-
-                if (microphones.length === 0) {
-                    microphoneSelect.innerHTML = '<option value="">No Microphones Available</option>';
-                }
-                if (cameras.length === 0) {
-                    cameraSelect.innerHTML = '<option value="">No Cameras Available</option>';
-                }
-            } catch (err) {
-                showError('Failed to list media devices');
-            }
-        }
-
-        async function switchMicrophone(deviceId) {
-            if (!deviceId) return;
-            try {
-                const newStream = await navigator.mediaDevices.getUserMedia({
-                    audio: { deviceId: { exact: deviceId } },
-                    video: currentCamera ? { deviceId: { exact: currentCamera } } : false
-                });
-                const newAudioTrack = newStream.getAudioTracks()[0];
-
-                if (localStream) {
-                    const oldAudioTrack = localStream.getAudioTracks()[0];
-                    if (oldAudioTrack) {
-                        oldAudioTrack.stop();
-                        localStream.removeTrack(oldAudioTrack);
-                    }
-                    localStream.addTrack(newAudioTrack);
-                } else {
-                    localStream = newStream;
-                }
-
-                localVideo.srcObject = localStream;
-                currentMicrophone = deviceId;
-
-                Object.values(peers).forEach(peer => {
-                    const sender = peer.getSenders().find(s => s.track?.kind === 'audio');
-                    if (sender) sender.replaceTrack(newAudioTrack);
-                });
-
-                monitorAudioLevels(userId, localStream);
-                showNotification('Microphone switched successfully');
-            } catch (err) {
-                showError('Failed to switch microphone');
-            }
-        }
-
-        async function switchCamera(deviceId) {
-            if (!deviceId) return;
-            try {
-                const qualityConstraints = getQualityConstraints(currentVideoQuality);
-                const newStream = await navigator.mediaDevices.getUserMedia({
-                    video: { 
-                        deviceId: { exact: deviceId },
-                        width: qualityConstraints.width,
-                        height: qualityConstraints.height,
-                        frameRate: qualityConstraints.frameRate,
-                        aspectRatio: 16 / 9
-                    },
-                    audio: currentMicrophone ? { deviceId: { exact: currentMicrophone } } : false
-                });
-                const newVideoTrack = newStream.getVideoTracks()[0];
-
-                if (localStream) {
-                    const oldVideoTrack = localStream.getVideoTracks()[0];
-                    if (oldVideoTrack) {
-                        oldVideoTrack.stop();
-                        localStream.removeTrack(oldVideoTrack);
-                    }
-                    localStream.addTrack(newVideoTrack);
-                } else {
-                    localStream = newStream;
-                }
-
-                localVideo.srcObject = localStream;
-                currentCamera = deviceId;
-
-                Object.values(peers).forEach(peer => {
-                    const sender = peer.getSenders().find(s => s.track?.kind === 'video');
-                    if (sender) sender.replaceTrack(newVideoTrack);
-                });
-
-                monitorAudioLevels(userId, localStream);
-                showNotification('Camera switched successfully');
-            } catch (err) {
-                showError('Failed to switch camera');
-            }
-        }
-
-        function getQualityConstraints(quality) {
-            switch (quality) {
-                case 'high':
-                    return { width: { ideal: 1920 }, height: { ideal: 1080 }, frameRate: { ideal: 60 } };
-                case 'standard':
-                    return { width: { ideal: 1280 }, height: { ideal: 720 }, frameRate: { ideal: 30 } };
-                case 'medium':
-                    return { width: { ideal: 854 }, height: { ideal: 480 }, frameRate: { ideal: 30 } };
-                case 'low':
-                    return { width: { ideal: 640 }, height: { ideal: 360 }, frameRate: { ideal: 15 } };
-                default:
-                    return { width: { ideal: 1280 }, height: { ideal: 720 }, frameRate: { ideal: 30 } };
-            }
-        }
-
-        async function switchVideoQuality(quality) {
-            if (!currentCamera || quality === currentVideoQuality) return;
-            try {
-                const qualityConstraints = getQualityConstraints(quality);
-                const newStream = await navigator.mediaDevices.getUserMedia({
-                    video: { 
-                        deviceId: { exact: currentCamera },
-                        width: qualityConstraints.width,
-                        height: qualityConstraints.height,
-                        frameRate: qualityConstraints.frameRate,
-                        aspectRatio: 16 / 9
-                    },
-                    audio: currentMicrophone ? { deviceId: { exact: currentMicrophone } } : false
-                });
-                const newVideoTrack = newStream.getVideoTracks()[0];
-
-                if (localStream) {
-                    const oldVideoTrack = localStream.getVideoTracks()[0];
-                    if (oldVideoTrack) {
-                        oldVideoTrack.stop();
-                        localStream.removeTrack(oldVideoTrack);
-                    }
-                    localStream.addTrack(newVideoTrack);
-                } else {
-                    localStream = newStream;
-                }
-
-                localVideo.srcObject = localStream;
-                currentVideoQuality = quality;
-
-                Object.values(peers).forEach(peer => {
-                    const sender = peer.getSenders().find(s => s.track?.kind === 'video');
-                    if (sender) sender.replaceTrack(newVideoTrack);
-                });
-
-                monitorAudioLevels(userId, localStream);
-                showNotification(`Video quality set to ${quality}`);
-            } catch (err) {
-                showError('Failed to switch video quality');
-            }
-        }
-
-        async function startVideo() {
-            if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
-                showError('Your browser does not support WebRTC.');
-                return false;
-            }
-            try {
-                if (localStream) {
-                    localStream.getTracks().forEach(track => track.stop());
-                }
-
-                const qualityConstraints = getQualityConstraints(currentVideoQuality);
-                const constraints = {
-                    video: currentCamera ? { 
-                        deviceId: { exact: currentCamera },
-                        width: qualityConstraints.width,
-                        height: qualityConstraints.height,
-                        frameRate: qualityConstraints.frameRate,
-                        aspectRatio: 16 / 9
-                    } : {
-                        width: qualityConstraints.width,
-                        height: qualityConstraints.height,
-                        frameRate: qualityConstraints.frameRate,
-                        aspectRatio: 16 / 9
-                    },
-                    audio: currentMicrophone ? { 
-                        deviceId: { exact: currentMicrophone },
-                        echoCancellation: true,
-                        noiseSuppression: true,
-                        autoGainControl: true,
-                        sampleRate: 48000
-                    } : {
-                        echoCancellation: true,
-                        noiseSuppression: true,
-                        autoGainControl: true,
-                        sampleRate: 48000
-                    }
-                };
-
-                localStream = await navigator.mediaDevices.getUserMedia(constraints);
-                localVideo.srcObject = localStream;
-                localVideo.muted = true;
-                localVideo.autoplay = true;
-                localVideo.playsInline = true;
-                localVideo.id = `video-${userId}`;
-                
-                let container = document.getElementById(`video-container-${userId}`);
-                if (!container) {
-                    container = document.createElement('div');
-                    container.id = `video-container-${userId}`;
-                    container.className = 'video-container';
-                    const nameLabel = document.createElement('div');
-                    nameLabel.className = 'user-name';
-                    nameLabel.textContent = username;
-                    container.appendChild(nameLabel);
-                    container.appendChild(localVideo);
-                    document.getElementById('videos').appendChild(container);
-                } else {
-                    container.innerHTML = '';
-                    container.className = 'video-container';
-                    const nameLabel = document.createElement('div');
-                    nameLabel.className = 'user-name';
-                    nameLabel.textContent = username;
-                    container.appendChild(nameLabel);
-                    container.appendChild(localVideo);
-                }
-
-                const videoTrack = localStream.getVideoTracks()[0];
-                if (videoTrack && !currentCamera) {
-                    currentCamera = videoTrack.getSettings().deviceId;
-                }
-                const audioTrack = localStream.getAudioTracks()[0];
-                if (audioTrack && !currentMicrophone) {
-                    currentMicrophone = audioTrack.getSettings().deviceId;
-                }
-
-                await populateDeviceDropdowns();
-
-                monitorAudioLevels(userId, localStream);
-                updateMuteIndicators(userId, isAudioMuted, isVideoMuted);
-                updateVideoSizes();
-
-                return true;
-            } catch (err) {
-                showError('Media access failed. Joining without media.');
-                const container = document.createElement('div');
-                container.id = `video-container-${userId}`;
-                container.className = 'video-container';
-                const nameLabel = document.createElement('div');
-                nameLabel.className = 'user-name';
-                nameLabel.textContent = username;
-                const placeholder = document.createElement('div');
-                placeholder.style.width = '100%';
-                placeholder.style.height = '100%';
-                placeholder.style.background = '#000';
-                placeholder.style.borderRadius = '12px';
-                placeholder.style.display = 'flex';
-                placeholder.style.alignItems = 'center';
-                placeholder.style.justifyContent = 'center';
-                placeholder.style.color = '#fff';
-                placeholder.textContent = 'No Video Available';
-                container.appendChild(nameLabel);
-                container.appendChild(placeholder);
-                document.getElementById('videos').appendChild(container);
-                updateVideoSizes();
-                return false;
-            }
-        }
-
-        async function startScreenShare() {
-            try {
-                screenStream = await navigator.mediaDevices.getDisplayMedia({ video: { aspectRatio: 16 / 9 } });
-                isScreenSharing = true;
-                document.getElementById('share-screen').innerHTML = '<i class="fas fa-desktop"></i> Stop Sharing';
-                document.getElementById('share-screen').classList.add('active');
-                const videoTrack = screenStream.getVideoTracks()[0];
-                localVideo.srcObject = screenStream;
-                Object.values(peers).forEach(peer => {
-                    const sender = peer.getSenders().find(s => s.track?.kind === 'video');
-                    if (sender) sender.replaceTrack(videoTrack);
-                });
-                videoTrack.onended = stopScreenShare;
-            } catch (err) {
-                showError('Failed to share screen.');
-            }
-        }
-
-        function stopScreenShare() {
-            if (screenStream) {
-                screenStream.getTracks().forEach(track => track.stop());
-                screenStream = null;
-            }
-            isScreenSharing = false;
-            document.getElementById('share-screen').innerHTML = '<i class="fas fa-desktop"></i> Share Screen';
-            document.getElementById('share-screen').classList.remove('active');
-            localVideo.srcObject = localStream;
-            if (localStream) {
-                const videoTrack = localStream.getVideoTracks()[0];
-                Object.values(peers).forEach(peer => {
-                    const sender = peer.getSenders().find(s => s.track?.kind === 'video');
-                    if (sender && videoTrack) {
-                        sender.replaceTrack(videoTrack);
-                    }
-                });
-            }
-        }
-
-        async function toggleRecording() {
-            if (!isRecording) {
-                try {
-                    const screenStream = await navigator.mediaDevices.getDisplayMedia({
-                        video: { displaySurface: 'browser' },
-                        audio: false
-                    });
-
-                    const mixedStream = new MediaStream();
-                    screenStream.getVideoTracks().forEach(track => mixedStream.addTrack(track));
-                    if (localStream && localStream.getAudioTracks().length) {
-                        localStream.getAudioTracks().forEach(track => mixedStream.addTrack(track));
-                    }
-
-                    mediaRecorder = new MediaRecorder(mixedStream, { mimeType: 'video/webm' });
-                    recordedChunks = [];
-                    mediaRecorder.ondataavailable = (e) => {
-                        if (e.data.size > 0) recordedChunks.push(e.data);
-                    };
-                    mediaRecorder.onstop = () => {
-                        const blob = new Blob(recordedChunks, { type: 'video/webm' });
-                        const url = URL.createObjectURL(blob);
-                        const a = document.createElement('a');
-                        a.href = url;
-                        a.download = `recording-${new Date().toISOString()}.webm`;
-                        a.click();
-                        URL.revokeObjectURL(url);
-                        screenStream.getTracks().forEach(track => track.stop());
-                    };
-
-                    mediaRecorder.start();
-                    isRecording = true;
-                    document.getElementById('record').innerHTML = '<i class="fas fa-record-vinyl"></i> Stop Recording';
-                    document.getElementById('record').classList.add('active');
-                    document.getElementById('recording-logo').classList.add('active');
-
-                    screenStream.getVideoTracks()[0].onended = () => {
-                        if (isRecording) {
-                            toggleRecording();
-                        }
-                    };
-                } catch (err) {
-                    showError('Failed to start recording.');
-                }
-            } else {
-                mediaRecorder.stop();
-                isRecording = false;
-                document.getElementById('record').innerHTML = '<i class="fas fa-record-vinyl"></i> Start Recording';
-                document.getElementById('record').classList.remove('active');
-                document.getElementById('recording-logo').classList.remove('active');
-            }
-        }
-
-        function toggleChat() {
-            isChatVisible = !isChatVisible;
-            document.getElementById('chat-section').classList.toggle('active', isChatVisible);
-            document.getElementById('videos').classList.toggle('chat-active', isChatVisible);
-            document.getElementById('toggle-chat').innerHTML = `<i class="fas fa-comments"></i> ${isChatVisible ? 'Hide Chat' : 'Chat'}<span id="unread-badge">${unreadMessages}</span>`;
-            document.getElementById('toggle-chat').classList.toggle('active', isChatVisible);
-            if (isChatVisible) {
-                unreadMessages = 0;
-                document.getElementById('unread-badge').textContent = unreadMessages;
-                document.getElementById('unread-badge').style.display = 'none';
-            }
-            updateVideoSizes();
-        }
-
-        function leaveMeeting() {
-            if (localStream) {
-                localStream.getTracks().forEach(track => track.stop());
-                localStream = null;
-            }
-            if (screenStream) {
-                screenStream.getTracks().forEach(track => track.stop());
-                screenStream = null;
-            }
-            Object.values(peers).forEach(peer => peer.close());
-            Object.keys(peers).forEach(key => delete peers[key]);
-            Object.keys(pendingIceCandidates).forEach(key => delete pendingIceCandidates[key]);
-            Object.keys(analyserNodes).forEach(key => delete analyserNodes[key]);
-            document.getElementById('videos').innerHTML = '';
-            document.getElementById('main-ui').classList.remove('active');
-            document.getElementById('room-modal').classList.remove('hidden');
-            document.getElementById('room-id').value = '';
-            document.getElementById('username-input-room').value = '';
-            document.getElementById('room-id').disabled = false;
-            document.getElementById('join-room').disabled = false;
-            document.getElementById('join-room').innerHTML = '<i class="fas fa-sign-in-alt"></i> Join Room';
-            if (roomId) {
-                socket.emit('leave_room', { room: roomId, user_id: userId });
-                roomId = null;
-            }
-            stopVCTimer();
-            isAudioMuted = false;
-            isVideoMuted = false;
-            isScreenSharing = false;
-            isRecording = false;
-            isChatVisible = false;
-            isFileTransferVisible = false;
-            unreadMessages = 0;
-            currentMicrophone = '';
-            currentCamera = '';
-            currentVideoQuality = 'standard';
-            document.getElementById('mute-audio').innerHTML = '<i class="fas fa-microphone"></i> Mute Audio';
-            document.getElementById('mute-audio').classList.remove('active');
-            document.getElementById('mute-video').innerHTML = '<i class="fas fa-video"></i> Mute Video';
-            document.getElementById('mute-video').classList.remove('active');
-            document.getElementById('share-screen').innerHTML = '<i class="fas fa-desktop"></i> Share Screen';
-            document.getElementById('share-screen').classList.remove('active');
-            document.getElementById('record').innerHTML = '<i class="fas fa-record-vinyl"></i> Start Recording';
-            document.getElementById('record').classList.remove('active');
-            document.getElementById('toggle-chat').innerHTML = '<i class="fas fa-comments"></i> Chat<span id="unread-badge">0</span>';
-            document.getElementById('toggle-chat').classList.remove('active');
-            document.getElementById('toggle-file-transfer').innerHTML = '<i class="fas fa-file-upload"></i> File Transfer';
-            document.getElementById('toggle-file-transfer').classList.remove('active');
-            document.getElementById('chat-section').classList.remove('active');
-            document.getElementById('videos').classList.remove('chat-active');
-            document.getElementById('file-transfer-section').classList.add('hidden');
-            document.getElementById('room-id-display').textContent = '';
-            document.getElementById('recording-logo').classList.remove('active');
-            showNotification('Left the meeting');
-        }
-
-        document.getElementById('toggle-chat').addEventListener('click', toggleChat);
-
-        document.getElementById('chat-close').addEventListener('click', toggleChat);
-
-        document.getElementById('toggle-file-transfer').addEventListener('click', () => {
-            isFileTransferVisible = !isFileTransferVisible;
-            document.getElementById('file-transfer-section').classList.toggle('hidden', !isFileTransferVisible);
-            document.getElementById('toggle-file-transfer').innerHTML = `<i class="fas fa-file-upload"></i> ${isFileTransferVisible ? 'Hide File Transfer' : 'File Transfer'}`;
-            document.getElementById('toggle-file-transfer').classList.toggle('active', isFileTransferVisible);
-        });
-
-        document.getElementById('leave-meeting-btn').addEventListener('click', leaveMeeting);
-
-        document.getElementById('participant-count').addEventListener('click', showParticipantsList);
-
-        document.getElementById('participants-close').addEventListener('click', () => {
-            document.getElementById('participants-modal').classList.remove('active');
-        });
-
-        document.getElementById('settings-btn').addEventListener('click', async () => {
-            await populateDeviceDropdowns();
-            document.getElementById('settings-modal').classList.add('active');
-        });
-
-        document.getElementById('settings-close').addEventListener('click', () => {
-            document.getElementById('settings-modal').classList.remove('active');
-        });
-
-        document.getElementById('microphone-select').addEventListener('change', (e) => {
-            const deviceId = e.target.value;
-            if (deviceId) switchMicrophone(deviceId);
-        });
-
-        document.getElementById('camera-select').addEventListener('change', (e) => {
-            const deviceId = e.target.value;
-            if (deviceId) switchCamera(deviceId);
-        });
-
-        document.getElementById('quality-select').addEventListener('change', (e) => {
-            const quality = e.target.value;
-            if (quality) switchVideoQuality(quality);
-        });
-
-        navigator.mediaDevices.ondevicechange = async () => {
-            await populateDeviceDropdowns();
-        };
-
-        document.getElementById('send-file').addEventListener('click', () => {
-            const file = document.getElementById('file-input').files[0];
-            if (!file) {
-                showError('Please select a file.');
-                return;
-            }
-            if (file.size > 5 * 1024 * 1024) {
-                showError('File size exceeds 5MB limit.');
-                return;
-            }
-            if (!roomId) {
-                showError('Not connected to a room.');
-                return;
-            }
-            const reader = new FileReader();
-            reader.onload = () => {
-                socket.emit('file_upload', {
-                    user_id: userId,
-                    file_name: file.name,
-                    file_data: reader.result.split(',')[1],
-                    room: roomId
-                });
-                showNotification(`You sent file: ${file.name}`);
-                document.getElementById('file-input').value = '';
-                isFileTransferVisible = false;
-                document.getElementById('file-transfer-section').classList.add('hidden');
-                document.getElementById('toggle-file-transfer').innerHTML = '<i class="fas fa-file-upload"></i> File Transfer';
-                document.getElementById('toggle-file-transfer').classList.remove('active');
-            };
-            reader.onerror = () => showError('Error reading file.');
-            reader.readAsDataURL(file);
-        });
-
-        document.getElementById('cancel-file').addEventListener('click', () => {
-            document.getElementById('file-input').value = '';
-            isFileTransferVisible = false;
-            document.getElementById('file-transfer-section').classList.add('hidden');
-            document.getElementById('toggle-file-transfer').innerHTML = '<i class="fas fa-file-upload"></i> File Transfer';
-            document.getElementById('toggle-file-transfer').classList.remove('active');
-        });
-
-        function createPeer(remoteUserId) {
-            const peer = new RTCPeerConnection({
-                iceServers: [
-                    { urls: 'stun:stun.l.google.com:19302' },
-                    { urls: 'stun:stun1.l.google.com:19302' },
-                    {
-                        urls: [
-                            'turn:openrelay.metered.ca:80',
-                            'turn:openrelay.metered.ca:443',
-                            'turn:openrelay.metered.ca:443?transport=tcp'
-                        ],
-                        username: 'openrelayproject',
-                        credential: 'openrelayproject'
-                    }
-                ]
-            });
-
-            pendingIceCandidates[remoteUserId] = [];
-
-            peer.ontrack = (event) => {
-                const [remoteStream] = event.streams;
-                if (!remoteStream) return;
-
-                let container = document.getElementById(`video-container-${remoteUserId}`);
-                if (!container) {
-                    container = document.createElement('div');
-                    container.id = `video-container-${remoteUserId}`;
-                    container.className = 'video-container';
-                    const video = document.createElement('video');
-                    video.id = `video-${remoteUserId}`;
-                    video.autoplay = true;
-                    video.playsInline = true;
-                    const nameLabel = document.createElement('div');
-                    nameLabel.className = 'user-name';
-                    nameLabel.textContent = users[remoteUserId]?.username || `User ${remoteUserId.substring(0, 6)}`;
-                    container.appendChild(nameLabel);
-                    container.appendChild(video);
-                    document.getElementById('videos').appendChild(container);
-                }
-
-                const video = container.querySelector('video');
-                if (video.srcObject !== remoteStream) {
-                    video.srcObject = remoteStream;
-                    monitorAudioLevels(remoteUserId, remoteStream);
-                }
-
-                updateVideoSizes();
-            };
-
-            if (localStream) {
-                localStream.getTracks().forEach(track => {
-                    if (track.readyState === 'live') {
-                        peer.addTrack(track, localStream);
-                    }
-                });
-            }
-
-            peer.onicecandidate = (event) => {
-                if (event.candidate) {
-                    const candidate = event.candidate.toJSON();
-                    if (!candidate.candidate || !candidate.sdpMid || candidate.sdpMLineIndex == null) return;
-                    socket.emit('ice-candidate', {
-                        from: userId,
-                        to: remoteUserId,
-                        candidate: candidate,
-                        room: roomId
-                    });
-                }
-            };
-
-            peer.oniceconnectionstatechange = () => {
-                if (peer.iceConnectionState === 'failed') {
-                    peer.restartIce();
-                }
-            };
-
-            peer.onconnectionstatechange = () => {
-                if (peer.connectionState === 'failed' || peer.connectionState === 'disconnected') {
-                    peers[remoteUserId]?.close();
-                    delete peers[remoteUserId];
-                    delete pendingIceCandidates[remoteUserId];
-                    delete analyserNodes[remoteUserId];
-                    const container = document.getElementById(`video-container-${remoteUserId}`);
-                    if (container) container.remove();
-                    updateVideoSizes();
-                } else if (peer.connectionState === 'connected') {
-                    showNotification(`Connected to ${users[remoteUserId]?.username || remoteUserId}`);
-                }
-            };
-
-            peer.onsignalingstatechange = () => {
-                if (peer.signalingState === 'stable' && pendingIceCandidates[remoteUserId]?.length > 0) {
-                    const candidates = pendingIceCandidates[remoteUserId].slice();
-                    pendingIceCandidates[remoteUserId] = [];
-                    candidates.forEach(async candidate => {
-                        try {
-                            await peer.addIceCandidate(new RTCIceCandidate(candidate));
-                        } catch (err) {}
-                    });
-                }
-            };
-
-            return peer;
-        }
-
-        document.getElementById('join-room').addEventListener('click', async () => {
-            const roomInput = document.getElementById('room-id');
-            const usernameInput = document.getElementById('username-input-room');
-            const joinButton = document.getElementById('join-room');
-            roomId = roomInput.value.trim();
-            username = usernameInput.value.trim() || `User ${userId.substring(0, 6)}`;
-            if (!roomId) {
-                showError('Please enter a valid room ID.');
-                return;
-            }
-            if (!socket.connected) {
-                showError('Not connected to the server. Please try again.');
-                return;
-            }
-            try {
-                roomInput.disabled = true;
-                usernameInput.disabled = true;
-                joinButton.disabled = true;
-                joinButton.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Joining...';
-
-                await startVideo();
-                await new Promise((resolve, reject) => {
-                    socket.emit('join_room', { room: roomId, user_id: userId, username: username }, (response) => {
-                        if (response && response.error) {
-                            reject(new Error(response.error));
-                        } else {
-                            resolve();
-                        }
-                    });
-                });
-
-                document.getElementById('room-modal').classList.add('hidden');
-                document.getElementById('main-ui').classList.add('active');
-                document.getElementById('room-id-display').textContent = `${roomId}`;
-                participantCount = 1;
-                document.getElementById('participant-count').innerHTML = `<i class="fas fa-users"></i> Participants: ${participantCount}`;
-                document.getElementById('participant-count-modal').textContent = participantCount;
-                showNotification(`Joined room ${roomId} as ${username}`);
-                startVCTimer();
-            } catch (err) {
-                showError(`Failed to join room: ${err.message}`);
-                roomInput.disabled = false;
-                usernameInput.disabled = false;
-                joinButton.disabled = false;
-                joinButton.innerHTML = '<i class="fas fa-sign-in-alt"></i> Join Room';
-            }
-        });
-
-        document.getElementById('room-id').addEventListener('keypress', (e) => {
-            if (e.key === 'Enter') document.getElementById('join-room').click();
-        });
-
-        document.getElementById('username-input-room').addEventListener('keypress', (e) => {
-            if (e.key === 'Enter') document.getElementById('join-room').click();
-        });
-
-        document.getElementById('mute-audio').addEventListener('click', () => {
-            isAudioMuted = !isAudioMuted;
-            if (localStream) {
-                localStream.getAudioTracks().forEach(track => {
-                    track.enabled = !isAudioMuted;
-                });
-            }
-            document.getElementById('mute-audio').innerHTML = `<i class="fas fa-microphone${isAudioMuted ? '-slash' : ''}"></i> ${isAudioMuted ? 'Unmute' : 'Mute'} Audio`;
-            document.getElementById('mute-audio').classList.toggle('active', isAudioMuted);
-            updateMuteIndicators(userId, isAudioMuted, isVideoMuted);
-            socket.emit('update_mute_status', { user_id: userId, room: roomId, audioMuted: isAudioMuted, videoMuted: isVideoMuted });
-        });
-
-        document.getElementById('mute-video').addEventListener('click', () => {
-            isVideoMuted = !isVideoMuted;
-            if (localStream) {
-                localStream.getVideoTracks().forEach(track => {
-                    track.enabled = !isVideoMuted;
-                });
-            }
-            document.getElementById('mute-video').innerHTML = `<i class="fas fa-video${isVideoMuted ? '-slash' : ''}"></i> ${isVideoMuted ? 'Unmute' : 'Mute'} Video`;
-            document.getElementById('mute-video').classList.toggle('active', isVideoMuted);
-            updateMuteIndicators(userId, isAudioMuted, isVideoMuted);
-            socket.emit('update_mute_status', { user_id: userId, room: roomId, audioMuted: isAudioMuted, videoMuted: isVideoMuted });
-        });
-
-        document.getElementById('share-screen').addEventListener('click', () => {
-            if (isScreenSharing) {
-                stopScreenShare();
-            } else {
-                startScreenShare();
-            }
-        });
-
-        document.getElementById('record').addEventListener('click', toggleRecording);
-
-        document.getElementById('send-chat').addEventListener('click', () => {
-            const input = document.getElementById('chat-input');
-            const message = input.value.trim();
-            if (message && roomId) {
-                const timestamp = new Date().toLocaleTimeString();
-                socket.emit('chat_message', { user_id: userId, username: username, message: message, room: roomId, timestamp: timestamp });
-                input.value = '';
-            }
-        });
-
-        document.getElementById('chat-input').addEventListener('keypress', (e) => {
-            if (e.key === 'Enter') document.getElementById('send-chat').click();
-        });
-
-        function showChatAlert(message) {
-            const chatAlert = document.getElementById('chat-alert');
-            chatAlert.textContent = message;
-            chatAlert.style.display = 'block';
-            setTimeout(() => {
-                chatAlert.style.display = 'none';
-            }, 5000);
-        }
-
-        function addMessageToChat(user_id, username, message, fileId, fileName, timestamp, isNew = false) {
-            const chatMessages = document.getElementById('chat-messages');
-            const messageDiv = document.createElement('div');
-            messageDiv.className = 'message ' + (user_id === userId ? 'sent' : 'received');
-            const textSpan = document.createElement('span');
-            textSpan.className = 'text';
-            if (fileId) {
-                textSpan.innerHTML = `${username}: <a href="/download/${fileId}" class="text-blue-300 hover:underline" download="${fileName}">${fileName}</a>`;
-            } else {
-                textSpan.textContent = `${username}: ${message}`;
-            }
-            const timeSpan = document.createElement('span');
-            timeSpan.className = 'timestamp';
-            timeSpan.textContent = timestamp;
-            messageDiv.appendChild(textSpan);
-            messageDiv.appendChild(timeSpan);
-            chatMessages.appendChild(messageDiv);
-            if (isNew) {
-                messageDiv.style.animation = 'pop 0.3s ease-out';
-                setTimeout(() => messageDiv.style.animation = '', 300);
-            }
-            chatMessages.scrollTop = chatMessages.scrollHeight;
-            if (isNew && !isChatVisible && user_id !== userId) {
-                unreadMessages++;
-                document.getElementById('unread-badge').textContent = unreadMessages;
-                document.getElementById('unread-badge').style.display = 'flex';
-                showChatAlert(`New message from ${username}: ${message}`);
-            }
-        }
-
-        socket.on('connect', () => {
-            showNotification('Connected to server');
-        });
-
-        socket.on('connect_error', () => {
-            showError('Failed to connect to server. Retrying...');
-        });
-
-        socket.on('disconnect', () => {
-            showError('Disconnected from server. Reconnecting...');
-            if (!roomId) {
-                document.getElementById('room-modal').classList.remove('hidden');
-                document.getElementById('main-ui').classList.remove('active');
-                document.getElementById('room-id').disabled = false;
-                document.getElementById('join-room').disabled = false;
-                document.getElementById('join-room').innerHTML = '<i class="fas fa-sign-in-alt"></i> Join Room';
-                stopVCTimer();
-            }
-        });
-
-        socket.on('user_joined', async (data) => {
-            if (data.room === roomId) {
-                participantCount = data.participant_count;
-                document.getElementById('participant-count').innerHTML = `<i class="fas fa-users"></i> Participants: ${participantCount}`;
-                document.getElementById('participant-count-modal').textContent = participantCount;
-                users[data.user_id] = { 
-                    username: data.username, 
-                    connection_time: data.connection_time || new Date().toISOString(),
-                    audioMuted: false,
-                    videoMuted: false
-                };
-                if (data.user_id !== userId && localStream) {
-                    try {
-                        showNotification(`Connecting to ${data.username}...`);
-                        const peer = createPeer(data.user_id);
-                        peers[data.user_id] = peer;
-                        const offer = await peer.createOffer({
-                            offerToReceiveAudio: true,
-                            offerToReceiveVideo: true
-                        });
-                        await peer.setLocalDescription(offer);
-                        socket.emit('offer', { from: userId, to: data.user_id, offer: peer.localDescription, room: roomId });
-                    } catch (err) {
-                        showError(`Failed to connect to ${data.username}`);
-                    }
-                }
-                updateVideoSizes();
-            }
-        });
-
-        socket.on('user_left', (data) => {
-            if (data.room === roomId) {
-                participantCount = data.participant_count;
-                document.getElementById('participant-count').innerHTML = `<i class="fas fa-users"></i> Participants: ${participantCount}`;
-                document.getElementById('participant-count-modal').textContent = participantCount;
-                if (peers[data.user_id]) {
-                    peers[data.user_id].close();
-                    delete peers[data.user_id];
-                    delete pendingIceCandidates[data.user_id];
-                    delete analyserNodes[data.user_id];
-                    delete users[data.user_id];
-                    const container = document.getElementById(`video-container-${data.user_id}`);
-                    if (container) container.remove();
-                    updateVideoSizes();
-                }
-            }
-        });
-
-        socket.on('offer', async (data) => {
-            if (data.to === userId && data.room === roomId) {
-                let peer = peers[data.from];
-                if (!peer) {
-                    peer = createPeer(data.from);
-                    peers[data.from] = peer;
-                }
-                try {
-                    if (peer.signalingState !== 'stable') {
-                        await peer.setLocalDescription({ type: 'rollback' });
-                    }
-                    await peer.setRemoteDescription(new RTCSessionDescription(data.offer));
-                    const answer = await peer.createAnswer({
-                        offerToReceiveAudio: true,
-                        offerToReceiveVideo: true
-                    });
-                    await peer.setLocalDescription(answer);
-                    socket.emit('answer', { from: userId, to: data.from, answer: peer.localDescription, room: roomId });
-                    if (pendingIceCandidates[data.from]?.length > 0) {
-                        for (const candidate of pendingIceCandidates[data.from]) {
-                            await peer.addIceCandidate(new RTCIceCandidate(candidate));
-                        }
-                        pendingIceCandidates[data.from] = [];
-                    }
-                } catch (err) {
-                    showError('WebRTC offer processing failed.');
-                }
-            }
-        });
-
-        socket.on('answer', async (data) => {
-            if (data.to === userId && data.room === roomId && peers[data.from]) {
-                const peer = peers[data.from];
-                try {
-                    await peer.setRemoteDescription(new RTCSessionDescription(data.answer));
-                    if (pendingIceCandidates[data.from]?.length > 0) {
-                        for (const candidate of pendingIceCandidates[data.from]) {
-                            await peer.addIceCandidate(new RTCIceCandidate(candidate));
-                        }
-                        pendingIceCandidates[data.from] = [];
-                    }
-                } catch (err) {
-                    showError('WebRTC answer processing failed.');
-                }
-            }
-        });
-
-        socket.on('ice-candidate', async (data) => {
-            if (data.to === userId && data.room === roomId && peers[data.from]) {
-                const peer = peers[data.from];
-                if (!data.candidate?.candidate || !data.candidate?.sdpMid || data.candidate?.sdpMLineIndex == null) {
-                    showError('Invalid ICE candidate received');
-                    return;
-                }
-                const candidate = new RTCIceCandidate(data.candidate);
-                try {
-                    if (peer.remoteDescription && peer.remoteDescription.type && peer.signalingState === 'stable') {
-                        await peer.addIceCandidate(candidate);
-                    } else {
-                        pendingIceCandidates[data.from].push(candidate);
-                    }
-                } catch (err) {}
-            }
-        });
-
-        socket.on('chat_message', (data) => {
-            if (data.room === roomId) {
-                addMessageToChat(data.user_id, data.username, data.message, null, null, data.timestamp, true);
-            }
-        });
-
-        socket.on('file_upload', (data) => {
-            if (data.room === roomId) {
-                addMessageToChat(data.user_id, data.username, null, data.file_id, data.file_name, data.timestamp, true);
-            }
-        });
-
-        socket.on('update_mute_status', (data) => {
-            if (data.room === roomId && users[data.user_id]) {
-                users[data.user_id].audioMuted = data.audioMuted;
-                users[data.user_id].videoMuted = data.videoMuted;
-                updateMuteIndicators(data.user_id, data.audioMuted, data.videoMuted);
-            }
-        });
-    </script>
-</body>
-</html>
-'''
-
-@app.route('/')
-def index():
-    logger.info("Serving Edge 2 Meet index page")
-    server_ip = get_local_ip()
-    logger.info(f"Server IP: {server_ip}")
-    return render_template_string(INDEX_HTML, server_ip=server_ip)
-
-@app.route('/download/<file_id>')
-def download_file(file_id):
-    logger.info(f"Download request for file_id: {file_id}")
-    cleanup_files()
-    if file_id in files:
-        try:
-            file_data = base64.b64decode(files[file_id]['data'])
-            response = make_response(file_data)
-            response.headers['Content-Disposition'] = f'attachment; filename="{files[file_id]["name"]}"'
-            response.headers['Content-Type'] = 'application/octet-stream'
-            return response
-        except Exception as e:
-            logger.error(f"Error downloading file {file_id}: {str(e)}")
-            return 'Error downloading file', 500
-    return 'File not found', 404
-
-@socketio.on('join_room')
-def handle_join_room(data):
-    try:
-        logger.info(f"Received join_room data: {data}")
-        if not data.get('room') or not data.get('user_id'):
-            logger.error(f"Invalid join_room data: {data}")
-            emit('error', {'message': 'Missing room or user_id'})
-            return
-        room = data['room'].strip()
-        user_id = data['user_id'].strip()
-        username = data.get('username', f"User {user_id[:6]}").strip()
-        if not room or not user_id:
-            logger.error(f"Empty room or user_id: {data}")
-            emit('error', {'message': 'Room ID or user ID cannot be empty'})
-            return
-        users[user_id] = {
-            'sid': request.sid,
-            'room': room,
-            'username': username,
-            'connection_time': datetime.now().isoformat()
-        }
-        join_room(room)
-        if room not in chat_history:
-            chat_history[room] = []
-        participant_count = sum(1 for u in users.values() if u['room'] == room)
-        emit('user_joined', {
-            'user_id': user_id,
-            'participant_count': participant_count,
-            'room': room,
-            'username': username,
-            'connection_time': users[user_id]['connection_time']
-        }, room=room)
-        emit('chat_history', chat_history[room], to=request.sid)
-        logger.info(f"User {user_id} joined room {room} with username {username}. Total participants: {participant_count}")
-    except Exception as e:
-        logger.error(f"Error in join_room: {str(e)}")
-        emit('error', {'message': f'Failed to join room: {str(e)}'})
-
-@socketio.on('leave_room')
-def handle_leave_room(data):
-    try:
-        user_id = data['user_id']
-        room = data['room']
-        if user_id in users and users[user_id]['room'] == room:
-            del users[user_id]
-            participant_count = sum(1 for u in users.values() if u['room'] == room)
-            emit('user_left', {'user_id': user_id, 'participant_count': participant_count, 'room': room}, room=room)
-            logger.info(f"User {user_id} left room {room}. Total participants: {participant_count}")
-    except Exception as e:
-        logger.error(f"Error in leave_room: {str(e)}")
-        emit('error', {'message': 'Failed to leave room'})
-
-@socketio.on('disconnect')
-def handle_disconnect():
-    try:
-        user_id = None
-        room = None
-        for uid, info in list(users.items()):
-            if info['sid'] == request.sid:
-                user_id = uid
-                room = info['room']
-                break
-        if user_id and room:
-            del users[user_id]
-            participant_count = sum(1 for u in users.values() if u['room'] == room)
-            emit('user_left', {'user_id': user_id, 'participant_count': participant_count, 'room': room}, room=room)
-            logger.info(f"User {user_id} disconnected from room {room}. Total participants: {participant_count}")
-    except Exception as e:
-        logger.error(f"Error in disconnect: {str(e)}")
-
-@socketio.on('offer')
-def handle_offer(data):
-    try:
-        emit('offer', data, room=data['room'], include_self=False)
-        logger.debug(f"Offer forwarded for room {data['room']} fromsth {data['from']} to {data['to']}")
-    except Exception as e:
-        logger.error(f"Error in handle_offer: {str(e)}")
-        emit('error', {'message': 'Failed to process offer'})
-
-@socketio.on('answer')
-def handle_answer(data):
-    try:
-        emit('answer', data, room=data['room'], include_self=False)
-        logger.debug(f"Answer forwarded for room {data['room']} from {data['from']} to {data['to']}")
-    except Exception as e:
-        logger.error(f"Error in handle_answer: {str(e)}")
-        emit('error', {'message': 'Failed to process answer'})
-
-@socketio.on('ice-candidate')
-def handle_ice_candidate(data):
-    try:
-        logger.info(f"Received ICE candidate: {data}")
-        required_fields = ['candidate', 'to', 'room', 'from']
-        missing_fields = [field for field in required_fields if not data.get(field)]
-        if missing_fields:
-            logger.error(f"Missing ICE candidate fields: {missing_fields}, data: {data}")
-            emit('error', {'message': f'Invalid ICE candidate data: missing {", ".join(missing_fields)}'})
-            return
-        candidate = data['candidate']
-        candidate_fields = ['candidate', 'sdpMid']
-        missing_candidate_fields = [field for field in candidate_fields if not candidate.get(field)]
-        if missing_candidate_fields or candidate.get('sdpMLineIndex') is None:
-            logger.error(f"Malformed ICE candidate, missing: {missing_candidate_fields}, sdpMLineIndex: {candidate.get('sdpMLineIndex')}, candidate: {candidate}")
-            emit('error', {'message': f'Malformed ICE candidate: missing {", ".join(missing_candidate_fields) or "sdpMLineIndex"}'})
-            return
-        emit('ice-candidate', data, room=data['room'], include_self=False)
-        logger.debug(f"ICE candidate forwarded for room {data['room']} from {data['from']} to {data['to']}")
-    except Exception as e:
-        logger.error(f"Error in handle_ice_candidate: {str(e)}")
-        emit('error', {'message': f'Failed to process ICE candidate: {str(e)}'})
-
-@socketio.on('chat_message')
-def handle_chat_message(data):
-    try:
-        room = data['room']
-        chat_history[room].append({
-            'user_id': data['user_id'],
-            'username': data['username'],
-            'message': data['message'],
-            'file_id': data.get('file_id'),
-            'file_name': data.get('file_name'),
-            'timestamp': data.get('timestamp', datetime.now().strftime("%H:%M:%S"))
-        })
-        if len(chat_history[room]) > 100:
-            chat_history[room].pop(0)
-        emit('chat_message', data, room=room)
-        logger.debug(f"Chat message in room {room}: {data['username']}: {data['message']} at {data['timestamp']}")
-    except Exception as e:
-        logger.error(f"Error in handle_chat_message: {str(e)}")
-        emit('error', {'message': 'Failed to send chat message'})
-
-@socketio.on('file_upload')
-def handle_file_upload(data):
-    try:
-        room = data['room']
-        if len(data['file_data']) > 10 * 1024 * 1024:
-            emit('error', {'message': 'File size exceeds 10MB'})
-            return
-        file_id = str(uuid.uuid4())
-        files[file_id] = {
-            'name': data['file_name'],
-            'data': data['file_data'],
-            'timestamp': time.time()
-        }
-        chat_history[room].append({
-            'user_id': data['user_id'],
-            'username': users[data['user_id']]['username'],
-            'file_id': file_id,
-            'file_name': data['file_name'],
-            'timestamp': datetime.now().strftime("%H:%M:%S")
-        })
-        if len(chat_history[room]) > 100:
-            chat_history[room].pop(0)
-        emit('chat_message', {
-            'user_id': data['user_id'],
-            'username': users[data['user_id']]['username'],
-            'file_id': file_id,
-            'file_name': data['file_name'],
-            'room': room,
-            'timestamp': datetime.now().strftime("%H:%M:%S")
-        }, room=room)
-        logger.info(f"File uploaded to room {room}: {data['file_name']}")
-    except Exception as e:
-        logger.error(f"Error in handle_file_upload: {str(e)}")
-        emit('error', {'message': 'Failed to upload file'})
-
-@socketio.on('update_mute_status')
-def handle_update_mute_status(data):
-    try:
-        room = data['room']
-        user_id = data['user_id']
-        audio_muted = data['audioMuted']
-        video_muted = data['videoMuted']
-        emit('update_mute_status', {
-            'user_id': user_id,
-            'room': room,
-            'audioMuted': audio_muted,
-            'videoMuted': video_muted
-        }, room=room, include_self=False)
-        logger.debug(f"Mute status updated for user {user_id} in room {room}: audio={audio_muted}, video={video_muted}")
-    except Exception as e:
-        logger.error(f"Error in handle_update_mute_status: {str(e)}")
-        emit('error', {'message': 'Failed to update mute status'})
-
-if __name__ == '__main__':
-    logger.info("Starting Edge 2 Meet Flask-SocketIO server")
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
-
+
+import os
+
+# Worker model: 'eventlet' or 'gevent' run every connection on a greenlet, 'threading' uses the
+# Werkzeug development server. Unset picks the best installed backend the way Flask-SocketIO
+# would, but here, because greenlet backends have to patch the standard library before anything
+# else imports it; an unpatched hub stalls on every blocking socket, redis or sleep call.
+ASYNC_MODE = os.environ.get('EDGE2_ASYNC_MODE') or None
+if ASYNC_MODE is None:
+    import importlib.util
+    ASYNC_MODE = next((mode for mode in ('eventlet', 'gevent') if importlib.util.find_spec(mode)), 'threading')
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, render_template_string, make_response, request, jsonify, send_file, send_from_directory
+from flask_socketio import SocketIO, emit, join_room
+from collections import OrderedDict, deque
+from itertools import islice
+from datetime import datetime
+import asyncio
+import heapq
+import hmac
+import secrets
+import threading
+import uuid
+import base64
+import copy
+import gzip
+import hashlib
+import json
+import argparse
+import atexit
+import functools
+import traceback
+import logging
+import logging.handlers
+import queue
+import time
+import socket
+import sys
+import tempfile
+import urllib.request
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only gzip bodies are precomputed
+    brotli = None
+
+try:
+    from aiortc import RTCConfiguration, RTCIceServer, RTCPeerConnection, RTCSessionDescription
+    from aiortc.contrib.media import MediaRelay
+    from aiortc.mediastreams import MediaStreamTrack
+except ImportError:  # aiortc is optional; it is only needed for the 'sfu' topology
+    RTCPeerConnection = None
+    MediaStreamTrack = object
+
+# One JSON object per line, with any extra= fields carried along
+class JsonLogFormatter(logging.Formatter):
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        entry.update((k, v) for k, v in vars(record).items() if k not in self.RESERVED)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+# Keeps one in every N records per Socket.IO event (records tagged with extra={'event': ...});
+# warnings and errors always pass
+class EventSamplingFilter(logging.Filter):
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates  # {event: N}
+        self.counts = {}
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, 'event', None))
+        if not rate or rate <= 1 or record.levelno >= logging.WARNING:
+            return True
+        count = self.counts.get(record.event, 0)
+        self.counts[record.event] = count + 1
+        return count % rate == 0
+
+# QueueHandler.prepare would format the whole record in the logging thread and drop exc_info,
+# folding any traceback into msg. Only merge the %-args here, since they may change once the call
+# returns, and leave timestamps, layout and tracebacks to the listener's formatter.
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+# Records below the configured level are never built (handlers log lazily with %-style args);
+# the rest are queued with their message merged and formatted/written by a QueueListener thread,
+# so handlers never wait on formatting tracebacks or stream I/O. Configured from the environment:
+#   EDGE2_LOG_LEVEL   level name (INFO)
+#   EDGE2_LOG_FORMAT  'text' or 'json'
+#   EDGE2_LOG_SAMPLE  per-event sampling, e.g. 'ice-candidate=50,offer=5'
+def setup_logging():
+    level = os.environ.get('EDGE2_LOG_LEVEL', 'INFO').upper()
+    stream_handler = logging.StreamHandler()
+    if os.environ.get('EDGE2_LOG_FORMAT', 'text') == 'json':
+        stream_handler.setFormatter(JsonLogFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    rates = {}
+    for item in filter(None, os.environ.get('EDGE2_LOG_SAMPLE', '').split(',')):
+        event, _, rate = item.partition('=')
+        rates[event.strip()] = int(rate)
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(EventSamplingFilter(rates))
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+    # aiortc's ICE stack logs every connectivity check at INFO
+    logging.getLogger('aioice').setLevel(max(logging.WARNING, root.level))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+# Set up logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# In-process counters and histograms rendered in the Prometheus text format at /metrics.
+# Series are keyed by (name, labels) where labels is a tuple of (label, value) pairs.
+class Metrics:
+    LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # {(name, labels): value}
+        self.histograms = {}  # {(name, labels): [count per bucket..., +Inf count, sum]}
+        self.help = {}  # {name: (type, help text)}
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            series = self.histograms.get(key)
+            if series is None:
+                series = self.histograms[key] = [0] * (len(self.LATENCY_BUCKETS) + 2)
+            for i, bound in enumerate(self.LATENCY_BUCKETS):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[-2] += 1
+            series[-1] += value
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = labels + extra
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{Metrics._escape(v)}"' for k, v in pairs) + '}'
+
+    def render(self, gauges=()):
+        lines = []
+        seen = set()
+
+        def header(name):
+            if name not in seen and name in self.help:
+                seen.add(name)
+                kind, text = self.help[name]
+                lines.append(f'# HELP {name} {text}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, list(series)) for key, series in self.histograms.items())
+        for name, labels, value in gauges:
+            header(name)
+            lines.append(f'{name}{self._labels(labels)} {value}')
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f'{name}{self._labels(labels)} {value}')
+        for (name, labels), series in histograms:
+            header(name)
+            cumulative = 0
+            for bound, count in zip(self.LATENCY_BUCKETS, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{self._labels(labels, (("le", bound),))} {cumulative}')
+            cumulative += series[-2]
+            lines.append(f'{name}_bucket{self._labels(labels, (("le", "+Inf"),))} {cumulative}')
+            lines.append(f'{name}_sum{self._labels(labels)} {series[-1]}')
+            lines.append(f'{name}_count{self._labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+metrics.describe('edge2_rooms_active', 'gauge', 'Rooms with at least one participant')
+metrics.describe('edge2_sfu_sessions', 'gauge', 'Server-side peer connections in SFU mode')
+metrics.describe('edge2_signaling_messages_total', 'counter', 'Offer/answer/ICE messages delivered to a single peer')
+metrics.describe('edge2_signaling_messages_saved_total', 'counter', 'Deliveries a room broadcast would have added')
+metrics.describe('edge2_signaling_bytes_saved_total', 'counter', 'Bytes a room broadcast would have added')
+metrics.describe('edge2_file_store_stored_total', 'counter', 'Files stored')
+metrics.describe('edge2_file_store_expired_total', 'counter', 'Stored files removed after their TTL')
+metrics.describe('edge2_file_store_expired_bytes_total', 'counter', 'Bytes of stored files removed after their TTL')
+metrics.describe('edge2_file_store_evicted_total', 'counter', 'Stored files evicted to stay within the budget')
+metrics.describe('edge2_file_store_evicted_bytes_total', 'counter', 'Bytes of stored files evicted to stay within the budget')
+metrics.describe('edge2_file_store_uploads_abandoned_total', 'counter', 'Chunked uploads dropped after stalling for a TTL')
+metrics.describe('edge2_file_store_files', 'gauge', 'Files currently stored by this process')
+metrics.describe('edge2_file_store_bytes', 'gauge', 'Bytes currently stored by this process')
+metrics.describe('edge2_file_store_budget_bytes', 'gauge', 'File store byte budget')
+metrics.describe('edge2_file_store_uploads_in_progress', 'gauge', 'Chunked uploads in progress')
+metrics.describe('edge2_file_store_reserved_bytes', 'gauge', 'Bytes reserved for chunked uploads in progress')
+metrics.describe('edge2_participants', 'gauge', 'Connected participants across all rooms')
+metrics.describe('edge2_socketio_events_total', 'counter', 'Socket.IO events handled, by event')
+metrics.describe('edge2_socketio_handler_seconds', 'histogram', 'Socket.IO handler wall time, by event')
+metrics.describe('edge2_socketio_bytes_received_total', 'counter', 'Socket.IO JSON payload bytes received, by event')
+metrics.describe('edge2_socketio_bytes_sent_total', 'counter',
+                 'Socket.IO JSON payload bytes encoded for sending, by event; a room broadcast is encoded and counted once')
+metrics.describe('edge2_upload_bytes_received_total', 'counter', 'Binary file chunk bytes received')
+
+# Events with a registered handler; anything else a client sends is counted as '_other' so
+# clients cannot create unbounded label values
+handled_events = set()
+
+def _packet_event(data, known=None):
+    if isinstance(data, list) and data and isinstance(data[0], str):
+        if known is not None and data[0] not in known:
+            return (('event', '_other'),)
+        return (('event', data[0]),)
+    return (('event', '_control'),)
+
+# JSON codec handed to Socket.IO so every encoded or decoded packet is counted exactly once,
+# without re-serializing payloads in the handlers. Outgoing bytes are counted per encode, not per
+# recipient: python-socketio encodes a room broadcast once and sends the same packet to every
+# member, so bytes on the wire for a broadcast are this times the number of recipients.
+class MeteredJson:
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        encoded = json.dumps(obj, *args, **kwargs)
+        metrics.inc('edge2_socketio_bytes_sent_total', _packet_event(obj), len(encoded))
+        return encoded
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        decoded = json.loads(s, *args, **kwargs)
+        metrics.inc('edge2_socketio_bytes_received_total', _packet_event(decoded, handled_events), len(s))
+        return decoded
+
+app = Flask(__name__, static_folder='static', static_url_path='/static')
+app.config['SECRET_KEY'] = os.urandom(24).hex()
+# Uploaded files are spooled to disk; both settings can be overridden from the environment
+app.config['FILE_STORE_DIR'] = os.environ.get('EDGE2_FILE_STORE_DIR', os.path.join(tempfile.gettempdir(), 'edge2meet-files'))
+app.config['MAX_FILE_SIZE'] = int(os.environ.get('EDGE2_MAX_FILE_SIZE', 10 * 1024 * 1024))
+# Chunked uploads are written incrementally, so they can be much larger than a single-frame upload
+app.config['MAX_CHUNKED_FILE_SIZE'] = int(os.environ.get('EDGE2_MAX_CHUNKED_FILE_SIZE', 200 * 1024 * 1024))
+app.config['UPLOAD_CHUNK_SIZE'] = 256 * 1024
+# Stored files expire after FILE_TTL seconds; past FILE_STORE_BUDGET bytes the least recently used go first.
+# Chunked uploads reserve their declared size against the budget while in progress, and each user
+# may have at most MAX_PENDING_UPLOADS of them open at once.
+app.config['FILE_TTL'] = int(os.environ.get('EDGE2_FILE_TTL', 3600))
+app.config['FILE_STORE_BUDGET'] = int(os.environ.get('EDGE2_FILE_STORE_BUDGET', 1024 * 1024 * 1024))
+app.config['MAX_PENDING_UPLOADS'] = int(os.environ.get('EDGE2_MAX_PENDING_UPLOADS', 3))
+app.config['FILE_EXPIRY_INTERVAL'] = 30
+# Chat history kept per room, plus an approximate byte budget shared by all rooms
+app.config['CHAT_HISTORY_PER_ROOM'] = int(os.environ.get('EDGE2_CHAT_HISTORY_PER_ROOM', 100))
+app.config['CHAT_HISTORY_BUDGET'] = int(os.environ.get('EDGE2_CHAT_HISTORY_BUDGET', 16 * 1024 * 1024))
+app.config['CHAT_HISTORY_PAGE_SIZE'] = 50
+# Seconds a dropped socket's place in its room is held for it to resume with its token; 0 removes
+# users as soon as the transport closes
+app.config['SESSION_RESUME_GRACE'] = float(os.environ.get('EDGE2_SESSION_RESUME_GRACE', 10))
+# Scale-out: with a message queue URL (redis://, amqp://, kafka:// or zmq+tcp:// for a local
+# socket) several worker processes behind a sticky-session balancer serve one set of rooms.
+# Presence and chat history move to Redis when a redis:// shared state URL is available;
+# otherwise they stay in-process, which is also what single-process runs and tests use.
+app.config['MESSAGE_QUEUE'] = os.environ.get('EDGE2_MESSAGE_QUEUE') or None
+app.config['SHARED_STATE_URL'] = os.environ.get('EDGE2_SHARED_STATE_URL') or (
+    app.config['MESSAGE_QUEUE'] if (app.config['MESSAGE_QUEUE'] or '').startswith(('redis://', 'rediss://')) else None
+)
+# 'cdn' loads socket.io, Font Awesome and Poppins from public CDNs; 'local' serves the pinned
+# copies fetched into static/vendor with --fetch-vendor, for offline/LAN deployments
+app.config['VENDOR_ASSETS'] = os.environ.get('EDGE2_VENDOR_ASSETS', 'cdn')
+# Per-packet Socket.IO/Engine.IO logging is very chatty; enable with EDGE2_LOG_PACKETS=1 when debugging
+app.config['LOG_PACKETS'] = os.environ.get('EDGE2_LOG_PACKETS') == '1'
+# Opt-in handler/route tracing: per-invocation CPU time plus a log and ring buffer of events slower
+# than SLOW_EVENT_MS. It can also be switched on at runtime through /admin/instrumentation.
+# /admin endpoints are only served when EDGE2_ADMIN_TOKEN is set.
+app.config['TRACE_HANDLERS'] = os.environ.get('EDGE2_TRACE_HANDLERS') == '1'
+app.config['SLOW_EVENT_MS'] = float(os.environ.get('EDGE2_SLOW_EVENT_MS', 100))
+app.config['ADMIN_TOKEN'] = os.environ.get('EDGE2_ADMIN_TOKEN') or None
+# ICE candidates may arrive batched; with ICE_COALESCE_MS > 0 the server also holds candidates for a
+# (from, to) pair that long and forwards them as one frame. 0 forwards each batch as it arrives.
+app.config['ICE_COALESCE_MS'] = float(os.environ.get('EDGE2_ICE_COALESCE_MS', 0))
+app.config['ICE_BATCH_MAX'] = 64
+# 'mesh' connects every pair of participants directly. 'sfu' has each client publish once to this
+# server, which relays the tracks to the rest of the room; it needs aiortc, the threading async
+# mode and a single process, since a room's media has to meet in one place.
+app.config['TOPOLOGY'] = os.environ.get('EDGE2_TOPOLOGY', 'mesh')
+app.config['SFU_STUN_SERVER'] = os.environ.get('EDGE2_SFU_STUN_SERVER', 'stun:stun.l.google.com:19302')
+# Seconds a server offer may go unanswered before the next subscription change replaces it
+app.config['SFU_OFFER_TIMEOUT'] = 10
+# Video layers a receiver can ask a sender for, by the tallest tile (in device pixels) they serve.
+# The client's VIDEO_LAYERS table adds the bitrate and frame-rate caps senders apply.
+# 'off' (height 0) pauses the subscriber's copy while its tile is off-page or its tab is hidden.
+VIDEO_LAYERS = {'low': 180, 'medium': 360, 'high': 720, 'full': None, 'off': 0}
+# What the client bandwidth controller may report, so metric labels stay bounded
+QUALITY_DECISIONS = {'down': ('loss', 'rtt', 'bandwidth'), 'up': ('recovered',)}
+# Stages of a client's per-peer reconnect cycle it may report, for the same reason
+PEER_RECONNECT_STAGES = ('disconnected', 'ice_restart', 'recovered', 'failed')
+# Dominant speaker: clients report their own audio level (RFC 6464 style -dBov, 0 = loudest, 127 =
+# silence). A report counts as speech up to DOMINANT_SPEAKER_MAX_DBOV and for DOMINANT_SPEAKER_STALE
+# seconds; a new loudest speaker must lead for DOMINANT_SPEAKER_HOLD seconds to take over.
+app.config['DOMINANT_SPEAKER_MAX_DBOV'] = 50
+app.config['DOMINANT_SPEAKER_STALE'] = 1.5
+app.config['DOMINANT_SPEAKER_HOLD'] = float(os.environ.get('EDGE2_DOMINANT_SPEAKER_HOLD', 1.0))
+# Let a fronting web server (nginx X-Accel / Apache X-Sendfile) stream downloads itself
+app.config['USE_X_SENDFILE'] = os.environ.get('EDGE2_USE_X_SENDFILE') == '1'
+socketio = SocketIO(app, async_mode=ASYNC_MODE, message_queue=app.config['MESSAGE_QUEUE'], json=MeteredJson,
+                    cors_allowed_origins="*", logger=app.config['LOG_PACKETS'], engineio_logger=app.config['LOG_PACKETS'])
+
+metrics.describe('edge2_handler_cpu_seconds', 'histogram', 'CPU time per traced Socket.IO handler or route')
+metrics.describe('edge2_slow_events_total', 'counter', 'Traced handlers or routes slower than the slow-event threshold')
+
+metrics.describe('edge2_ice_candidates_total', 'counter', 'ICE candidates accepted for forwarding')
+metrics.describe('edge2_ice_frames_total', 'counter', 'ice-candidate frames forwarded to peers')
+
+metrics.describe('edge2_video_layer_requests_total', 'counter', 'Receiver video layer requests, by layer')
+metrics.describe('edge2_dominant_speaker_changes_total', 'counter', 'Dominant speaker changes broadcast to rooms')
+metrics.describe('edge2_quality_decisions_total', 'counter', 'Client bandwidth controller steps, by direction and reason')
+metrics.describe('edge2_quality_decision_rtt_seconds', 'histogram', 'Round-trip time reported with each controller step')
+metrics.describe('edge2_peer_reconnects_total', 'counter', 'Client peer connection reconnect stages, by stage')
+metrics.describe('edge2_peer_recovery_seconds_total', 'counter', 'Time peer connections spent reconnecting before they recovered')
+metrics.describe('edge2_session_resumes_total', 'counter', 'Dropped signaling sessions, by whether they resumed, were rejected or expired')
+
+slow_events = deque(maxlen=200)  # most recent slow handler/route invocations
+
+def _payload_size(payload):
+    if isinstance(payload, (bytes, bytearray, str)):
+        return len(payload)
+    try:
+        return len(json.dumps(payload, default=lambda o: '\0' * len(o) if isinstance(o, (bytes, bytearray)) else str(o)))
+    except (TypeError, ValueError):
+        return None
+
+# Record CPU time for a traced invocation and keep it if it crossed the slow threshold; the
+# payload is only measured for slow invocations
+def trace_invocation(kind, name, wall, cpu, payload=None, payload_bytes=None):
+    labels = (('kind', kind), ('name', name))
+    metrics.observe('edge2_handler_cpu_seconds', labels, cpu)
+    if wall * 1000 < app.config['SLOW_EVENT_MS']:
+        return
+    metrics.inc('edge2_slow_events_total', labels)
+    size = _payload_size(payload) if payload is not None else payload_bytes
+    slow_events.append({
+        'kind': kind,
+        'name': name,
+        'wall_ms': round(wall * 1000, 3),
+        'cpu_ms': round(cpu * 1000, 3),
+        'payload_bytes': size,
+        'at': datetime.now().isoformat()
+    })
+    logger.warning("Slow %s %s: %.1f ms wall, %.1f ms CPU, payload %s bytes", kind, name, wall * 1000, cpu * 1000, size,
+                   extra={'event': name})
+
+# Register a Socket.IO handler that is counted and timed in the metrics registry
+def on_event(event):
+    labels = (('event', event),)
+    handled_events.add(event)
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args):
+            tracing = app.config['TRACE_HANDLERS']
+            cpu_start = time.thread_time() if tracing else 0.0
+            start = time.perf_counter()
+            try:
+                return handler(*args)
+            finally:
+                wall = time.perf_counter() - start
+                metrics.inc('edge2_socketio_events_total', labels)
+                metrics.observe('edge2_socketio_handler_seconds', labels, wall)
+                if tracing:
+                    trace_invocation('event', event, wall, time.thread_time() - cpu_start, args[0] if args else None)
+        return socketio.on(event)(wrapper)
+    return decorator
+
+@app.before_request
+def trace_request_start():
+    if app.config['TRACE_HANDLERS']:
+        request.environ['edge2.trace_start'] = (time.perf_counter(), time.thread_time())
+
+@app.teardown_request
+def trace_request_end(exc=None):
+    started = request.environ.get('edge2.trace_start')
+    if started is not None:
+        wall_start, cpu_start = started
+        # Unmatched paths share one label so 404 probes cannot grow the series without bound
+        trace_invocation('route', request.url_rule.rule if request.url_rule else '<unmatched>',
+                         time.perf_counter() - wall_start, time.thread_time() - cpu_start,
+                         payload_bytes=request.content_length)
+
+# A real OS thread, its ident and sleep, even when a greenlet backend has patched threading and
+# time, so the sampler observes whatever is running on the event loop, including a stalled handler.
+# The patched get_ident returns a greenlet id, which never matches a sys._current_frames() key.
+def _native_thread_tools():
+    if ASYNC_MODE == 'eventlet':
+        import eventlet.patcher
+        native_thread = eventlet.patcher.original('_thread')
+        return native_thread.start_new_thread, native_thread.get_ident, eventlet.patcher.original('time').sleep
+    if ASYNC_MODE == 'gevent':
+        from gevent import monkey
+        return (monkey.get_original('_thread', 'start_new_thread'), monkey.get_original('_thread', 'get_ident'),
+                monkey.get_original('time', 'sleep'))
+    import _thread
+    return _thread.start_new_thread, _thread.get_ident, time.sleep
+
+# Sample every other thread's Python stack for the given duration and return the stacks in
+# collapsed ("folded") form, most frequent first, ready for flamegraph tools
+def sample_stacks(seconds, interval=0.005):
+    start_new_thread, native_get_ident, native_sleep = _native_thread_tools()
+    counts = {}
+    done = []
+
+    def sampler():
+        me = native_get_ident()
+        deadline = time.monotonic() + seconds
+        try:
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == me:
+                        continue
+                    stack = ';'.join(f"{f.name} ({os.path.basename(f.filename)}:{f.lineno})"
+                                     for f in traceback.extract_stack(frame))
+                    counts[stack] = counts.get(stack, 0) + 1
+                native_sleep(interval)
+        finally:
+            done.append(True)
+
+    start_new_thread(sampler, ())
+    while not done:
+        socketio.sleep(0.05)
+    return '\n'.join(f"{stack} {count}" for stack, count in sorted(counts.items(), key=lambda item: -item[1])) + '\n'
+
+# One connected user; __slots__ keeps per-session overhead small with many sessions
+class Presence:
+    __slots__ = ('user_id', 'sid', 'room', 'username', 'connection_time', 'resume_token')
+
+    def __init__(self, user_id, sid, room, username, connection_time, resume_token=None):
+        self.user_id = user_id
+        self.sid = sid
+        self.room = room
+        self.username = username
+        self.connection_time = connection_time
+        self.resume_token = resume_token
+
+# Connected users indexed by user_id, by room and by sid so every lookup and count is O(1)
+class PresenceRegistry:
+    __slots__ = ('_users', '_rooms', '_sids')
+
+    def __init__(self):
+        self._users = {}  # {user_id: Presence}
+        self._rooms = {}  # {room: {user_id: Presence}}
+        self._sids = {}  # {sid: user_id}
+
+    def __contains__(self, user_id):
+        return user_id in self._users
+
+    def __len__(self):
+        return len(self._users)
+
+    def get(self, user_id):
+        return self._users.get(user_id)
+
+    def by_sid(self, sid):
+        user_id = self._sids.get(sid)
+        return self._users.get(user_id) if user_id is not None else None
+
+    def add(self, user_id, sid, room, username):
+        self.remove(user_id)
+        entry = Presence(user_id, sid, room, username, datetime.now().isoformat(), secrets.token_urlsafe(16))
+        self._users[user_id] = entry
+        self._rooms.setdefault(room, {})[user_id] = entry
+        self._sids[sid] = user_id
+        return entry
+
+    # Move a resumed session onto its new socket, keeping its room and connection time
+    def rebind(self, user_id, sid):
+        entry = self._users.get(user_id)
+        if entry is None:
+            return None
+        if self._sids.get(entry.sid) == user_id:
+            del self._sids[entry.sid]
+        entry.sid = sid
+        self._sids[sid] = user_id
+        return entry
+
+    def remove(self, user_id):
+        entry = self._users.pop(user_id, None)
+        if entry is None:
+            return None
+        if self._sids.get(entry.sid) == user_id:
+            del self._sids[entry.sid]
+        members = self._rooms.get(entry.room)
+        if members is not None:
+            members.pop(user_id, None)
+            if not members:
+                del self._rooms[entry.room]
+        return entry
+
+    def count(self, room):
+        return len(self._rooms.get(room, ()))
+
+    def member(self, room, user_id):
+        return self._rooms.get(room, {}).get(user_id)
+
+    def members(self, room):
+        return self._rooms.get(room, {})
+
+    def rooms(self):
+        return self._rooms.keys()
+
+# One uploaded file; the bytes live on disk under the store's spool directory
+class StoredFile:
+    __slots__ = ('file_id', 'name', 'path', 'size', 'timestamp')
+
+    def __init__(self, file_id, name, path, size, timestamp):
+        self.file_id = file_id
+        self.name = name
+        self.path = path
+        self.size = size
+        self.timestamp = timestamp
+
+# A chunked upload in progress; survives the uploader's reconnects until committed or abandoned
+class PendingUpload:
+    __slots__ = ('upload_id', 'user_id', 'room', 'name', 'size', 'path', 'received', 'updated')
+
+    def __init__(self, upload_id, user_id, room, name, size, path):
+        self.upload_id = upload_id
+        self.user_id = user_id
+        self.room = room
+        self.name = name
+        self.size = size
+        self.path = path
+        self.received = 0
+        self.updated = time.time()
+
+# Uploaded files decoded once and written to a spool directory, served straight from disk.
+# Expiry is driven by a time-ordered heap and the total size by LRU eviction, so the
+# background sweep only touches entries that are actually due. Stored files plus the declared
+# sizes of uploads in progress never exceed max_total_bytes (per worker in shared mode).
+class FileStore:
+    def __init__(self, spool_dir, max_file_size, max_chunked_file_size, ttl, max_total_bytes, max_pending_uploads,
+                 shared=False):
+        self.spool_dir = spool_dir
+        self.shared = shared
+        self.max_file_size = max_file_size
+        self.max_chunked_file_size = max_chunked_file_size
+        self.ttl = ttl
+        self.max_total_bytes = max_total_bytes
+        self.max_pending_uploads = max_pending_uploads
+        self.total_bytes = 0
+        self.reserved_bytes = 0  # declared sizes of uploads in progress
+        self.stats = {'stored': 0, 'expired': 0, 'expired_bytes': 0, 'evicted': 0, 'evicted_bytes': 0, 'uploads_abandoned': 0}
+        self._files = OrderedDict()  # {file_id: StoredFile}, least recently used first
+        self._expiry = []  # heap of (expires_at, file_id)
+        self._uploads = {}  # {upload_id: PendingUpload}
+        self._lock = threading.RLock()
+        os.makedirs(spool_dir, exist_ok=True)
+
+    # The index is in-memory only, so files left from a previous run are unreachable. Only called
+    # once the process starts serving: importing the module (--fetch-vendor, --sfu-selftest, a
+    # second copy) must not delete a live server's files.
+    def discard_orphans(self):
+        if self.shared:
+            return 0
+        removed = 0
+        for name in os.listdir(self.spool_dir):
+            try:
+                file_id = name.split('.')[0]
+                uuid.UUID(file_id)
+            except ValueError:
+                continue
+            if file_id in self._files or file_id in self._uploads:
+                continue
+            try:
+                os.remove(os.path.join(self.spool_dir, name))
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def __contains__(self, file_id):
+        return file_id in self._files
+
+    def __len__(self):
+        return len(self._files)
+
+    def get(self, file_id):
+        entry = self._files.get(file_id)
+        if entry is None and self.shared:
+            entry = self._load_shared(file_id)
+        return entry
+
+    # With a spool directory shared between worker processes, every stored file gets a
+    # metadata sidecar so any worker can serve it, and any worker can expire it (_sweep_shared)
+    def _load_shared(self, file_id):
+        try:
+            uuid.UUID(file_id)
+            with open(os.path.join(self.spool_dir, file_id + '.json')) as f:
+                meta = json.load(f)
+        except (ValueError, OSError):
+            return None
+        return StoredFile(file_id, meta['name'], os.path.join(self.spool_dir, file_id), meta['size'], meta['timestamp'])
+
+    # Counted both for the /file_stats snapshot and as Prometheus totals
+    def _count(self, key, value=1):
+        self.stats[key] += value
+        metrics.inc(f'edge2_file_store_{key}_total', (), value)
+
+    def touch(self, file_id):
+        with self._lock:
+            if file_id in self._files:
+                self._files.move_to_end(file_id)
+
+    def _add(self, entry):
+        if self.shared:
+            with open(os.path.join(self.spool_dir, entry.file_id + '.json'), 'w') as f:
+                json.dump({'name': entry.name, 'size': entry.size, 'timestamp': entry.timestamp,
+                           'expires_at': entry.timestamp + self.ttl}, f)
+        with self._lock:
+            self._files[entry.file_id] = entry
+            heapq.heappush(self._expiry, (entry.timestamp + self.ttl, entry.file_id))
+            self.total_bytes += entry.size
+            self._count('stored')
+            # Evict least recently used files, never the one just stored, until back under budget
+            self._evict(self.max_total_bytes, keep=1)
+        return entry
+
+    # Drop least recently used files until stored plus reserved bytes fit in limit
+    def _evict(self, limit, keep=0):
+        while self.total_bytes + self.reserved_bytes > limit and len(self._files) > keep:
+            victim = next(iter(self._files))
+            removed = self._remove(victim)
+            self._count('evicted')
+            self._count('evicted_bytes', removed.size)
+            logger.info("Evicted file %s (%d bytes) to stay within the file store budget", victim, removed.size)
+
+    def put(self, name, data):
+        if len(data) > self.max_file_size:
+            raise ValueError(f'File size exceeds {self.max_file_size // (1024 * 1024)}MB')
+        file_id = str(uuid.uuid4())
+        path = os.path.join(self.spool_dir, file_id)
+        tmp_path = path + '.part'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return self._add(StoredFile(file_id, name, path, len(data), time.time()))
+
+    def begin_upload(self, user_id, room, name, size):
+        if size < 0 or size > self.max_chunked_file_size:
+            raise ValueError(f'File size exceeds {self.max_chunked_file_size // (1024 * 1024)}MB')
+        upload_id = str(uuid.uuid4())
+        path = os.path.join(self.spool_dir, upload_id + '.part')
+        upload = PendingUpload(upload_id, user_id, room, name, size, path)
+        with self._lock:
+            if sum(1 for pending in self._uploads.values() if pending.user_id == user_id) >= self.max_pending_uploads:
+                raise ValueError(f'At most {self.max_pending_uploads} uploads may be in progress at once')
+            # Stored files can be evicted to make room; other uploads in progress cannot
+            if self.reserved_bytes + size > self.max_total_bytes:
+                raise ValueError('Not enough space for this upload right now, try again later')
+            open(path, 'wb').close()
+            self.reserved_bytes += size
+            self._uploads[upload_id] = upload
+            self._evict(self.max_total_bytes)
+        return upload
+
+    def get_upload(self, upload_id):
+        return self._uploads.get(upload_id)
+
+    def append_chunk(self, upload_id, offset, data):
+        upload = self._uploads[upload_id]
+        if offset != upload.received:
+            raise ValueError(f'Expected offset {upload.received}, got {offset}')
+        if upload.received + len(data) > upload.size:
+            raise ValueError('Chunk runs past the declared file size')
+        with open(upload.path, 'ab') as f:
+            f.write(data)
+        upload.received += len(data)
+        upload.updated = time.time()
+        return upload.received
+
+    def commit_upload(self, upload_id):
+        with self._lock:
+            upload = self._uploads[upload_id]
+            if upload.received != upload.size:
+                raise ValueError(f'Upload incomplete: {upload.received} of {upload.size} bytes')
+            del self._uploads[upload_id]
+            # The reservation turns into stored bytes in _add
+            self.reserved_bytes -= upload.size
+        # The upload id doubles as the file id so the spooled bytes are renamed, never copied
+        path = os.path.join(self.spool_dir, upload_id)
+        os.replace(upload.path, path)
+        return self._add(StoredFile(upload_id, upload.name, path, upload.size, time.time()))
+
+    def abort_upload(self, upload_id):
+        with self._lock:
+            upload = self._uploads.pop(upload_id, None)
+            if upload is not None:
+                self.reserved_bytes -= upload.size
+        if upload is not None:
+            try:
+                os.remove(upload.path)
+            except OSError as e:
+                logger.error("Error removing partial upload %s: %s", upload_id, e)
+        return upload
+
+    def _remove(self, file_id):
+        entry = self._files.pop(file_id, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+            try:
+                os.remove(entry.path)
+                if self.shared:
+                    os.remove(entry.path + '.json')
+            except OSError as e:
+                logger.error("Error removing stored file %s: %s", file_id, e)
+        return entry
+
+    def remove(self, file_id):
+        with self._lock:
+            return self._remove(file_id)
+
+    def expire(self, now=None):
+        now = time.time() if now is None else now
+        expired = 0
+        with self._lock:
+            # Heap entries for files already evicted or removed are skipped lazily
+            while self._expiry and self._expiry[0][0] <= now:
+                _, file_id = heapq.heappop(self._expiry)
+                entry = self._remove(file_id)
+                if entry is not None:
+                    expired += 1
+                    self._count('expired')
+                    self._count('expired_bytes', entry.size)
+            stalled = [uid for uid, upload in self._uploads.items() if upload.updated + self.ttl <= now]
+        for uid in stalled:
+            self.abort_upload(uid)
+        self._count('uploads_abandoned', len(stalled))
+        if self.shared:
+            swept = self._sweep_shared(now)
+            self._count('expired', swept)
+            expired += swept
+        return expired
+
+    # Files a worker stored are only in that worker's index, so ones left by a worker that crashed
+    # or restarted are expired from their sidecars here; stale partial uploads and data files that
+    # never got a sidecar go by modification time
+    def _sweep_shared(self, now):
+        swept = 0
+        for name in os.listdir(self.spool_dir):
+            file_id, _, ext = name.partition('.')
+            try:
+                uuid.UUID(file_id)
+            except ValueError:
+                continue
+            if file_id in self._files or file_id in self._uploads:
+                continue
+            path = os.path.join(self.spool_dir, name)
+            try:
+                if ext == 'json':
+                    with open(path) as f:
+                        meta = json.load(f)
+                    if meta.get('expires_at', meta['timestamp'] + self.ttl) > now:
+                        continue
+                    # Sidecar first, so no worker serves a file whose bytes are already gone
+                    os.remove(path)
+                    os.remove(os.path.join(self.spool_dir, file_id))
+                    swept += 1
+                elif os.path.getmtime(path) + self.ttl <= now and (
+                        ext == 'part' or not os.path.exists(path + '.json')):
+                    os.remove(path)
+            except (OSError, ValueError, KeyError):
+                continue
+        return swept
+
+    def snapshot(self):
+        return dict(self.stats, files=len(self._files), bytes=self.total_bytes, reserved_bytes=self.reserved_bytes,
+                    budget_bytes=self.max_total_bytes, uploads_in_progress=len(self._uploads))
+
+# One room's chat history. seq numbers are monotonic for the lifetime of the history;
+# the epoch changes whenever a room's history is recreated so stale cursors can be detected.
+class RoomHistory:
+    __slots__ = ('messages', 'next_seq', 'epoch')
+
+    def __init__(self, capacity):
+        self.messages = deque(maxlen=capacity)
+        self.next_seq = 1
+        self.epoch = uuid.uuid4().hex[:8]
+
+# Per-room chat history in fixed-capacity ring buffers. When the shared byte budget is
+# exceeded the oldest messages of the least recently active rooms are dropped first.
+class ChatHistoryStore:
+    def __init__(self, per_room, max_total_bytes, page_size):
+        self.per_room = per_room
+        self.max_total_bytes = max_total_bytes
+        self.page_size = page_size
+        self.total_bytes = 0
+        self._rooms = OrderedDict()  # {room: RoomHistory}, least recently active first
+
+    def __contains__(self, room):
+        return room in self._rooms
+
+    def __len__(self):
+        return len(self._rooms)
+
+    @staticmethod
+    def _size(message):
+        return sum(len(str(v)) for v in message.values()) + 64
+
+    def append(self, room, message):
+        history = self._rooms.get(room)
+        if history is None:
+            history = self._rooms[room] = RoomHistory(self.per_room)
+        else:
+            self._rooms.move_to_end(room)
+        messages = history.messages
+        if len(messages) == self.per_room:
+            self.total_bytes -= self._size(messages.popleft())
+        message['seq'] = history.next_seq
+        history.next_seq += 1
+        messages.append(message)
+        self.total_bytes += self._size(message)
+        epoch = history.epoch
+        while self.total_bytes > self.max_total_bytes:
+            oldest_room, oldest = next(iter(self._rooms.items()))
+            if oldest_room == room and len(oldest.messages) == 1:
+                break
+            self.total_bytes -= self._size(oldest.messages.popleft())
+            if not oldest.messages:
+                del self._rooms[oldest_room]
+        return message, epoch
+
+    def get(self, room):
+        history = self._rooms.get(room)
+        return list(history.messages) if history is not None else []
+
+    # Messages after seq, oldest first, at most limit of them. A cursor from another epoch
+    # (the history was reclaimed and recreated since) is treated as seq 0.
+    def history_since(self, room, seq=0, limit=None, epoch=None):
+        limit = self.page_size if limit is None else max(1, min(limit, self.page_size))
+        history = self._rooms.get(room)
+        if history is None:
+            return {'room': room, 'epoch': None, 'messages': [], 'last_seq': 0, 'has_more': False}
+        if epoch is not None and epoch != history.epoch:
+            seq = 0
+        messages = history.messages
+        start = 0
+        if messages:
+            # seq numbers in the buffer are contiguous, so the start index is direct arithmetic
+            start = min(max(seq - messages[0]['seq'] + 1, 0), len(messages))
+        page = list(islice(messages, start, start + limit))
+        return {
+            'room': room,
+            'epoch': history.epoch,
+            'messages': page,
+            'last_seq': page[-1]['seq'] if page else min(seq, history.next_seq - 1),
+            'has_more': start + len(page) < len(messages)
+        }
+
+    def drop(self, room):
+        history = self._rooms.pop(room, None)
+        if history is not None:
+            self.total_bytes -= sum(self._size(m) for m in history.messages)
+
+# PresenceRegistry backed by Redis so every worker process sees the same users. Layout:
+# <prefix>user:<user_id> hash, <prefix>room:<room> hash of user_id -> sid, <prefix>sids hash of sid -> user_id
+class RedisPresenceRegistry:
+    def __init__(self, client, prefix='edge2:'):
+        self._redis = client
+        self._prefix = prefix
+
+    def _user_key(self, user_id):
+        return f"{self._prefix}user:{user_id}"
+
+    def _room_key(self, room):
+        return f"{self._prefix}room:{room}"
+
+    def __contains__(self, user_id):
+        return self._redis.exists(self._user_key(user_id)) > 0
+
+    def __len__(self):
+        return self._redis.hlen(f"{self._prefix}sids")
+
+    def get(self, user_id):
+        fields = self._redis.hgetall(self._user_key(user_id))
+        if not fields:
+            return None
+        return Presence(user_id, fields['sid'], fields['room'], fields['username'], fields['connection_time'],
+                        fields.get('resume_token'))
+
+    def by_sid(self, sid):
+        user_id = self._redis.hget(f"{self._prefix}sids", sid)
+        return self.get(user_id) if user_id is not None else None
+
+    def add(self, user_id, sid, room, username):
+        self.remove(user_id)
+        entry = Presence(user_id, sid, room, username, datetime.now().isoformat(), secrets.token_urlsafe(16))
+        pipe = self._redis.pipeline()
+        pipe.hset(self._user_key(user_id), mapping={
+            'sid': sid, 'room': room, 'username': username, 'connection_time': entry.connection_time,
+            'resume_token': entry.resume_token
+        })
+        pipe.hset(self._room_key(room), user_id, sid)
+        pipe.hset(f"{self._prefix}sids", sid, user_id)
+        pipe.sadd(f"{self._prefix}rooms", room)
+        pipe.execute()
+        return entry
+
+    def rebind(self, user_id, sid):
+        entry = self.get(user_id)
+        if entry is None:
+            return None
+        pipe = self._redis.pipeline()
+        pipe.hdel(f"{self._prefix}sids", entry.sid)
+        pipe.hset(self._user_key(user_id), 'sid', sid)
+        pipe.hset(self._room_key(entry.room), user_id, sid)
+        pipe.hset(f"{self._prefix}sids", sid, user_id)
+        pipe.execute()
+        entry.sid = sid
+        return entry
+
+    def remove(self, user_id):
+        entry = self.get(user_id)
+        if entry is None:
+            return None
+        pipe = self._redis.pipeline()
+        pipe.delete(self._user_key(user_id))
+        pipe.hdel(self._room_key(entry.room), user_id)
+        pipe.hdel(f"{self._prefix}sids", entry.sid)
+        pipe.execute()
+        if self.count(entry.room) == 0:
+            self._redis.srem(f"{self._prefix}rooms", entry.room)
+        return entry
+
+    def count(self, room):
+        return self._redis.hlen(self._room_key(room))
+
+    def member(self, room, user_id):
+        if self._redis.hget(self._room_key(room), user_id) is None:
+            return None
+        return self.get(user_id)
+
+    def members(self, room):
+        return {user_id: self.get(user_id) for user_id in self._redis.hkeys(self._room_key(room))}
+
+    def rooms(self):
+        return self._redis.smembers(f"{self._prefix}rooms")
+
+# ChatHistoryStore backed by Redis lists (JSON messages, trimmed to per_room) with the seq
+# counter and epoch kept alongside. Memory is bounded by the per-room cap and Redis maxmemory.
+class RedisChatHistoryStore:
+    # Assigning the seq and pushing the message in one script keeps the list in seq order with
+    # several workers appending, which history_since's index arithmetic relies on. The seq is
+    # spliced in as the first field of the already-encoded message. Returns {seq, epoch}.
+    APPEND_SCRIPT = """
+redis.call('SET', KEYS[3], ARGV[3], 'NX')
+local seq = redis.call('INCR', KEYS[2])
+redis.call('RPUSH', KEYS[1], '{"seq": ' .. seq .. ', ' .. string.sub(ARGV[1], 2))
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[2]), -1)
+return {seq, redis.call('GET', KEYS[3])}
+"""
+
+    def __init__(self, client, per_room, page_size, prefix='edge2:'):
+        self._redis = client
+        self.per_room = per_room
+        self.page_size = page_size
+        self._prefix = prefix
+        self._append = client.register_script(self.APPEND_SCRIPT)
+
+    def _keys(self, room):
+        return f"{self._prefix}chat:{room}", f"{self._prefix}chatseq:{room}", f"{self._prefix}chatepoch:{room}"
+
+    def __contains__(self, room):
+        return self._redis.exists(self._keys(room)[1]) > 0
+
+    def append(self, room, message):
+        message.pop('seq', None)
+        seq, epoch = self._append(keys=self._keys(room), args=[json.dumps(message), self.per_room, uuid.uuid4().hex[:8]])
+        message['seq'] = seq
+        return message, epoch
+
+    def get(self, room):
+        return [json.loads(m) for m in self._redis.lrange(self._keys(room)[0], 0, -1)]
+
+    def history_since(self, room, seq=0, limit=None, epoch=None):
+        limit = self.page_size if limit is None else max(1, min(limit, self.page_size))
+        messages_key, seq_key, epoch_key = self._keys(room)
+        pipe = self._redis.pipeline()
+        pipe.get(epoch_key)
+        pipe.get(seq_key)
+        pipe.lindex(messages_key, 0)
+        pipe.llen(messages_key)
+        current_epoch, last_seq, first, length = pipe.execute()
+        if current_epoch is None:
+            return {'room': room, 'epoch': None, 'messages': [], 'last_seq': 0, 'has_more': False}
+        if epoch is not None and epoch != current_epoch:
+            seq = 0
+        start = 0
+        if first is not None:
+            start = min(max(seq - json.loads(first)['seq'] + 1, 0), length)
+        page = [json.loads(m) for m in self._redis.lrange(messages_key, start, start + limit - 1)]
+        return {
+            'room': room,
+            'epoch': current_epoch,
+            'messages': page,
+            'last_seq': page[-1]['seq'] if page else min(seq, int(last_seq or 0)),
+            'has_more': start + len(page) < length
+        }
+
+    def drop(self, room):
+        self._redis.delete(*self._keys(room))
+
+# Dominant-speaker state for one room
+class RoomSpeakers:
+    __slots__ = ('levels', 'dominant', 'candidate', 'candidate_since')
+
+    def __init__(self):
+        self.levels = {}  # {user_id: (dBov, reported at)} for participants currently speaking
+        self.dominant = None
+        self.candidate = None  # loudest speaker waiting out the hold time
+        self.candidate_since = 0
+
+# Per-room dominant-speaker state machine fed by audio_level reports. Only changes are returned,
+# so callers broadcast just those. The current dominant speaker keeps the spot through silence
+# until someone else has been loudest for the hold time, or they leave. State is per process;
+# RedisSpeakerTracker shares it between workers.
+class SpeakerTracker:
+    def __init__(self, max_dbov, stale, hold):
+        self.max_dbov = max_dbov
+        self.stale = stale
+        self.hold = hold
+        self._rooms = {}  # {room: RoomSpeakers}
+        self._lock = threading.Lock()
+
+    # Record a report; returns the new dominant speaker, or None if it did not change
+    def report(self, room, user_id, level, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._rooms.get(room)
+            if state is None:
+                state = self._rooms[room] = RoomSpeakers()
+            if level <= self.max_dbov:
+                state.levels[user_id] = (level, now)
+            else:
+                state.levels.pop(user_id, None)
+            fresh = [(level, user) for user, (level, at) in state.levels.items() if now - at <= self.stale]
+            loudest = min(fresh)[1] if fresh else None
+            if loudest is None or loudest == state.dominant:
+                state.candidate = None
+                return None
+            if state.candidate != loudest:
+                state.candidate = loudest
+                state.candidate_since = now
+            if state.dominant is not None and now - state.candidate_since < self.hold:
+                return None
+            state.dominant = loudest
+            state.candidate = None
+            return loudest
+
+    def dominant(self, room):
+        with self._lock:
+            state = self._rooms.get(room)
+            return state.dominant if state is not None else None
+
+    # Forget a participant; True if they were the dominant speaker
+    def remove(self, room, user_id):
+        with self._lock:
+            state = self._rooms.get(room)
+            if state is None:
+                return False
+            state.levels.pop(user_id, None)
+            if state.candidate == user_id:
+                state.candidate = None
+            if state.dominant != user_id:
+                return False
+            state.dominant = None
+            return True
+
+    def drop(self, room):
+        with self._lock:
+            self._rooms.pop(room, None)
+
+# SpeakerTracker state kept in Redis so every worker runs the same state machine over all of a
+# room's reports, whichever worker each client is connected to. Each step is one script, so two
+# workers cannot both decide a change. Times are wall-clock because they are compared across
+# processes. Layout: <prefix>speakers:<room> hash of dominant/candidate/candidate_since,
+# <prefix>speakerlevels:<room> hash of user_id -> "dBov:reported at".
+class RedisSpeakerTracker:
+    REPORT_SCRIPT = """
+local user, level, now = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+if level <= tonumber(ARGV[4]) then
+    redis.call('HSET', KEYS[2], user, ARGV[2] .. ':' .. ARGV[3])
+else
+    redis.call('HDEL', KEYS[2], user)
+end
+local loudest, loudest_level
+local entries = redis.call('HGETALL', KEYS[2])
+for i = 1, #entries, 2 do
+    local l, at = string.match(entries[i + 1], '([^:]+):(.+)')
+    l, at = tonumber(l), tonumber(at)
+    if now - at <= tonumber(ARGV[5]) and (loudest == nil or l < loudest_level or (l == loudest_level and entries[i] < loudest)) then
+        loudest, loudest_level = entries[i], l
+    end
+end
+local dominant = redis.call('HGET', KEYS[1], 'dominant')
+if loudest == nil or loudest == dominant then
+    redis.call('HDEL', KEYS[1], 'candidate')
+    return false
+end
+if redis.call('HGET', KEYS[1], 'candidate') ~= loudest then
+    redis.call('HSET', KEYS[1], 'candidate', loudest)
+    redis.call('HSET', KEYS[1], 'candidate_since', ARGV[3])
+end
+if dominant and now - tonumber(redis.call('HGET', KEYS[1], 'candidate_since')) < tonumber(ARGV[6]) then
+    return false
+end
+redis.call('HSET', KEYS[1], 'dominant', loudest)
+redis.call('HDEL', KEYS[1], 'candidate')
+return loudest
+"""
+    REMOVE_SCRIPT = """
+redis.call('HDEL', KEYS[2], ARGV[1])
+if redis.call('HGET', KEYS[1], 'candidate') == ARGV[1] then
+    redis.call('HDEL', KEYS[1], 'candidate')
+end
+if redis.call('HGET', KEYS[1], 'dominant') ~= ARGV[1] then
+    return 0
+end
+redis.call('HDEL', KEYS[1], 'dominant')
+return 1
+"""
+
+    def __init__(self, client, max_dbov, stale, hold, prefix='edge2:'):
+        self._redis = client
+        self.max_dbov = max_dbov
+        self.stale = stale
+        self.hold = hold
+        self._prefix = prefix
+        self._report = client.register_script(self.REPORT_SCRIPT)
+        self._remove = client.register_script(self.REMOVE_SCRIPT)
+
+    def _keys(self, room):
+        return f"{self._prefix}speakers:{room}", f"{self._prefix}speakerlevels:{room}"
+
+    def report(self, room, user_id, level, now=None):
+        now = time.time() if now is None else now
+        return self._report(keys=self._keys(room), args=[user_id, level, repr(now), self.max_dbov, self.stale, self.hold])
+
+    def dominant(self, room):
+        return self._redis.hget(self._keys(room)[0], 'dominant')
+
+    def remove(self, room, user_id):
+        return bool(self._remove(keys=self._keys(room), args=[user_id]))
+
+    def drop(self, room):
+        self._redis.delete(*self._keys(room))
+
+# One client's server-side peer connection: the tracks it publishes and the relayed tracks it receives
+class SfuSession:
+    __slots__ = ('room', 'user_id', 'pc', 'published', 'outgoing', 'layers', 'negotiating', 'renegotiate', 'offer', 'offered_at')
+
+    def __init__(self, room, user_id, pc):
+        self.room = room
+        self.user_id = user_id
+        self.pc = pc
+        self.published = []  # tracks received from this client
+        self.outgoing = {}  # {transceiver: (publisher user_id, source track, relayed track), or None once freed}
+        self.layers = {}  # {publisher user_id: max height this client asked for}
+        self.negotiating = False  # a server offer is waiting for the client's answer
+        self.renegotiate = False  # subscriptions changed while that offer was outstanding
+        self.offer = None  # the outstanding offer payload, re-sent when the client resumes
+        self.offered_at = 0.0
+
+# One subscriber's copy of a relayed video track, downscaled to the layer that subscriber asked
+# for. Scaling before the per-subscriber encode also makes thumbnails cheaper to encode.
+class LayeredVideoTrack(MediaStreamTrack):
+    kind = 'video'
+
+    def __init__(self, source, max_height=None):
+        super().__init__()
+        self.source = source
+        self.max_height = max_height
+
+    async def recv(self):
+        frame = await self.source.recv()
+        # Paused: keep draining the relay so the copy resumes on a fresh frame, but send nothing
+        while self.max_height == 0:
+            frame = await self.source.recv()
+        if not self.max_height or frame.height <= self.max_height:
+            return frame
+        width = max(2, round(frame.width * self.max_height / frame.height / 2) * 2)
+        scaled = frame.reformat(width=width, height=self.max_height)
+        scaled.pts = frame.pts
+        scaled.time_base = frame.time_base
+        return scaled
+
+    def stop(self):
+        super().stop()
+        self.source.stop()
+
+# Selective forwarding unit on aiortc. aiortc is asyncio-based, so the router owns an event loop on
+# a native thread and Socket.IO handlers wait for its results with socketio.sleep, like sample_stacks.
+# Coroutines only touch router state on that loop. aiortc relays decoded frames, so every
+# subscription costs one encode on the server; freed transceivers are reused for later publishers.
+class SfuRouter:
+    def __init__(self, stun_server=None, offer_timeout=10):
+        self.stun_server = stun_server
+        self.offer_timeout = offer_timeout
+        self.rooms = {}  # {room: {user_id: SfuSession}}
+        self.sessions = {}  # {user_id: SfuSession}
+        self.relay = MediaRelay() if RTCPeerConnection is not None else None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                start_new_thread = _native_thread_tools()[0]
+                start_new_thread(self._loop.run_forever, ())
+        return self._loop
+
+    # Schedule a coroutine on the router loop without waiting for it
+    def submit(self, coro):
+        loop = self._ensure_loop()
+        loop.call_soon_threadsafe(loop.create_task, coro)
+
+    # Run a coroutine on the router loop and return its result without blocking other clients
+    def call(self, coro, timeout=15):
+        outcome = []
+
+        async def runner():
+            try:
+                outcome.append((True, await coro))
+            except Exception as e:
+                outcome.append((False, e))
+
+        self.submit(runner())
+        deadline = time.monotonic() + timeout
+        while not outcome:
+            if time.monotonic() > deadline:
+                raise TimeoutError('SFU did not respond in time')
+            socketio.sleep(0.005)
+        ok, value = outcome[0]
+        if not ok:
+            raise value
+        return value
+
+    def _new_peer_connection(self):
+        servers = [RTCIceServer(urls=self.stun_server)] if self.stun_server else []
+        return RTCPeerConnection(RTCConfiguration(iceServers=servers))
+
+    # Accept a client's publish offer (None for receive-only clients). Returns the answer plus the
+    # server offers [(user_id, offer)] that bring this client and the rest of the room up to date.
+    async def publish(self, room, user_id, offer):
+        previous = self.sessions.get(user_id)
+        if previous is not None:
+            await self._remove(previous)
+        session = SfuSession(room, user_id, self._new_peer_connection())
+        self.sessions[user_id] = session
+        members = self.rooms.setdefault(room, {})
+        members[user_id] = session
+        session.pc.on('track', session.published.append)
+
+        @session.pc.on('connectionstatechange')
+        async def on_connection_state():
+            if session.pc.connectionState == 'failed' and self.sessions.get(user_id) is session:
+                logger.warning("SFU connection for %s in room %s failed", user_id, room, extra={'event': 'sfu'})
+                await self._remove(session)
+
+        answer = None
+        if offer:
+            await session.pc.setRemoteDescription(RTCSessionDescription(sdp=offer['sdp'], type=offer['type']))
+            await session.pc.setLocalDescription(await session.pc.createAnswer())
+            answer = {'sdp': session.pc.localDescription.sdp, 'type': session.pc.localDescription.type}
+        offers = []
+        for other in list(members.values()):
+            if other is session:
+                continue
+            self._subscribe(session, other)
+            if self._subscribe(other, session):
+                offers.append((other.user_id, await self._offer(other)))
+        if session.outgoing:
+            offers.append((user_id, await self._offer(session)))
+        return answer, [(target, payload) for target, payload in offers if payload is not None]
+
+    # Apply a client's answer to a server offer; returns a follow-up offer if subscriptions changed meanwhile
+    async def answer(self, room, user_id, answer):
+        session = self.sessions.get(user_id)
+        if session is None or session.room != room or not session.negotiating:
+            raise ValueError('No SFU offer is outstanding')
+        await session.pc.setRemoteDescription(RTCSessionDescription(sdp=answer['sdp'], type=answer['type']))
+        session.negotiating = False
+        session.offer = None
+        if session.renegotiate:
+            return await self._offer(session)
+        return None
+
+    # Receiver-driven layer selection: scale what subscriber receives from publisher
+    async def set_layer(self, room, subscriber_id, publisher_id, max_height):
+        session = self.sessions.get(subscriber_id)
+        if session is None or session.room != room:
+            return
+        session.layers[publisher_id] = max_height
+        for entry in session.outgoing.values():
+            if entry is not None and entry[0] == publisher_id and isinstance(entry[2], LayeredVideoTrack):
+                entry[2].max_height = max_height
+
+    # The offer a client still owes an answer for; it may have been sent to a socket that dropped
+    async def pending_offer(self, room, user_id):
+        session = self.sessions.get(user_id)
+        if session is None or session.room != room or not session.negotiating:
+            return None
+        return session.offer
+
+    async def leave(self, room, user_id):
+        session = self.sessions.get(user_id)
+        if session is not None and session.room == room:
+            await self._remove(session)
+
+    # Relay every track of publisher to subscriber that it doesn't already receive
+    def _subscribe(self, subscriber, publisher):
+        current = {entry[1] for entry in subscriber.outgoing.values() if entry is not None}
+        added = False
+        for track in publisher.published:
+            if track in current:
+                continue
+            relayed = self.relay.subscribe(track, buffered=False)
+            if track.kind == 'video':
+                relayed = LayeredVideoTrack(relayed, subscriber.layers.get(publisher.user_id))
+            transceiver = next((t for t, entry in subscriber.outgoing.items() if entry is None and t.kind == track.kind), None)
+            if transceiver is None:
+                transceiver = subscriber.pc.addTransceiver(relayed, direction='sendonly')
+            else:
+                transceiver.sender.replaceTrack(relayed)
+            subscriber.outgoing[transceiver] = (publisher.user_id, track, relayed)
+            added = True
+        return added
+
+    # Offer the current subscriptions, or flag a renegotiation if an offer is still outstanding.
+    # An offer left unanswered past offer_timeout (lost, or the client failed to apply it) is
+    # replaced rather than blocking the subscriber's renegotiations for good.
+    async def _offer(self, session):
+        if session.negotiating and time.monotonic() - session.offered_at < self.offer_timeout:
+            session.renegotiate = True
+            return None
+        session.negotiating = True
+        session.renegotiate = False
+        await session.pc.setLocalDescription(await session.pc.createOffer())
+        session.offer = {
+            'room': session.room,
+            'offer': {'sdp': session.pc.localDescription.sdp, 'type': session.pc.localDescription.type},
+            'tracks': {t.mid: entry[0] for t, entry in session.outgoing.items() if entry is not None}
+        }
+        session.offered_at = time.monotonic()
+        return session.offer
+
+    async def _remove(self, session):
+        members = self.rooms.get(session.room, {})
+        if members.get(session.user_id) is session:
+            del members[session.user_id]
+        if not members:
+            self.rooms.pop(session.room, None)
+        if self.sessions.get(session.user_id) is session:
+            del self.sessions[session.user_id]
+        for other in members.values():
+            for transceiver, entry in other.outgoing.items():
+                if entry is not None and entry[0] == session.user_id:
+                    transceiver.sender.replaceTrack(None)
+                    entry[2].stop()
+                    other.outgoing[transceiver] = None
+        for entry in session.outgoing.values():
+            if entry is not None:
+                entry[2].stop()
+        for other in members.values():
+            other.layers.pop(session.user_id, None)
+        await session.pc.close()
+
+# Store connected users, chat history, and files
+if app.config['SHARED_STATE_URL']:
+    import redis
+    shared_state = redis.Redis.from_url(app.config['SHARED_STATE_URL'], decode_responses=True)
+    presence = RedisPresenceRegistry(shared_state)
+    chat_history = RedisChatHistoryStore(shared_state, app.config['CHAT_HISTORY_PER_ROOM'], app.config['CHAT_HISTORY_PAGE_SIZE'])
+    logger.info(f"Presence, chat history and dominant speaker shared through {app.config['SHARED_STATE_URL']}")
+else:
+    presence = PresenceRegistry()
+    chat_history = ChatHistoryStore(
+        app.config['CHAT_HISTORY_PER_ROOM'],
+        app.config['CHAT_HISTORY_BUDGET'],
+        app.config['CHAT_HISTORY_PAGE_SIZE']
+    )
+# Worker processes in a scale-out deployment share the spool directory
+files = FileStore(
+    app.config['FILE_STORE_DIR'],
+    app.config['MAX_FILE_SIZE'],
+    app.config['MAX_CHUNKED_FILE_SIZE'],
+    app.config['FILE_TTL'],
+    app.config['FILE_STORE_BUDGET'],
+    app.config['MAX_PENDING_UPLOADS'],
+    shared=app.config['MESSAGE_QUEUE'] is not None
+)
+if app.config['TOPOLOGY'] == 'sfu' and (RTCPeerConnection is None or socketio.async_mode != 'threading'
+                                         or app.config['MESSAGE_QUEUE']):
+    logger.error("SFU topology needs aiortc, the threading async mode and a single process; using mesh")
+    app.config['TOPOLOGY'] = 'mesh'
+sfu = SfuRouter(app.config['SFU_STUN_SERVER'], app.config['SFU_OFFER_TIMEOUT'])
+speaker_args = (app.config['DOMINANT_SPEAKER_MAX_DBOV'], app.config['DOMINANT_SPEAKER_STALE'], app.config['DOMINANT_SPEAKER_HOLD'])
+speakers = RedisSpeakerTracker(shared_state, *speaker_args) if app.config['SHARED_STATE_URL'] else SpeakerTracker(*speaker_args)
+# Without shared state each worker would pick a speaker from only its own clients' reports and
+# the room would hear conflicting answers, so server-side detection is off and only the
+# clients' own level analysis highlights speakers
+app.config['SERVER_DOMINANT_SPEAKER'] = bool(app.config['SHARED_STATE_URL'] or not app.config['MESSAGE_QUEUE'])
+if not app.config['SERVER_DOMINANT_SPEAKER']:
+    logger.warning("Dominant speaker detection is disabled: it needs EDGE2_SHARED_STATE_URL when running several workers")
+signaling_stats = {}  # {room: {'messages': n, 'messages_saved': n, 'bytes_saved': n}}
+ice_batches = {}  # {(room, from, to): [candidate, ...]} awaiting a coalesced flush
+ice_batches_lock = threading.Lock()
+
+# Function to detect local IP address
+def get_local_ip():
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        local_ip = s.getsockname()[0]
+        s.close()
+        return local_ip
+    except Exception as e:
+        logger.error(f"Error detecting local IP: {str(e)}")
+        return "127.0.0.1"  # Fallback to localhost
+
+# Clean up expired files and abandoned uploads
+def cleanup_files():
+    expired = files.expire()
+    if expired:
+        logger.info("Cleaned up %d expired files", expired)
+
+_background_tasks_started = False
+_background_tasks_lock = threading.Lock()
+
+def file_expiry_loop():
+    while True:
+        socketio.sleep(app.config['FILE_EXPIRY_INTERVAL'])
+        try:
+            cleanup_files()
+        except Exception as e:
+            logger.error(f"Error in file expiry task: {str(e)}")
+
+# Start housekeeping once per process, whether launched via __main__ or an external server
+def start_background_tasks():
+    global _background_tasks_started
+    with _background_tasks_lock:
+        if _background_tasks_started:
+            return
+        _background_tasks_started = True
+    orphans = files.discard_orphans()
+    if orphans:
+        logger.info("Removed %d files left in %s by a previous run", orphans, files.spool_dir)
+    socketio.start_background_task(file_expiry_loop)
+
+# Record a stored file in the room's chat history and tell the room about it. entry is the
+# uploader's presence, already checked to be in room.
+def announce_file(room, entry, stored):
+    message, epoch = chat_history.append(room, {
+        'user_id': entry.user_id,
+        'username': entry.username,
+        'file_id': stored.file_id,
+        'file_name': stored.name,
+        'timestamp': datetime.now().strftime("%H:%M:%S")
+    })
+    emit('chat_message', dict(message, room=room, epoch=epoch), room=room)
+
+# Free per-room state once the last participant has gone
+def release_room(room):
+    signaling_stats.pop(room, None)
+    chat_history.drop(room)
+    speakers.drop(room)
+    with ice_batches_lock:
+        for key in [key for key in ice_batches if key[0] == room]:
+            del ice_batches[key]
+
+# Take a user out of their room and tell whoever is left; returns the remaining participant count.
+# Emits through socketio so it also works from the resume grace task, outside any request.
+def remove_participant(user_id, room):
+    presence.remove(user_id)
+    participant_count = presence.count(room)
+    if participant_count == 0:
+        release_room(room)
+    if app.config['TOPOLOGY'] == 'sfu':
+        sfu.submit(sfu.leave(room, user_id))
+    if speakers.remove(room, user_id) and participant_count:
+        socketio.emit('dominant_speaker', {'room': room, 'user_id': None}, to=room)
+    socketio.emit('user_left', {'user_id': user_id, 'participant_count': participant_count, 'room': room}, to=room)
+    return participant_count
+
+# Runs as a background task after a socket drops: unless the user resumed onto a new socket within
+# the grace window, they are removed from their room for good
+def expire_session(user_id, sid):
+    socketio.sleep(app.config['SESSION_RESUME_GRACE'])
+    try:
+        entry = presence.get(user_id)
+        if entry is None or entry.sid != sid:
+            return
+        participant_count = remove_participant(user_id, entry.room)
+        metrics.inc('edge2_session_resumes_total', (('outcome', 'expired'),))
+        logger.info("User %s disconnected from room %s. Total participants: %d", user_id, entry.room, participant_count,
+                    extra={'event': 'disconnect', 'room': entry.room, 'user_id': user_id})
+    except Exception as e:
+        logger.error(f"Error in session expiry task: {str(e)}")
+
+# Approximate compact-JSON size of a signaling payload without encoding it again: string
+# lengths (the SDP dominates, with its escaped CRLFs) plus quotes, keys and punctuation
+def _estimate_json_size(value):
+    if isinstance(value, str):
+        return len(value) + value.count('\r') + value.count('\n') + 2
+    if isinstance(value, dict):
+        return sum(len(key) + 4 + _estimate_json_size(item) for key, item in value.items()) + 1
+    if isinstance(value, (list, tuple)):
+        return sum(_estimate_json_size(item) + 1 for item in value) + 1
+    return len(str(value))
+
+# Deliver an offer/answer/ICE message only to the peer named in data['to']
+def forward_signal(event, data):
+    room = data['room']
+    target = presence.member(room, data['to'])
+    if target is None:
+        logger.warning("Dropping %s for room %s: recipient %s is not in the room", event, room, data['to'], extra={'event': event})
+        return False
+    # socketio.emit rather than flask_socketio.emit so coalesced ICE batches can be flushed from a background task
+    socketio.emit(event, data, to=target.sid)
+    # A room broadcast would have reached every member except the sender; we sent one message
+    saved = max(presence.count(room) - 2, 0)
+    stats = signaling_stats.setdefault(room, {'messages': 0, 'messages_saved': 0, 'bytes_saved': 0})
+    stats['messages'] += 1
+    metrics.inc('edge2_signaling_messages_total')
+    if saved:
+        saved_bytes = saved * _estimate_json_size(data)
+        stats['messages_saved'] += saved
+        stats['bytes_saved'] += saved_bytes
+        metrics.inc('edge2_signaling_messages_saved_total', (), saved)
+        metrics.inc('edge2_signaling_bytes_saved_total', (), saved_bytes)
+    return True
+
+# Send ICE candidates to one peer as a single frame; a lone candidate keeps the original message shape
+def forward_ice_candidates(room, sender, recipient, candidates):
+    data = {'from': sender, 'to': recipient, 'room': room}
+    if len(candidates) == 1:
+        data['candidate'] = candidates[0]
+    else:
+        data['candidates'] = candidates
+    if forward_signal('ice-candidate', data):
+        metrics.inc('edge2_ice_frames_total')
+
+# Hold candidates for a (from, to) pair for ICE_COALESCE_MS; the first one in schedules the flush
+def coalesce_ice_candidates(room, sender, recipient, candidates):
+    key = (room, sender, recipient)
+    with ice_batches_lock:
+        pending = ice_batches.get(key)
+        if pending is not None:
+            pending.extend(candidates)
+            return
+        ice_batches[key] = list(candidates)
+    socketio.start_background_task(flush_ice_candidates, key)
+
+def flush_ice_candidates(key):
+    socketio.sleep(app.config['ICE_COALESCE_MS'] / 1000)
+    with ice_batches_lock:
+        candidates = ice_batches.pop(key, None)
+    if not candidates:
+        return
+    try:
+        with app.app_context():
+            limit = app.config['ICE_BATCH_MAX']
+            for start in range(0, len(candidates), limit):
+                forward_ice_candidates(*key, candidates[start:start + limit])
+    except Exception as e:
+        logger.error("Error flushing ICE candidates for room %s: %s", key[0], e)
+
+# Deliver SFU offers from SfuRouter.publish/answer to the clients they are for
+def send_sfu_offers(room, offers):
+    for user_id, payload in offers:
+        target = presence.member(room, user_id)
+        if target is not None:
+            socketio.emit('sfu_offer', payload, to=target.sid)
+
+# Headless SFU check: synthetic aiortc clients publish generated audio/video through the router and
+# each must receive frames on every other participant's video track. The first client asks for the
+# 'low' layer from everyone, so its frames must arrive downscaled. Runs on the router loop.
+async def sfu_selftest(router, participants, seconds=5):
+    from aiortc.mediastreams import AudioStreamTrack, VideoStreamTrack
+    room = f"sfu-selftest-{uuid.uuid4().hex[:8]}"
+    clients = {}
+    frames = {}  # {user_id: {track id: [frames received, last frame height]}}
+
+    async def deliver(offers):
+        for user_id, payload in offers:
+            pc = clients[user_id]
+            await pc.setRemoteDescription(RTCSessionDescription(**payload['offer']))
+            await pc.setLocalDescription(await pc.createAnswer())
+            follow_up = await router.answer(room, user_id, {'sdp': pc.localDescription.sdp, 'type': pc.localDescription.type})
+            if follow_up is not None:
+                await deliver([(user_id, follow_up)])
+
+    async def count_frames(user_id, track):
+        stats = frames[user_id][track.id] = [0, None]
+        try:
+            while True:
+                frame = await track.recv()
+                stats[0] += 1
+                stats[1] = frame.height
+        except Exception:
+            pass
+
+    try:
+        for i in range(participants):
+            user_id = f"synthetic-{i}"
+            pc = clients[user_id] = RTCPeerConnection(RTCConfiguration(iceServers=[]))
+            frames[user_id] = {}
+            if i > 0:
+                await router.set_layer(room, 'synthetic-0', user_id, VIDEO_LAYERS['low'])
+            pc.on('track', lambda track, user_id=user_id: (
+                asyncio.ensure_future(count_frames(user_id, track)) if track.kind == 'video' else None))
+            pc.addTransceiver(AudioStreamTrack(), direction='sendonly')
+            pc.addTransceiver(VideoStreamTrack(), direction='sendonly')
+            await pc.setLocalDescription(await pc.createOffer())
+            answer, offers = await router.publish(room, user_id, {'sdp': pc.localDescription.sdp, 'type': pc.localDescription.type})
+            await pc.setRemoteDescription(RTCSessionDescription(**answer))
+            await deliver(offers)
+        await asyncio.sleep(seconds)
+        ok = True
+        for user_id, tracks in frames.items():
+            receiving = sum(1 for count, _ in tracks.values() if count > 0)
+            heights = sorted({height for _, height in tracks.values() if height})
+            logger.info("SFU self-test: %s receives %d of %d remote video tracks (%d frames, heights %s)", user_id,
+                        receiving, participants - 1, sum(count for count, _ in tracks.values()), heights)
+            ok = ok and receiving == participants - 1
+            if user_id == 'synthetic-0':
+                ok = ok and all(height <= VIDEO_LAYERS['low'] for height in heights)
+        return ok
+    finally:
+        for user_id, pc in clients.items():
+            await router.leave(room, user_id)
+            await pc.close()
+
+# Pinned third-party client assets: {path under static/vendor: CDN URL}
+VENDOR_FILES = {
+    'socket.io/4.7.5/socket.io.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.7.5/socket.io.min.js',
+    'font-awesome/6.4.2/css/all.min.css': 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.2/css/all.min.css',
+}
+VENDOR_FILES.update({
+    f'font-awesome/6.4.2/webfonts/{font}.{ext}': f'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.2/webfonts/{font}.{ext}'
+    for font in ('fa-brands-400', 'fa-regular-400', 'fa-solid-900', 'fa-v4compatibility')
+    for ext in ('woff2', 'ttf')
+})
+VENDOR_FILES.update({
+    f'poppins/5.0.8/poppins-latin-{weight}-normal.woff2': f'https://cdn.jsdelivr.net/npm/@fontsource/poppins@5.0.8/files/poppins-latin-{weight}-normal.woff2'
+    for weight in (400, 500, 600, 700)
+})
+
+# Script and stylesheet URLs used by the page shell in each vendor asset mode
+VENDOR_URLS = {
+    'cdn': {
+        'socketio_url': VENDOR_FILES['socket.io/4.7.5/socket.io.min.js'],
+        'fontawesome_url': VENDOR_FILES['font-awesome/6.4.2/css/all.min.css']
+    },
+    'local': {
+        'socketio_url': '/static/vendor/socket.io/4.7.5/socket.io.min.js',
+        'fontawesome_url': '/static/vendor/font-awesome/6.4.2/css/all.min.css'
+    }
+}
+
+# Poppins font rules prepended to the client stylesheet in each vendor asset mode
+FONT_CSS = {
+    'cdn': "@import url('https://fonts.googleapis.com/css2?family=Poppins:wght@400;500;600;700&display=swap');\n",
+    'local': ''.join(
+        f"@font-face {{ font-family: 'Poppins'; font-style: normal; font-weight: {weight}; font-display: swap; "
+        f"src: url('/static/vendor/poppins/5.0.8/poppins-latin-{weight}-normal.woff2') format('woff2'); }}\n"
+        for weight in (400, 500, 600, 700)
+    )
+}
+
+# HTML shell for Edge 2 Meet; the stylesheet and script are linked as fingerprinted bundles
+INDEX_HTML = r'''
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Edge 2 Meet</title>
+    <script src="{{ socketio_url }}"></script>
+    <link rel="stylesheet" href="{{ fontawesome_url }}">
+    <link rel="stylesheet" href="{{ css_url }}">
+</head>
+<body>
+    <div id="error-message"></div>
+    <div id="notification"></div>
+    <div id="header">
+        <img src="/static/edge2systems_logo.jpg" alt="Edge 2 Systems Logo" id="logo" class="left-logo">
+        <h1>Edge 2 Meet</h1>
+        <div id="info-box">
+            <i id="recording-logo" class="fas fa-record-vinyl"></i>
+            <span id="room-id-display"></span>
+            <span id="vc-timer">00:00:00</span>
+        </div>
+        <img src="/static/indiannavy_logo.jpg" alt="Indian Navy Logo" id="logo" class="right-logo">
+    </div>
+    <div id="room-modal">
+        <div class="bg-gray-800 p-8 rounded-xl shadow-2xl w-full max-w-md">
+            <h2 class="text-2xl font-bold mb-6 text-center text-white">Join a Room</h2>
+            <div class="flex flex-col gap-4">
+                <input id="room-id" type="text" class="p-3 bg-gray-700 border border-gray-600 rounded-lg text-white placeholder-gray-400 focus:outline-none focus:ring-2 focus:ring-blue-500" placeholder="Enter Room ID">
+                <input id="username-input-room" type="text" class="p-3 bg-gray-700 border border-gray-600 rounded-lg text-white placeholder-gray-400 focus:outline-none focus:ring-2 focus:ring-blue-500" placeholder="Enter your name">
+                <button id="join-room" class="p-3 bg-blue-500 hover:bg-blue-600 rounded-lg flex items-center justify-center gap-2 text-white font-medium">
+                    <i class="fas fa-sign-in-alt"></i> Join Room
+                </button>
+            </div>
+        </div>
+    </div>
+    <div id="participants-modal">
+        <div id="participants-list">
+            <h3>Participants: <span id="participant-count-modal">0</span></h3>
+            <ul id="participants-items"></ul>
+            <div id="participants-close">Close</div>
+        </div>
+    </div>
+    <div id="settings-modal">
+        <div id="settings-content">
+            <h3>Settings</h3>
+            <label for="microphone-select">Microphone:</label>
+            <select id="microphone-select">
+                <option value="">Select Microphone</option>
+            </select>
+            <label for="camera-select">Camera:</label>
+            <select id="camera-select">
+                <option value="">Select Camera</option>
+            </select>
+            <label for="quality-select">Video Quality:</label>
+            <select id="quality-select">
+                <option value="high">High (1080p, 60fps)</option>
+                <option value="standard" selected>Standard (720p, 30fps)</option>
+                <option value="medium">Medium (480p, 30fps)</option>
+                <option value="low">Low (360p, 15fps)</option>
+            </select>
+            <div id="settings-close">Close</div>
+        </div>
+    </div>
+    <div id="main-ui" class="flex flex-col items-center p-4">
+        <div class="w-full max-w-full flex flex-col items-center space-y-6">
+            <div id="videos"></div>
+            <div id="grid-pager">
+                <button id="grid-prev" title="Previous page"><i class="fas fa-chevron-left"></i></button>
+                <span id="grid-page-label">1 / 1</span>
+                <button id="grid-next" title="Next page"><i class="fas fa-chevron-right"></i></button>
+            </div>
+        </div>
+    </div>
+    <div id="chat-section">
+        <div id="chat-header">
+            <h3 class="text-lg font-semibold">Chat</h3>
+            <i id="chat-close" class="fas fa-times fa-lg"></i>
+        </div>
+        <div id="chat-alert"></div>
+        <div id="chat-messages"></div>
+        <div class="flex">
+            <input id="chat-input" type="text" class="flex-1" placeholder="Type a message...">
+            <button id="send-chat" class="flex items-center gap-2">
+                <i class="fas fa-paper-plane"></i>
+            </button>
+        </div>
+    </div>
+    <div id="bottom-toolbar">
+        <div class="badge" id="participant-count">
+            <i class="fas fa-users"></i> Participants: 0
+        </div>
+        <button id="mute-audio" class="control-btn">
+            <i class="fas fa-microphone"></i> Mute Audio
+        </button>
+        <button id="mute-video" class="control-btn">
+            <i class="fas fa-video"></i> Mute Video
+        </button>
+        <button id="share-screen" class="control-btn">
+            <i class="fas fa-desktop"></i> Share Screen
+        </button>
+        <button id="record" class="control-btn">
+            <i class="fas fa-record-vinyl"></i> Start Recording
+        </button>
+        <button id="toggle-chat" class="control-btn">
+            <i class="fas fa-comments"></i> Chat
+            <span id="unread-badge">0</span>
+        </button>
+        <button id="toggle-file-transfer" class="control-btn">
+            <i class="fas fa-file-upload"></i> File Transfer
+        </button>
+        <button id="settings-btn" class="control-btn">
+            <i class="fas fa-cog"></i> Settings
+        </button>
+        <button id="leave-meeting-btn" class="control-btn">
+            <i class="fas fa-phone-slash"></i> Leave Meeting
+        </button>
+    </div>
+    <div id="file-transfer-section" class="hidden">
+        <div class="flex flex-col gap-3">
+            <input type="file" id="file-input">
+            <button id="send-file" class="control-btn">
+                <i class="fas fa-paper-plane"></i> Send File
+            </button>
+            <button id="cancel-file" class="action-btn">
+                <i class="fas fa-times"></i> Cancel
+            </button>
+        </div>
+    </div>
+
+    <script>window.EDGE2_CONFIG = { maxUploadSize: {{ max_upload_size }}, topology: '{{ topology }}' };</script>
+    <script src="{{ js_url }}"></script>
+</body>
+</html>
+'''
+
+# Stylesheet for the Edge 2 Meet client
+CLIENT_CSS = r'''
+        * {
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }
+
+        body {
+            background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%);
+            color: #e2e8f0;
+            font-family: 'Poppins', sans-serif;
+            min-height: 100vh;
+            overflow-x: hidden;
+        }
+
+        #header {
+            position: fixed;
+            top: 0;
+            left: 0;
+            right: 0;
+            height: 80px;
+            background: rgba(15, 23, 42, 0.95);
+            backdrop-filter: blur(8px);
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            padding: 0 24px;
+            z-index: 200;
+            box-shadow: 0 2px 8px rgba(0, 0, 0, 0.3);
+        }
+
+        #header h1 {
+            font-size: 1.75rem;
+            font-weight: 600;
+            color: #fff;
+            margin-right: 16px;
+        }
+
+        .left-logo {
+            position: absolute;
+            left: 24px;
+            top: 20px;
+        }
+
+        .right-logo {
+            position: absolute;
+            right: 24px;
+            top: 20px;
+        }
+
+        #logo {
+            width: 40px;
+            height: 40px;
+            object-fit: contain;
+            transition: transform 0.3s ease;
+        }
+
+        #logo:hover {
+            transform: rotate(360deg);
+        }
+
+        #info-box {
+            background: rgba(30, 41, 59, 0.9);
+            backdrop-filter: blur(6px);
+            border-radius: 12px;
+            padding: 8px 16px;
+            display: flex;
+            align-items: center;
+            gap: 12px;
+            box-shadow: 0 4px 12px rgba(0, 0, 0, 0.3);
+            font-size: 0.9rem;
+            font-weight: 500;
+            color: #fff;
+            transition: transform 0.3s ease;
+        }
+
+        #info-box:hover {
+            transform: scale(1.05);
+        }
+
+        #recording-logo {
+            display: none;
+            color: #f43f5e;
+            animation: pulse 1.5s infinite;
+        }
+
+        #recording-logo.active {
+            display: inline-block;
+        }
+
+        #videos {
+            display: grid;
+            gap: 16px;
+            padding: 16px;
+            background: rgba(30, 41, 59, 0.8);
+            border-radius: 16px;
+            margin: 96px 16px 96px;
+            width: calc(100% - 32px);
+            box-sizing: border-box;
+            box-shadow: 0 6px 24px rgba(0, 0, 0, 0.4);
+            transition: width 0.3s ease;
+            /* Ensure no scrolling */
+            overflow: hidden;
+            /* Fix the height to fit the viewport */
+            height: calc(100vh - 80px - 80px - 32px); /* Subtract header (80px), toolbar (80px), and padding/margins (32px) */
+        }
+
+        #videos.chat-active {
+            width: calc(100% - 400px);
+        }
+
+        .video-container {
+            position: relative;
+            width: 100%;
+            aspect-ratio: 16 / 9;
+            border-radius: 12px;
+            overflow: hidden;
+            transition: transform 0.3s ease;
+        }
+
+        video {
+            width: 100%;
+            height: 100%;
+            background: #000;
+            border-radius: 12px;
+            border: 2px solid #475569;
+            object-fit: cover;
+            transition: border-color 0.3s ease, box-shadow 0.3s ease;
+        }
+
+        video.speaking {
+            border-color: #22c55e;
+            box-shadow: 0 0 20px rgba(34, 197, 94, 0.6);
+        }
+
+        .video-container.dominant-speaker .user-name {
+            background: rgba(22, 163, 74, 0.9);
+        }
+
+        .video-container.pinned {
+            outline: 2px solid #3b82f6;
+            outline-offset: 2px;
+        }
+
+        #grid-pager {
+            display: none;
+            position: fixed;
+            bottom: 96px;
+            left: 50%;
+            transform: translateX(-50%);
+            align-items: center;
+            gap: 12px;
+            padding: 6px 12px;
+            background: rgba(15, 23, 42, 0.85);
+            border-radius: 9999px;
+            color: #fff;
+            font-size: 0.85rem;
+            z-index: 20;
+        }
+
+        #grid-pager.active {
+            display: flex;
+        }
+
+        #grid-pager button {
+            background: none;
+            border: none;
+            color: #fff;
+            cursor: pointer;
+            padding: 4px 8px;
+        }
+
+        video:hover {
+            transform: scale(1.02);
+        }
+
+        .user-name {
+            position: absolute;
+            top: 8px;
+            left: 8px;
+            background: rgba(0, 0, 0, 0.7);
+            color: #fff;
+            padding: 4px 12px;
+            border-radius: 8px;
+            font-size: 0.85rem;
+            font-weight: 500;
+        }
+
+        .mute-indicator {
+            position: absolute;
+            bottom: 8px;
+            right: 8px;
+            background: rgba(0, 0, 0, 0.7);
+            padding: 6px;
+            border-radius: 50%;
+            color: #fff;
+            font-size: 1rem;
+            display: none;
+        }
+
+        .mute-indicator.active {
+            display: block;
+        }
+
+        .mute-indicator.audio {
+            right: 38px;
+        }
+
+        #chat-section {
+            position: fixed;
+            top: 0;
+            right: 0;
+            height: 100vh;
+            width: 360px;
+            background: rgba(30, 41, 59, 0.95);
+            backdrop-filter: blur(8px);
+            border-left: 1px solid #475569;
+            padding: 16px;
+            transform: translateX(100%);
+            transition: transform 0.3s ease;
+            z-index: 200;
+            box-shadow: -4px 0 12px rgba(0, 0, 0, 0.4);
+        }
+
+        #chat-section.active {
+            transform: translateX(0);
+        }
+
+        #chat-header {
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+            padding: 12px 0;
+            border-bottom: 1px solid #475569;
+        }
+
+        #chat-close {
+            cursor: pointer;
+            color: #94a3b8;
+            transition: color 0.2s ease;
+        }
+
+        #chat-close:hover {
+            color: #fff;
+        }
+
+        #chat-messages {
+            height: calc(100% - 120px);
+            overflow-y: auto;
+            margin-bottom: 16px;
+            display: flex;
+            flex-direction: column-reverse;
+            padding: 12px;
+        }
+
+        .message {
+            max-width: 80%;
+            margin: 8px 0;
+            padding: 12px 16px;
+            border-radius: 12px;
+            font-size: 0.9rem;
+            line-height: 1.4;
+            box-shadow: 0 2px 6px rgba(0, 0, 0, 0.2);
+            transition: transform 0.2s ease;
+        }
+
+        .message:hover {
+            transform: translateY(-2px);
+        }
+
+        .message .text {
+            word-break: break-word;
+        }
+
+        .message .timestamp {
+            font-size: 0.7rem;
+            color: #94a3b8;
+            margin-top: 4px;
+            text-align: right;
+        }
+
+        .sent {
+            align-self: flex-end;
+            background: #3b82f6;
+            color: #fff;
+        }
+
+        .received {
+            align-self: flex-start;
+            background: #475569;
+            color: #e2e8f0;
+        }
+
+        #chat-input {
+            background: #2d3748;
+            border: 1px solid #475569;
+            border-radius: 8px 0 0 8px;
+            padding: 10px;
+            color: #fff;
+            font-size: 0.9rem;
+        }
+
+        #send-chat {
+            background: #3b82f6;
+            border-radius: 0 8px 8px 0;
+            padding: 10px 16px;
+            transition: background 0.2s ease;
+        }
+
+        #send-chat:hover {
+            background: #2563eb;
+        }
+
+        #chat-alert {
+            position: absolute;
+            top: 16px;
+            left: 16px;
+            padding: 8px 16px;
+            background: #22c55e;
+            color: #fff;
+            border-radius: 8px;
+            font-size: 0.8rem;
+            display: none;
+            z-index: 250;
+            animation: pulse 2s infinite;
+        }
+
+        #bottom-toolbar {
+            position: fixed;
+            bottom: 0;
+            left: 0;
+            right: 0;
+            background: rgba(15, 23, 42, 0.95);
+            backdrop-filter: blur(8px);
+            padding: 12px;
+            display: flex;
+            justify-content: center;
+            gap: 12px;
+            flex-wrap: wrap;
+            z-index: 100;
+            box-shadow: 0 -2px 10px rgba(0, 0, 0, 0.3);
+        }
+
+        .control-btn, .action-btn {
+            display: flex;
+            align-items: center;
+            gap: 8px;
+            padding: 10px 16px;
+            border-radius: 10px;
+            background: #3b82f6;
+            color: #fff;
+            font-size: 0.9rem;
+            font-weight: 500;
+            cursor: pointer;
+            transition: all 0.3s ease;
+            box-shadow: 0 2px 6px rgba(0, 0, 0, 0.2);
+        }
+
+        .control-btn:hover, .action-btn:hover {
+            background: #2563eb;
+            transform: translateY(-2px);
+            box-shadow: 0 4px 12px rgba(0, 0, 0, 0.3);
+        }
+
+        .control-btn.active {
+            background: #f43f5e;
+        }
+
+        .control-btn.active:hover {
+            background: #e11d48;
+        }
+
+        .action-btn {
+            background: #475569;
+        }
+
+        .action-btn:hover {
+            background: #334155;
+        }
+
+        #leave-meeting-btn {
+            background: #f43f5e;
+        }
+
+        #leave-meeting-btn:hover {
+            background: #e11d48;
+        }
+
+        .badge {
+            display: flex;
+            align-items: center;
+            gap: 8px;
+            background: rgba(30, 41, 59, 0.9);
+            padding: 8px 16px;
+            border-radius: 9999px;
+            border: 1px solid #475569;
+            font-size: 0.9rem;
+            cursor: pointer;
+            transition: all 0.2s ease;
+        }
+
+        .badge:hover {
+            background: #475569;
+            transform: scale(1.05);
+        }
+
+        #toggle-chat {
+            position: relative;
+        }
+
+        #unread-badge {
+            position: absolute;
+            top: -8px;
+            right: -8px;
+            background: #f43f5e;
+            color: #fff;
+            border-radius: 50%;
+            width: 20px;
+            height: 20px;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            font-size: 0.7rem;
+            display: none;
+        }
+
+        #room-modal {
+            position: fixed;
+            top: 0;
+            left: 0;
+            width: 100%;
+            height: 100%;
+            background: rgba(0, 0, 0, 0.85);
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            z-index: 1000;
+            animation: fadeIn 0.3s ease;
+        }
+
+        #room-modal.hidden {
+            display: none;
+        }
+
+        #main-ui {
+            display: none;
+            animation: fadeIn 0.3s ease;
+        }
+
+        #main-ui.active {
+            display: flex;
+        }
+
+        #participants-modal {
+            position: fixed;
+            top: 0;
+            left: 0;
+            width: 100%;
+            height: 100%;
+            background: rgba(0, 0, 0, 0.85);
+            display: none;
+            align-items: center;
+            justify-content: center;
+            z-index: 1000;
+        }
+
+        #participants-modal.active {
+            display: flex;
+        }
+
+        #participants-list {
+            background: rgba(30, 41, 59, 0.95);
+            padding: 24px;
+            border-radius: 16px;
+            max-width: 400px;
+            width: 90%;
+            max-height: 80vh;
+            overflow-y: auto;
+            border: 1px solid #475569;
+            box-shadow: 0 6px 24px rgba(0, 0, 0, 0.4);
+        }
+
+        #participants-list h3 {
+            font-size: 1.5rem;
+            font-weight: 600;
+            color: #fff;
+            margin-bottom: 16px;
+        }
+
+        #participants-list ul {
+            list-style: none;
+            padding: 0;
+        }
+
+        #participants-list li {
+            padding: 12px 0;
+            border-bottom: 1px solid #475569;
+            display: flex;
+            justify-content: space-between;
+            font-size: 0.9rem;
+            color: #e2e8f0;
+        }
+
+        #participants-close {
+            margin-top: 16px;
+            padding: 10px 20px;
+            background: #3b82f6;
+            border-radius: 10px;
+            text-align: center;
+            cursor: pointer;
+            color: #fff;
+            font-weight: 500;
+            transition: background 0.2s ease;
+        }
+
+        #participants-close:hover {
+            background: #2563eb;
+        }
+
+        #file-transfer-section {
+            position: fixed;
+            bottom: 96px;
+            right: 16px;
+            background: rgba(30, 41, 59, 0.95);
+            backdrop-filter: blur(8px);
+            padding: 16px;
+            border-radius: 12px;
+            width: 300px;
+            box-shadow: 0 4px 16px rgba(0, 0, 0, 0.4);
+            z-index: 150;
+            transition: all 0.3s ease;
+        }
+
+        #file-transfer-section.hidden {
+            display: none;
+        }
+
+        #file-input {
+            background: #2d3748;
+            border: 1px solid #475569;
+            border-radius: 8px;
+            padding: 8px;
+            color: #fff;
+            font-size: 0.85rem;
+        }
+
+        #error-message, #notification {
+            position: fixed;
+            top: 16px;
+            right: 16px;
+            padding: 12px 24px;
+            border-radius: 10px;
+            z-index: 300;
+            display: none;
+            max-width: 300px;
+            font-size: 0.9rem;
+            animation: slideIn 0.3s ease;
+        }
+
+        #error-message {
+            background: #f43f5e;
+            color: #fff;
+        }
+
+        #notification {
+            background: #22c55e;
+            color: #fff;
+        }
+
+        #settings-modal {
+            position: fixed;
+            top: 0;
+            left: 0;
+            width: 100%;
+            height: 100%;
+            background: rgba(0, 0, 0, 0.85);
+            display: none;
+            align-items: center;
+            justify-content: center;
+            z-index: 1000;
+        }
+
+        #settings-modal.active {
+            display: flex;
+        }
+
+        #settings-content {
+            background: rgba(30, 41, 59, 0.95);
+            padding: 24px;
+            border-radius: 16px;
+            max-width: 400px;
+            width: 90%;
+            border: 1px solid #475569;
+            box-shadow: 0 6px 24px rgba(0, 0, 0, 0.4);
+        }
+
+        #settings-content h3 {
+            font-size: 1.5rem;
+            font-weight: 600;
+            color: #fff;
+            margin-bottom: 16px;
+        }
+
+        #settings-content label {
+            display: block;
+            margin-bottom: 8px;
+            font-size: 0.9rem;
+            color: #e2e8f0;
+        }
+
+        #settings-content select {
+            width: 100%;
+            padding: 10px;
+            background: #2d3748;
+            border: 1px solid #475569;
+            border-radius: 8px;
+            color: #e2e8f0;
+            font-size: 0.9rem;
+            margin-bottom: 16px;
+        }
+
+        #settings-close {
+            margin-top: 16px;
+            padding: 10px 20px;
+            background: #3b82f6;
+            border-radius: 10px;
+            text-align: center;
+            cursor: pointer;
+            color: #fff;
+            font-weight: 500;
+            transition: background 0.2s ease;
+        }
+
+        #settings-close:hover {
+            background: #2563eb;
+        }
+
+        @media (max-width: 768px) {
+            #videos {
+                margin: 88px 8px 80px;
+                padding: 8px;
+                gap: 8px;
+                width: calc(100% - 16px);
+            }
+
+            #videos.chat-active {
+                width: 100%;
+            }
+
+            #chat-section {
+                width: 100%;
+                max-width: 100%;
+            }
+
+            #header {
+                padding: 0 16px;
+                height: 72px;
+            }
+
+            .left-logo {
+                top: 16px;
+            }
+
+            .right-logo {
+                top: 16px;
+            }
+
+            #info-box {
+                font-size: 0.8rem;
+                padding: 6px 12px;
+            }
+
+            .control-btn, .action-btn {
+                padding: 8px 12px;
+                font-size: 0.8rem;
+            }
+
+            #file-transfer-section {
+                width: 280px;
+                right: 8px;
+            }
+        }
+
+        @media (max-width: 480px) {
+            #header h1 {
+                font-size: 1.4rem;
+            }
+
+            #logo {
+                width: 32px;
+                height: 32px;
+            }
+
+            #info-box {
+                font-size: 0.75rem;
+                padding: 4px 8px;
+            }
+
+            .badge {
+                padding: 6px 12px;
+                font-size: 0.8rem;
+            }
+
+            #participants-list, #settings-content {
+                padding: 16px;
+                max-width: 90%;
+            }
+        }
+
+        @keyframes fadeIn {
+            from { opacity: 0; }
+            to { opacity: 1; }
+        }
+
+        @keyframes slideIn {
+            from { transform: translateX(100%); opacity: 0; }
+            to { transform: translateX(0); opacity: 1; }
+        }
+
+        @keyframes pulse {
+            0% { transform: scale(1); }
+            50% { transform: scale(1.1); }
+            100% { transform: scale(1); }
+        }
+
+        @keyframes pop {
+            0% { transform: scale(0.8); opacity: 0; }
+            50% { transform: scale(1.05); opacity: 1; }
+            100% { transform: scale(1); opacity: 1; }
+        }
+'''
+
+# Precompiled subset of Tailwind CSS covering exactly the utility classes the client uses,
+# so the page no longer runs the Tailwind CDN compiler in the browser. Keep it in sync when
+# adding utility classes to INDEX_HTML or CLIENT_JS.
+TAILWIND_CSS = r'''
+        button, input, select { font-family: inherit; font-size: 100%; line-height: inherit; color: inherit; }
+        button { background-color: transparent; background-image: none; cursor: pointer; border: 0 solid; }
+        img, video { display: block; max-width: 100%; }
+        h1, h2, h3 { font-size: inherit; font-weight: inherit; }
+        ul { list-style: none; }
+        a { color: inherit; text-decoration: inherit; }
+        input::placeholder { opacity: 1; color: #9ca3af; }
+        .hidden { display: none; }
+        .flex { display: flex; }
+        .flex-1 { flex: 1 1 0%; }
+        .flex-col { flex-direction: column; }
+        .items-center { align-items: center; }
+        .justify-center { justify-content: center; }
+        .gap-2 { gap: 0.5rem; }
+        .gap-3 { gap: 0.75rem; }
+        .gap-4 { gap: 1rem; }
+        .space-y-6 > :not([hidden]) ~ :not([hidden]) { margin-top: 1.5rem; }
+        .w-full { width: 100%; }
+        .max-w-md { max-width: 28rem; }
+        .max-w-full { max-width: 100%; }
+        .p-3 { padding: 0.75rem; }
+        .p-4 { padding: 1rem; }
+        .p-8 { padding: 2rem; }
+        .mb-6 { margin-bottom: 1.5rem; }
+        .border { border-width: 1px; border-style: solid; }
+        .border-gray-600 { border-color: #4b5563; }
+        .rounded-lg { border-radius: 0.5rem; }
+        .rounded-xl { border-radius: 0.75rem; }
+        .bg-gray-700 { background-color: #374151; }
+        .bg-gray-800 { background-color: #1f2937; }
+        .bg-blue-500 { background-color: #3b82f6; }
+        .hover\:bg-blue-600:hover { background-color: #2563eb; }
+        .shadow-2xl { box-shadow: 0 25px 50px -12px rgba(0, 0, 0, 0.25); }
+        .text-center { text-align: center; }
+        .text-lg { font-size: 1.125rem; line-height: 1.75rem; }
+        .text-2xl { font-size: 1.5rem; line-height: 2rem; }
+        .font-medium { font-weight: 500; }
+        .font-semibold { font-weight: 600; }
+        .font-bold { font-weight: 700; }
+        .text-white { color: #fff; }
+        .text-blue-300 { color: #93c5fd; }
+        .placeholder-gray-400::placeholder { color: #9ca3af; }
+        .hover\:underline:hover { text-decoration-line: underline; }
+        .focus\:outline-none:focus { outline: 2px solid transparent; outline-offset: 2px; }
+        .focus\:ring-2:focus { box-shadow: 0 0 0 2px var(--tw-ring-color, #3b82f6); }
+        .focus\:ring-blue-500:focus { --tw-ring-color: #3b82f6; }
+'''
+
+# JavaScript client for Edge 2 Meet
+CLIENT_JS = r'''
+        // Same origin as the page, so the client follows whatever host and port the server runs on
+        const socket = io(window.location.origin, { 
+            transports: ['websocket'], 
+            reconnection: true, 
+            reconnectionAttempts: 5, 
+            reconnectionDelay: 1000 
+        });
+        const localVideo = document.createElement('video');
+        let localStream;
+        let screenStream;
+        let mediaRecorder;
+        let recordedChunks = [];
+        const peers = {};
+        const userId = Math.random().toString(36).substring(2);
+        const maxUploadSize = window.EDGE2_CONFIG.maxUploadSize;
+        // 'mesh': one RTCPeerConnection per participant; 'sfu': one connection to the server
+        const topology = window.EDGE2_CONFIG.topology;
+        let sfuPeer = null;
+        let sfuQueue = Promise.resolve();  // SFU negotiations run one at a time
+        const sfuStreams = {};
+        // Receiver-driven video layers: each receiver asks for the layer that fits its tile
+        // (height in device pixels) and the sender caps that one connection's encoding to match
+        const VIDEO_LAYERS = {
+            low: { height: 180, maxBitrate: 200000, maxFramerate: 15 },
+            medium: { height: 360, maxBitrate: 600000, maxFramerate: 30 },
+            high: { height: 720, maxBitrate: 1500000, maxFramerate: 30 },
+            full: { height: null, maxBitrate: 4000000, maxFramerate: 60 },
+            off: { height: 0, maxBitrate: 0, maxFramerate: 0 }  // tile off-page or tab hidden: sender pauses
+        };
+        const requestedLayers = {};  // {remote user_id: layer we asked them to send}
+        const remoteLayers = {};  // {remote user_id: layer they asked us to send}
+        // Steps the bandwidth controller moves between, best first; combined with the receiver's layer
+        const BANDWIDTH_LEVELS = [
+            { maxBitrate: 4000000, scaleResolutionDownBy: 1, maxFramerate: 60 },
+            { maxBitrate: 1200000, scaleResolutionDownBy: 1, maxFramerate: 30 },
+            { maxBitrate: 600000, scaleResolutionDownBy: 1.5, maxFramerate: 24 },
+            { maxBitrate: 300000, scaleResolutionDownBy: 2, maxFramerate: 15 },
+            { maxBitrate: 150000, scaleResolutionDownBy: 4, maxFramerate: 10 }
+        ];
+        const QUALITY_POLL_MS = 2000;
+        // The browser's bandwidth estimate starts low and ramps up over the first seconds of a call
+        const QUALITY_WARMUP_MS = 10000;
+        const QUALITY_BAD_SAMPLES = 2;  // consecutive bad samples before stepping down
+        const qualityState = {};  // {remote user_id, or 'sfu': {level, goodSamples, badSamples, since, bytesSent, sampledAt}}
+        let username = `User ${userId.substring(0, 6)}`;
+        let participantCount = 0;
+        let isAudioMuted = false;
+        let isVideoMuted = false;
+        let isScreenSharing = false;
+        let isRecording = false;
+        let isChatVisible = false;
+        let isFileTransferVisible = false;
+        let roomId = null;
+        let unreadMessages = 0;
+        let chatCursor = { room: null, epoch: null, seq: 0 };
+        let resumeToken = null;  // from join_room; lets a reconnected socket take the room back
+        const pendingIceCandidates = {};
+        // Local candidates are gathered in bursts; send them per peer in one 'candidates' frame
+        const outgoingIceCandidates = {};
+        const ICE_BATCH_DELAY_MS = 20;
+        // Peer lifecycle: 'disconnected' often heals by itself, so it gets a grace period before an
+        // ICE restart; restarts back off exponentially and the peer is dropped after the last one.
+        // Offer glare is settled with perfect negotiation: the polite side yields to the remote offer.
+        const DISCONNECT_GRACE_MS = 5000;
+        const ICE_RESTART_BASE_MS = 1000;
+        const ICE_RESTART_MAX_MS = 16000;
+        const ICE_RESTART_ATTEMPTS = 5;
+        const peerStates = {};  // {remote user_id: {makingOffer, restarts, graceTimer, restartTimer, troubleSince}}
+        const users = {};
+        const audioContext = new (window.AudioContext || window.webkitAudioContext)();
+        // Active-speaker detection: one timer reads every participant's level in a batch and only
+        // touches the DOM when someone starts or stops speaking
+        const SPEAKER_POLL_MS = 66;  // ~15 Hz
+        const SPEAKING_ON = 0.02;  // smoothed RMS that starts 'speaking'
+        const SPEAKING_OFF = 0.01;  // it has to drop below this...
+        const SPEAKING_HOLD_MS = 400;  // ...for this long to stop
+        const audioMonitors = {};  // {user_id: {source, analyser, samples, level, speaking, quietSince}}
+        let speakerTimer = null;
+        // The server picks the dominant speaker from everyone's own reported level. Clients with
+        // few cores skip analysing remote streams and rely on it alone.
+        const AUDIO_LEVEL_REPORT_MS = 300;
+        const LOCAL_SPEAKER_ANALYSIS = (navigator.hardwareConcurrency || 4) > 2;
+        let audioReport = { peak: 127, sentAt: 0, speaking: false };
+        let dominantSpeaker = null;
+        let currentMicrophone = '';
+        let currentCamera = '';
+        let currentVideoQuality = 'standard';
+        let vcStartTime = null;
+        let vcTimerInterval = null;
+
+        function startVCTimer() {
+            vcStartTime = Date.now();
+            const vcTimerDisplay = document.getElementById('vc-timer');
+            vcTimerInterval = setInterval(() => {
+                const elapsed = Date.now() - vcStartTime;
+                const hours = Math.floor(elapsed / 3600000);
+                const minutes = Math.floor((elapsed % 3600000) / 60000);
+                const seconds = Math.floor((elapsed % 60000) / 1000);
+                vcTimerDisplay.textContent = `${hours.toString().padStart(2, '0')}:${minutes.toString().padStart(2, '0')}:${seconds.toString().padStart(2, '0')}`;
+            }, 1000);
+        }
+
+        function stopVCTimer() {
+            if (vcTimerInterval) {
+                clearInterval(vcTimerInterval);
+                vcTimerInterval = null;
+            }
+            document.getElementById('vc-timer').textContent = '00:00:00';
+            vcStartTime = null;
+        }
+
+        function showError(message) {
+            const errorDiv = document.getElementById('error-message');
+            errorDiv.textContent = message;
+            errorDiv.style.display = 'block';
+            setTimeout(() => errorDiv.style.display = 'none', 5000);
+        }
+
+        function showNotification(message) {
+            const notificationDiv = document.getElementById('notification');
+            notificationDiv.textContent = message;
+            notificationDiv.style.display = 'block';
+            setTimeout(() => notificationDiv.style.display = 'none', 3000);
+        }
+
+        // Paged grid: only GRID_PAGE_SIZE tiles are laid out and shown. Pinned tile, self view and
+        // recent dominant speakers come first; off-page and hidden-tab video is paused at the sender.
+        const GRID_PAGE_SIZE = 9;
+        let gridPage = 0;
+        let pinnedUser = null;
+        const speakerRecency = [];  // user_ids, most recent dominant speaker first
+
+        function tileUserId(container) {
+            return container.id.replace('video-container-', '');
+        }
+
+        function tileRank(id) {
+            if (id === pinnedUser) return -2;
+            if (id === userId) return -1;
+            const recency = speakerRecency.indexOf(id);
+            return recency === -1 ? speakerRecency.length : recency;
+        }
+
+        function compareTiles(a, b) {
+            const idA = tileUserId(a);
+            const idB = tileUserId(b);
+            return tileRank(idA) - tileRank(idB) || idA.localeCompare(idB);
+        }
+
+        function updateVideoSizes() {
+            try {
+                const videosContainer = document.getElementById('videos');
+
+                if (!videosContainer) return;
+
+                const containers = Array.from(videosContainer.querySelectorAll('.video-container')).sort(compareTiles);
+
+                videosContainer.classList.toggle('chat-active', isChatVisible);
+
+                if (containers.length === 0) {
+                    videosContainer.style.display = 'none';
+                    updateGridPager(0);
+                    return;
+                }
+
+                const pages = Math.ceil(containers.length / GRID_PAGE_SIZE);
+                gridPage = Math.min(gridPage, pages - 1);
+                const first = gridPage * GRID_PAGE_SIZE;
+                const visible = containers.slice(first, first + GRID_PAGE_SIZE);
+                const count = visible.length;
+
+                const headerHeight = 80;
+                const infoBoxHeight = 48;
+                const toolbarHeight = 80;
+                const gap = 16;
+                const padding = 16;
+                const availableHeight = window.innerHeight - headerHeight - infoBoxHeight - toolbarHeight - 2 * padding;
+                const availableWidth = isChatVisible 
+                    ? window.innerWidth - 360 - 2 * padding 
+                    : window.innerWidth - 2 * padding;
+
+                let cols, rows;
+                if (count <= 3) {
+                    cols = count;
+                    rows = 1;
+                } else {
+                    cols = 3;
+                    rows = Math.ceil((count - 3) / 3) + 1;
+                }
+
+                const totalGapsX = gap * (cols - 1);
+                let videoWidth = (availableWidth - totalGapsX) / cols;
+                let videoHeight = videoWidth * (9 / 16);
+                let totalHeight = videoHeight * rows + gap * (rows - 1);
+
+                if (totalHeight > availableHeight) {
+                    videoHeight = (availableHeight - gap * (rows - 1)) / rows;
+                    videoWidth = videoHeight * (16 / 9);
+                }
+
+                cols = Math.max(cols, 1);
+                rows = Math.max(rows, 1);
+
+                videosContainer.style.display = 'grid';
+                videosContainer.style.gridTemplateColumns = `repeat(${cols}, ${videoWidth}px)`;
+                videosContainer.style.gridTemplateRows = `repeat(${rows}, ${videoHeight}px)`;
+                videosContainer.style.gap = `${gap}px`;
+                videosContainer.style.padding = `${padding}px`;
+                videosContainer.style.height = `${totalHeight + 2 * padding}px`;
+                videosContainer.style.width = isChatVisible ? 'calc(100% - 360px)' : 'calc(100% - 32px)';
+                videosContainer.style.boxSizing = 'border-box';
+                videosContainer.style.overflow = 'hidden';
+
+                // Reorder with CSS order and hide off-page tiles instead of re-appending every node
+                containers.forEach((container, index) => {
+                    const shown = index >= first && index < first + GRID_PAGE_SIZE;
+                    container.style.order = index;
+                    container.style.display = shown ? '' : 'none';
+                    container.classList.toggle('pinned', tileUserId(container) === pinnedUser);
+                    if (!shown) return;
+                    container.style.width = '100%';
+                    container.style.height = '100%';
+                    container.style.aspectRatio = '16 / 9';
+                    const video = container.querySelector('video');
+                    if (video) {
+                        video.style.width = '100%';
+                        video.style.height = '100%';
+                        video.style.objectFit = 'cover';
+                    }
+                });
+
+                updateGridPager(pages);
+                requestVideoLayers(videoHeight, visible.map(tileUserId));
+            } catch (err) {
+                showError('Failed to update video layout');
+            }
+        }
+
+        function updateGridPager(pages) {
+            document.getElementById('grid-pager').classList.toggle('active', pages > 1);
+            document.getElementById('grid-page-label').textContent = `${gridPage + 1} / ${Math.max(pages, 1)}`;
+        }
+
+        function layerForHeight(height) {
+            return Object.keys(VIDEO_LAYERS).find(layer => layer !== 'off' &&
+                (!VIDEO_LAYERS[layer].height || VIDEO_LAYERS[layer].height >= height));
+        }
+
+        // Tell each remote sender which layer our tiles need; only changes are sent
+        function requestVideoLayers(tileHeight, visibleUserIds) {
+            if (!roomId) return;
+            const visibleLayer = layerForHeight(tileHeight * (window.devicePixelRatio || 1));
+            const remoteUserIds = topology === 'sfu' ? Object.keys(sfuStreams) : Object.keys(peers);
+            remoteUserIds.forEach(remoteUserId => {
+                const layer = document.hidden || !visibleUserIds.includes(remoteUserId) ? 'off' : visibleLayer;
+                if (requestedLayers[remoteUserId] === layer) return;
+                requestedLayers[remoteUserId] = layer;
+                socket.emit('video_layer', { from: userId, to: remoteUserId, room: roomId, layer: layer });
+            });
+        }
+
+        // Cap the video encoding on one connection to whichever is lower: the layer its receiver
+        // asked for or the bandwidth controller's current level. The camera is never re-acquired.
+        async function applySenderEncoding(peer, key) {
+            const sender = peer.getSenders().find(s => s.track?.kind === 'video');
+            if (!sender) return;
+            const params = sender.getParameters();
+            if (!params.encodings || params.encodings.length === 0) return;
+            const layer = VIDEO_LAYERS[remoteLayers[key] || 'full'];
+            const level = BANDWIDTH_LEVELS[qualityState[key]?.level || 0];
+            // The receiver isn't showing us: stop encoding for it entirely
+            params.encodings[0].active = layer.height !== 0;
+            if (params.encodings[0].active) {
+                const trackHeight = sender.track.getSettings().height;
+                const layerScale = layer.height && trackHeight ? Math.max(1, trackHeight / layer.height) : 1;
+                params.encodings[0].scaleResolutionDownBy = Math.max(layerScale, level.scaleResolutionDownBy);
+                params.encodings[0].maxBitrate = Math.min(layer.maxBitrate, level.maxBitrate);
+                params.encodings[0].maxFramerate = Math.min(layer.maxFramerate, level.maxFramerate);
+            }
+            await sender.setParameters(params);
+        }
+
+        // Round-trip time, video loss reported by the receiver, the send-side bandwidth estimate and
+        // the video bytes sent so far
+        async function sampleConnectionQuality(peer) {
+            const stats = await peer.getStats();
+            const sample = { rtt: null, loss: null, available: null, bytesSent: 0, sent: null };
+            stats.forEach(report => {
+                if (report.type === 'candidate-pair' && report.nominated && report.state === 'succeeded') {
+                    sample.rtt = report.currentRoundTripTime ?? sample.rtt;
+                    sample.available = report.availableOutgoingBitrate ?? sample.available;
+                } else if (report.type === 'outbound-rtp' && report.kind === 'video') {
+                    sample.bytesSent += report.bytesSent || 0;
+                } else if (report.type === 'remote-inbound-rtp' && report.kind === 'video') {
+                    sample.loss = report.fractionLost ?? sample.loss;
+                    sample.rtt = sample.rtt ?? report.roundTripTime ?? null;
+                }
+            });
+            return sample;
+        }
+
+        // Step down after QUALITY_BAD_SAMPLES samples in a row with loss, delay or a bandwidth estimate
+        // below what we actually send (the estimate tracks the send rate, so comparing it with the
+        // level's cap would always look short); nothing steps down during the warm-up. Step up only
+        // after several clean samples.
+        function decideQuality(key, sample, now = Date.now()) {
+            const state = qualityState[key] || (qualityState[key] = {
+                level: 0, goodSamples: 0, badSamples: 0, since: now, bytesSent: null, sampledAt: null
+            });
+            if (state.bytesSent != null && now > state.sampledAt && sample.bytesSent >= state.bytesSent) {
+                sample.sent = (sample.bytesSent - state.bytesSent) * 8000 / (now - state.sampledAt);
+            }
+            state.bytesSent = sample.bytesSent;
+            state.sampledAt = now;
+            const congested = sample.available != null && sample.sent != null && sample.available < sample.sent * 0.8;
+            let reason = null;
+            if (sample.loss != null && sample.loss > 0.08) {
+                reason = 'loss';
+            } else if (sample.rtt != null && sample.rtt > 0.4) {
+                reason = 'rtt';
+            } else if (congested) {
+                reason = 'bandwidth';
+            }
+            if (reason) {
+                state.goodSamples = 0;
+                state.badSamples++;
+                if (now - state.since < QUALITY_WARMUP_MS || state.badSamples < QUALITY_BAD_SAMPLES) return null;
+                if (state.level === BANDWIDTH_LEVELS.length - 1) return null;
+                state.level++;
+                state.badSamples = 0;
+                return { direction: 'down', reason: reason };
+            }
+            state.badSamples = 0;
+            state.goodSamples++;
+            const clean = (sample.loss == null || sample.loss < 0.02) && (sample.rtt == null || sample.rtt < 0.25);
+            if (state.level > 0 && clean && state.goodSamples >= 3 &&
+                (sample.available == null || sample.sent == null || sample.available >= sample.sent)) {
+                state.level--;
+                state.goodSamples = 0;
+                return { direction: 'up', reason: 'recovered' };
+            }
+            return null;
+        }
+
+        async function runQualityController() {
+            if (!roomId) return;
+            for (const [key, peer] of outgoingPeers()) {
+                if (peer.connectionState !== 'connected') continue;
+                try {
+                    const sample = await sampleConnectionQuality(peer);
+                    const decision = decideQuality(key, sample);
+                    if (!decision) continue;
+                    await applySenderEncoding(peer, key);
+                    socket.emit('quality_decision', {
+                        room: roomId,
+                        user_id: userId,
+                        peer: key,
+                        level: qualityState[key].level,
+                        direction: decision.direction,
+                        reason: decision.reason,
+                        rtt: sample.rtt,
+                        loss: sample.loss,
+                        available_bitrate: sample.available
+                    });
+                } catch (err) {}
+            }
+        }
+
+        setInterval(runQualityController, QUALITY_POLL_MS);
+
+        function showParticipantsList() {
+            const modal = document.getElementById('participants-modal');
+            const list = document.getElementById('participants-items');
+            const countSpan = document.getElementById('participant-count-modal');
+            list.innerHTML = '';
+            countSpan.textContent = participantCount;
+            Object.entries(users).forEach(([id, user]) => {
+                const li = document.createElement('li');
+                const connectionTime = user.connection_time ? 
+                    new Date(user.connection_time).toLocaleString('en-US', { 
+                        hour: '2-digit', 
+                        minute: '2-digit', 
+                        second: '2-digit', 
+                        hour12: true 
+                    }) : 'Unknown';
+                [user.username || 'Unknown', connectionTime].forEach(text => {
+                    const span = document.createElement('span');
+                    span.textContent = text;
+                    li.appendChild(span);
+                });
+                list.appendChild(li);
+            });
+            modal.classList.add('active');
+        }
+
+        function updateMuteIndicators(user_id, audioMuted, videoMuted) {
+            const container = document.getElementById(`video-container-${user_id}`);
+            if (container) {
+                let audioIndicator = container.querySelector('.mute-indicator.audio');
+                let videoIndicator = container.querySelector('.mute-indicator.video');
+                
+                if (!audioIndicator) {
+                    audioIndicator = document.createElement('i');
+                    audioIndicator.className = 'fas fa-microphone-slash mute-indicator audio';
+                    container.appendChild(audioIndicator);
+                }
+                if (!videoIndicator) {
+                    videoIndicator = document.createElement('i');
+                    videoIndicator.className = 'fas fa-video-slash mute-indicator video';
+                    container.appendChild(videoIndicator);
+                }
+
+                audioIndicator.classList.toggle('active', audioMuted);
+                videoIndicator.classList.toggle('active', videoMuted);
+            }
+        }
+
+        function monitorAudioLevels(user_id, stream) {
+            try {
+                stopAudioMonitor(user_id);
+                if (stream.getAudioTracks().length === 0) return;
+                if (user_id !== userId && !LOCAL_SPEAKER_ANALYSIS) return;
+                if (audioContext.state === 'suspended') audioContext.resume().catch(() => {});
+                const analyser = audioContext.createAnalyser();
+                analyser.fftSize = 512;
+                const source = audioContext.createMediaStreamSource(stream);
+                source.connect(analyser);
+                audioMonitors[user_id] = {
+                    source: source,
+                    analyser: analyser,
+                    samples: new Float32Array(analyser.fftSize),
+                    level: 0,
+                    speaking: false,
+                    quietSince: 0
+                };
+                if (!speakerTimer) speakerTimer = setInterval(detectSpeakers, SPEAKER_POLL_MS);
+            } catch (err) {
+                showError(`Failed to monitor audio for user ${user_id}`);
+            }
+        }
+
+        function stopAudioMonitor(user_id) {
+            const monitor = audioMonitors[user_id];
+            if (!monitor) return;
+            monitor.source.disconnect();
+            delete audioMonitors[user_id];
+            if (Object.keys(audioMonitors).length === 0 && speakerTimer) {
+                clearInterval(speakerTimer);
+                speakerTimer = null;
+            }
+        }
+
+        // Time-domain RMS per participant, smoothed, with separate on/off thresholds and a hold time
+        function detectSpeakers() {
+            const now = performance.now();
+            for (const [user_id, monitor] of Object.entries(audioMonitors)) {
+                monitor.analyser.getFloatTimeDomainData(monitor.samples);
+                let sum = 0;
+                for (let i = 0; i < monitor.samples.length; i++) {
+                    sum += monitor.samples[i] * monitor.samples[i];
+                }
+                monitor.level = monitor.level * 0.6 + Math.sqrt(sum / monitor.samples.length) * 0.4;
+                let speaking = monitor.speaking;
+                if (users[user_id]?.audioMuted) {
+                    speaking = false;
+                } else if (monitor.level >= SPEAKING_ON) {
+                    speaking = true;
+                    monitor.quietSince = 0;
+                } else if (monitor.level < SPEAKING_OFF) {
+                    monitor.quietSince = monitor.quietSince || now;
+                    if (now - monitor.quietSince >= SPEAKING_HOLD_MS) speaking = false;
+                } else {
+                    monitor.quietSince = 0;
+                }
+                if (speaking !== monitor.speaking) {
+                    monitor.speaking = speaking;
+                    document.getElementById(`video-${user_id}`)?.classList.toggle('speaking', speaking);
+                }
+            }
+            reportAudioLevel(now);
+        }
+
+        // RFC 6464 style level: -dBov, 0 loudest, 127 silence
+        function levelToDbov(level) {
+            return Math.min(127, Math.round(-20 * Math.log10(Math.max(level, 1e-7))));
+        }
+
+        // Send our loudest level per window while speaking, plus one report when we stop
+        function reportAudioLevel(now) {
+            const monitor = audioMonitors[userId];
+            if (!monitor || !roomId) return;
+            audioReport.peak = Math.min(audioReport.peak, levelToDbov(monitor.level));
+            if (now - audioReport.sentAt < AUDIO_LEVEL_REPORT_MS) return;
+            if (monitor.speaking || audioReport.speaking) {
+                socket.emit('audio_level', { room: roomId, user_id: userId, level: monitor.speaking ? audioReport.peak : 127 });
+            }
+            audioReport = { peak: 127, sentAt: now, speaking: monitor.speaking };
+        }
+
+        // Marks the tile and fires a 'dominantspeaker' event on document for layout code
+        function setDominantSpeaker(user_id) {
+            const previous = dominantSpeaker;
+            dominantSpeaker = user_id;
+            if (user_id) {
+                const index = speakerRecency.indexOf(user_id);
+                if (index !== -1) speakerRecency.splice(index, 1);
+                speakerRecency.unshift(user_id);
+                speakerRecency.length = Math.min(speakerRecency.length, 50);
+                // Bring an off-page speaker onto the current page
+                if (document.getElementById(`video-container-${user_id}`)?.style.display === 'none') {
+                    gridPage = 0;
+                    updateVideoSizes();
+                }
+            }
+            if (previous) document.getElementById(`video-container-${previous}`)?.classList.remove('dominant-speaker');
+            if (user_id) document.getElementById(`video-container-${user_id}`)?.classList.add('dominant-speaker');
+            document.dispatchEvent(new CustomEvent('dominantspeaker', { detail: { userId: user_id, previous: previous } }));
+        }
+
+        async function populateDeviceDropdowns() {
+            try {
+                const devices = await navigator.mediaDevices.enumerateDevices();
+                const microphoneSelect = document.getElementById('microphone-select');
+                const cameraSelect = document.getElementById('camera-select');
+                
+                microphoneSelect.innerHTML = '<option value="">Select Microphone</option>';
+                cameraSelect.innerHTML = '<option value="">Select Camera</option>';
+
+                const microphones = devices.filter(device => device.kind === 'audioinput');
+                const cameras = devices.filter(device => device.kind === 'videoinput');
+
+                microphones.forEach(device => {
+                    const option = document.createElement('option');
+                    option.value = device.deviceId;
+                    option.text = device.label || `Microphone ${microphoneSelect.options.length}`;
+                    if (device.deviceId === currentMicrophone) option.selected = true;
+                    microphoneSelect.appendChild(option);
+                });
+
+                cameras.forEach(device => {
+                    const option = document.createElement('option');
+                    option.value = device.deviceId;
+                    option.text = device.label || `Camera ${cameraSelect.options.length}`;
+                    if (device.deviceId === currentCamera) option.selected = true;
+                    cameraSelect.appendChild(option);
+                });
+
+                if (microphones.length === 0) {
+                    microphoneSelect.innerHTML = '<option value="">No Microphones Available</option>';
+                }
+                if (cameras.length === 0) {
+                    cameraSelect.innerHTML = '<option value="">No Cameras Available</option>';
+                }
+            } catch (err) {
+                showError('Failed to list media devices');
+            }
+        }
+
+        // Local media pipeline. Device and quality changes stay local: tracks are swapped on the
+        // existing senders with replaceTrack, or reshaped in place with applyConstraints, so no
+        // offer/answer is exchanged and remote participants never see the stream stop.
+        function outgoingPeers() {
+            const connections = Object.entries(peers);
+            if (sfuPeer) connections.push(['sfu', sfuPeer]);
+            return connections;
+        }
+
+        async function replaceOutgoingTrack(kind, track) {
+            await Promise.all(outgoingPeers().map(async ([key, peer]) => {
+                const sender = peer.getSenders().find(s => s.track?.kind === kind);
+                if (!sender) return;
+                await sender.replaceTrack(track);
+                if (kind === 'video') await applySenderEncoding(peer, key);
+            }));
+        }
+
+        // Swap the local track of one kind, keeping its mute state; a screen share keeps priority on the video senders
+        async function setLocalTrack(kind, track) {
+            track.enabled = kind === 'audio' ? !isAudioMuted : !isVideoMuted;
+            if (!localStream) {
+                localStream = new MediaStream();
+                localVideo.srcObject = localStream;
+            }
+            const oldTrack = kind === 'audio' ? localStream.getAudioTracks()[0] : localStream.getVideoTracks()[0];
+            localStream.addTrack(track);
+            if (!(kind === 'video' && isScreenSharing)) {
+                await replaceOutgoingTrack(kind, track);
+            }
+            if (oldTrack) {
+                localStream.removeTrack(oldTrack);
+                oldTrack.stop();
+            }
+        }
+
+        async function switchMicrophone(deviceId) {
+            if (!deviceId) return;
+            try {
+                const newStream = await navigator.mediaDevices.getUserMedia({
+                    audio: {
+                        deviceId: { exact: deviceId },
+                        echoCancellation: true,
+                        noiseSuppression: true,
+                        autoGainControl: true,
+                        sampleRate: 48000
+                    }
+                });
+                await setLocalTrack('audio', newStream.getAudioTracks()[0]);
+                currentMicrophone = deviceId;
+                monitorAudioLevels(userId, localStream);
+                showNotification('Microphone switched successfully');
+            } catch (err) {
+                showError('Failed to switch microphone');
+            }
+        }
+
+        async function switchCamera(deviceId) {
+            if (!deviceId) return;
+            try {
+                const qualityConstraints = getQualityConstraints(currentVideoQuality);
+                const newStream = await navigator.mediaDevices.getUserMedia({
+                    video: { 
+                        deviceId: { exact: deviceId },
+                        width: qualityConstraints.width,
+                        height: qualityConstraints.height,
+                        frameRate: qualityConstraints.frameRate,
+                        aspectRatio: 16 / 9
+                    }
+                });
+                await setLocalTrack('video', newStream.getVideoTracks()[0]);
+                currentCamera = deviceId;
+                showNotification('Camera switched successfully');
+            } catch (err) {
+                showError('Failed to switch camera');
+            }
+        }
+
+        function getQualityConstraints(quality) {
+            switch (quality) {
+                case 'high':
+                    return { width: { ideal: 1920 }, height: { ideal: 1080 }, frameRate: { ideal: 60 } };
+                case 'standard':
+                    return { width: { ideal: 1280 }, height: { ideal: 720 }, frameRate: { ideal: 30 } };
+                case 'medium':
+                    return { width: { ideal: 854 }, height: { ideal: 480 }, frameRate: { ideal: 30 } };
+                case 'low':
+                    return { width: { ideal: 640 }, height: { ideal: 360 }, frameRate: { ideal: 15 } };
+                default:
+                    return { width: { ideal: 1280 }, height: { ideal: 720 }, frameRate: { ideal: 30 } };
+            }
+        }
+
+        // Re-shape the running camera track; the senders keep the same track
+        async function switchVideoQuality(quality) {
+            const videoTrack = localStream?.getVideoTracks()[0];
+            if (!videoTrack || quality === currentVideoQuality) return;
+            try {
+                const qualityConstraints = getQualityConstraints(quality);
+                await videoTrack.applyConstraints({
+                    width: qualityConstraints.width,
+                    height: qualityConstraints.height,
+                    frameRate: qualityConstraints.frameRate,
+                    aspectRatio: 16 / 9
+                });
+                currentVideoQuality = quality;
+                if (!isScreenSharing) {
+                    // The layer scale depends on the capture height, which just changed
+                    await Promise.all(outgoingPeers().map(([key, peer]) => applySenderEncoding(peer, key)));
+                }
+                showNotification(`Video quality set to ${quality}`);
+            } catch (err) {
+                showError('Failed to switch video quality');
+            }
+        }
+
+        async function startVideo() {
+            if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
+                showError('Your browser does not support WebRTC.');
+                return false;
+            }
+            try {
+                if (localStream) {
+                    localStream.getTracks().forEach(track => track.stop());
+                }
+
+                const qualityConstraints = getQualityConstraints(currentVideoQuality);
+                const constraints = {
+                    video: currentCamera ? { 
+                        deviceId: { exact: currentCamera },
+                        width: qualityConstraints.width,
+                        height: qualityConstraints.height,
+                        frameRate: qualityConstraints.frameRate,
+                        aspectRatio: 16 / 9
+                    } : {
+                        width: qualityConstraints.width,
+                        height: qualityConstraints.height,
+                        frameRate: qualityConstraints.frameRate,
+                        aspectRatio: 16 / 9
+                    },
+                    audio: currentMicrophone ? { 
+                        deviceId: { exact: currentMicrophone },
+                        echoCancellation: true,
+                        noiseSuppression: true,
+                        autoGainControl: true,
+                        sampleRate: 48000
+                    } : {
+                        echoCancellation: true,
+                        noiseSuppression: true,
+                        autoGainControl: true,
+                        sampleRate: 48000
+                    }
+                };
+
+                localStream = await navigator.mediaDevices.getUserMedia(constraints);
+                localVideo.srcObject = localStream;
+                localVideo.muted = true;
+                localVideo.autoplay = true;
+                localVideo.playsInline = true;
+                localVideo.id = `video-${userId}`;
+                
+                let container = document.getElementById(`video-container-${userId}`);
+                if (!container) {
+                    container = document.createElement('div');
+                    container.id = `video-container-${userId}`;
+                    container.className = 'video-container';
+                    const nameLabel = document.createElement('div');
+                    nameLabel.className = 'user-name';
+                    nameLabel.textContent = username;
+                    container.appendChild(nameLabel);
+                    container.appendChild(localVideo);
+                    document.getElementById('videos').appendChild(container);
+                } else {
+                    container.innerHTML = '';
+                    container.className = 'video-container';
+                    const nameLabel = document.createElement('div');
+                    nameLabel.className = 'user-name';
+                    nameLabel.textContent = username;
+                    container.appendChild(nameLabel);
+                    container.appendChild(localVideo);
+                }
+
+                const videoTrack = localStream.getVideoTracks()[0];
+                if (videoTrack && !currentCamera) {
+                    currentCamera = videoTrack.getSettings().deviceId;
+                }
+                const audioTrack = localStream.getAudioTracks()[0];
+                if (audioTrack && !currentMicrophone) {
+                    currentMicrophone = audioTrack.getSettings().deviceId;
+                }
+
+                await populateDeviceDropdowns();
+
+                monitorAudioLevels(userId, localStream);
+                updateMuteIndicators(userId, isAudioMuted, isVideoMuted);
+                updateVideoSizes();
+
+                return true;
+            } catch (err) {
+                showError('Media access failed. Joining without media.');
+                const container = document.createElement('div');
+                container.id = `video-container-${userId}`;
+                container.className = 'video-container';
+                const nameLabel = document.createElement('div');
+                nameLabel.className = 'user-name';
+                nameLabel.textContent = username;
+                const placeholder = document.createElement('div');
+                placeholder.style.width = '100%';
+                placeholder.style.height = '100%';
+                placeholder.style.background = '#000';
+                placeholder.style.borderRadius = '12px';
+                placeholder.style.display = 'flex';
+                placeholder.style.alignItems = 'center';
+                placeholder.style.justifyContent = 'center';
+                placeholder.style.color = '#fff';
+                placeholder.textContent = 'No Video Available';
+                container.appendChild(nameLabel);
+                container.appendChild(placeholder);
+                document.getElementById('videos').appendChild(container);
+                updateVideoSizes();
+                return false;
+            }
+        }
+
+        async function startScreenShare() {
+            try {
+                screenStream = await navigator.mediaDevices.getDisplayMedia({ video: { aspectRatio: 16 / 9 } });
+                isScreenSharing = true;
+                document.getElementById('share-screen').innerHTML = '<i class="fas fa-desktop"></i> Stop Sharing';
+                document.getElementById('share-screen').classList.add('active');
+                const videoTrack = screenStream.getVideoTracks()[0];
+                localVideo.srcObject = screenStream;
+                await replaceOutgoingTrack('video', videoTrack);
+                videoTrack.onended = stopScreenShare;
+            } catch (err) {
+                showError('Failed to share screen.');
+            }
+        }
+
+        function stopScreenShare() {
+            if (screenStream) {
+                screenStream.getTracks().forEach(track => track.stop());
+                screenStream = null;
+            }
+            isScreenSharing = false;
+            document.getElementById('share-screen').innerHTML = '<i class="fas fa-desktop"></i> Share Screen';
+            document.getElementById('share-screen').classList.remove('active');
+            localVideo.srcObject = localStream;
+            const videoTrack = localStream?.getVideoTracks()[0];
+            if (videoTrack) {
+                replaceOutgoingTrack('video', videoTrack).catch(() => {});
+            }
+        }
+
+        async function toggleRecording() {
+            if (!isRecording) {
+                try {
+                    const screenStream = await navigator.mediaDevices.getDisplayMedia({
+                        video: { displaySurface: 'browser' },
+                        audio: false
+                    });
+
+                    const mixedStream = new MediaStream();
+                    screenStream.getVideoTracks().forEach(track => mixedStream.addTrack(track));
+                    if (localStream && localStream.getAudioTracks().length) {
+                        localStream.getAudioTracks().forEach(track => mixedStream.addTrack(track));
+                    }
+
+                    mediaRecorder = new MediaRecorder(mixedStream, { mimeType: 'video/webm' });
+                    recordedChunks = [];
+                    mediaRecorder.ondataavailable = (e) => {
+                        if (e.data.size > 0) recordedChunks.push(e.data);
+                    };
+                    mediaRecorder.onstop = () => {
+                        const blob = new Blob(recordedChunks, { type: 'video/webm' });
+                        const url = URL.createObjectURL(blob);
+                        const a = document.createElement('a');
+                        a.href = url;
+                        a.download = `recording-${new Date().toISOString()}.webm`;
+                        a.click();
+                        URL.revokeObjectURL(url);
+                        screenStream.getTracks().forEach(track => track.stop());
+                    };
+
+                    mediaRecorder.start();
+                    isRecording = true;
+                    document.getElementById('record').innerHTML = '<i class="fas fa-record-vinyl"></i> Stop Recording';
+                    document.getElementById('record').classList.add('active');
+                    document.getElementById('recording-logo').classList.add('active');
+
+                    screenStream.getVideoTracks()[0].onended = () => {
+                        if (isRecording) {
+                            toggleRecording();
+                        }
+                    };
+                } catch (err) {
+                    showError('Failed to start recording.');
+                }
+            } else {
+                mediaRecorder.stop();
+                isRecording = false;
+                document.getElementById('record').innerHTML = '<i class="fas fa-record-vinyl"></i> Start Recording';
+                document.getElementById('record').classList.remove('active');
+                document.getElementById('recording-logo').classList.remove('active');
+            }
+        }
+
+        function toggleChat() {
+            isChatVisible = !isChatVisible;
+            document.getElementById('chat-section').classList.toggle('active', isChatVisible);
+            document.getElementById('videos').classList.toggle('chat-active', isChatVisible);
+            document.getElementById('toggle-chat').innerHTML = `<i class="fas fa-comments"></i> ${isChatVisible ? 'Hide Chat' : 'Chat'}<span id="unread-badge">${unreadMessages}</span>`;
+            document.getElementById('toggle-chat').classList.toggle('active', isChatVisible);
+            if (isChatVisible) {
+                unreadMessages = 0;
+                document.getElementById('unread-badge').textContent = unreadMessages;
+                document.getElementById('unread-badge').style.display = 'none';
+            }
+            updateVideoSizes();
+        }
+
+        function leaveMeeting() {
+            if (localStream) {
+                localStream.getTracks().forEach(track => track.stop());
+                localStream = null;
+            }
+            if (screenStream) {
+                screenStream.getTracks().forEach(track => track.stop());
+                screenStream = null;
+            }
+            Object.values(peers).forEach(peer => peer.close());
+            Object.keys(peers).forEach(key => delete peers[key]);
+            Object.values(peerStates).forEach(clearPeerTimers);
+            Object.keys(peerStates).forEach(key => delete peerStates[key]);
+            if (sfuPeer) {
+                sfuPeer.close();
+                sfuPeer = null;
+            }
+            Object.keys(sfuStreams).forEach(key => delete sfuStreams[key]);
+            Object.keys(pendingIceCandidates).forEach(key => delete pendingIceCandidates[key]);
+            Object.keys(audioMonitors).forEach(stopAudioMonitor);
+            dominantSpeaker = null;
+            audioReport = { peak: 127, sentAt: 0, speaking: false };
+            gridPage = 0;
+            pinnedUser = null;
+            speakerRecency.length = 0;
+            Object.keys(requestedLayers).forEach(key => delete requestedLayers[key]);
+            Object.keys(remoteLayers).forEach(key => delete remoteLayers[key]);
+            Object.keys(qualityState).forEach(key => delete qualityState[key]);
+            document.getElementById('videos').innerHTML = '';
+            document.getElementById('main-ui').classList.remove('active');
+            document.getElementById('room-modal').classList.remove('hidden');
+            document.getElementById('room-id').value = '';
+            document.getElementById('username-input-room').value = '';
+            document.getElementById('room-id').disabled = false;
+            document.getElementById('join-room').disabled = false;
+            document.getElementById('join-room').innerHTML = '<i class="fas fa-sign-in-alt"></i> Join Room';
+            if (roomId) {
+                socket.emit('leave_room', { room: roomId, user_id: userId });
+                roomId = null;
+            }
+            resumeToken = null;
+            stopVCTimer();
+            isAudioMuted = false;
+            isVideoMuted = false;
+            isScreenSharing = false;
+            isRecording = false;
+            isChatVisible = false;
+            isFileTransferVisible = false;
+            unreadMessages = 0;
+            currentMicrophone = '';
+            currentCamera = '';
+            currentVideoQuality = 'standard';
+            document.getElementById('mute-audio').innerHTML = '<i class="fas fa-microphone"></i> Mute Audio';
+            document.getElementById('mute-audio').classList.remove('active');
+            document.getElementById('mute-video').innerHTML = '<i class="fas fa-video"></i> Mute Video';
+            document.getElementById('mute-video').classList.remove('active');
+            document.getElementById('share-screen').innerHTML = '<i class="fas fa-desktop"></i> Share Screen';
+            document.getElementById('share-screen').classList.remove('active');
+            document.getElementById('record').innerHTML = '<i class="fas fa-record-vinyl"></i> Start Recording';
+            document.getElementById('record').classList.remove('active');
+            document.getElementById('toggle-chat').innerHTML = '<i class="fas fa-comments"></i> Chat<span id="unread-badge">0</span>';
+            document.getElementById('toggle-chat').classList.remove('active');
+            document.getElementById('toggle-file-transfer').innerHTML = '<i class="fas fa-file-upload"></i> File Transfer';
+            document.getElementById('toggle-file-transfer').classList.remove('active');
+            document.getElementById('chat-section').classList.remove('active');
+            document.getElementById('videos').classList.remove('chat-active');
+            document.getElementById('file-transfer-section').classList.add('hidden');
+            document.getElementById('room-id-display').textContent = '';
+            document.getElementById('recording-logo').classList.remove('active');
+            showNotification('Left the meeting');
+        }
+
+        document.getElementById('toggle-chat').addEventListener('click', toggleChat);
+
+        document.getElementById('chat-close').addEventListener('click', toggleChat);
+
+        document.getElementById('toggle-file-transfer').addEventListener('click', () => {
+            isFileTransferVisible = !isFileTransferVisible;
+            document.getElementById('file-transfer-section').classList.toggle('hidden', !isFileTransferVisible);
+            document.getElementById('toggle-file-transfer').innerHTML = `<i class="fas fa-file-upload"></i> ${isFileTransferVisible ? 'Hide File Transfer' : 'File Transfer'}`;
+            document.getElementById('toggle-file-transfer').classList.toggle('active', isFileTransferVisible);
+        });
+
+        document.getElementById('leave-meeting-btn').addEventListener('click', leaveMeeting);
+
+        // Closing the tab is a real departure; don't leave the room waiting out the resume grace window
+        window.addEventListener('pagehide', () => {
+            if (roomId) socket.emit('leave_room', { room: roomId, user_id: userId });
+        });
+
+        document.getElementById('grid-prev').addEventListener('click', () => {
+            gridPage = Math.max(gridPage - 1, 0);
+            updateVideoSizes();
+        });
+
+        document.getElementById('grid-next').addEventListener('click', () => {
+            gridPage++;
+            updateVideoSizes();
+        });
+
+        // Click a tile to pin it to the top of the first page; click again to unpin
+        document.getElementById('videos').addEventListener('click', (e) => {
+            const container = e.target.closest('.video-container');
+            if (!container) return;
+            const id = tileUserId(container);
+            pinnedUser = pinnedUser === id ? null : id;
+            gridPage = 0;
+            updateVideoSizes();
+        });
+
+        // Hidden tabs pause every remote video at its sender; audio keeps playing
+        document.addEventListener('visibilitychange', updateVideoSizes);
+
+        document.getElementById('participant-count').addEventListener('click', showParticipantsList);
+
+        document.getElementById('participants-close').addEventListener('click', () => {
+            document.getElementById('participants-modal').classList.remove('active');
+        });
+
+        document.getElementById('settings-btn').addEventListener('click', async () => {
+            await populateDeviceDropdowns();
+            document.getElementById('settings-modal').classList.add('active');
+        });
+
+        document.getElementById('settings-close').addEventListener('click', () => {
+            document.getElementById('settings-modal').classList.remove('active');
+        });
+
+        document.getElementById('microphone-select').addEventListener('change', (e) => {
+            const deviceId = e.target.value;
+            if (deviceId) switchMicrophone(deviceId);
+        });
+
+        document.getElementById('camera-select').addEventListener('change', (e) => {
+            const deviceId = e.target.value;
+            if (deviceId) switchCamera(deviceId);
+        });
+
+        document.getElementById('quality-select').addEventListener('change', (e) => {
+            const quality = e.target.value;
+            if (quality) switchVideoQuality(quality);
+        });
+
+        navigator.mediaDevices.ondevicechange = async () => {
+            await populateDeviceDropdowns();
+        };
+
+        const CRC32_TABLE = (() => {
+            const table = new Uint32Array(256);
+            for (let n = 0; n < 256; n++) {
+                let c = n;
+                for (let k = 0; k < 8; k++) {
+                    c = c & 1 ? 0xEDB88320 ^ (c >>> 1) : c >>> 1;
+                }
+                table[n] = c >>> 0;
+            }
+            return table;
+        })();
+
+        function crc32(bytes) {
+            let crc = 0xFFFFFFFF;
+            for (let i = 0; i < bytes.length; i++) {
+                crc = CRC32_TABLE[(crc ^ bytes[i]) & 0xFF] ^ (crc >>> 8);
+            }
+            return (crc ^ 0xFFFFFFFF) >>> 0;
+        }
+
+        function emitWithAck(event, payload, timeout = 15000) {
+            return new Promise((resolve, reject) => {
+                socket.timeout(timeout).emit(event, payload, (err, response) => {
+                    if (err) {
+                        reject(new Error('Server did not respond'));
+                    } else if (response && response.error) {
+                        const error = new Error(response.error);
+                        error.offset = response.offset;
+                        reject(error);
+                    } else {
+                        resolve(response);
+                    }
+                });
+            });
+        }
+
+        function waitForReconnect() {
+            if (socket.connected) return Promise.resolve();
+            return new Promise(resolve => socket.once('connect', resolve));
+        }
+
+        // Upload a file as init / chunk / commit events; on a dropped connection the
+        // upload resumes from the offset the server reports instead of starting over
+        async function uploadFile(file) {
+            let session = await emitWithAck('file_upload_init', {
+                user_id: userId,
+                room: roomId,
+                file_name: file.name,
+                size: file.size
+            });
+            const uploadId = session.upload_id;
+            let offset = session.offset;
+            let retries = 0;
+            while (offset < file.size) {
+                try {
+                    const bytes = new Uint8Array(await file.slice(offset, offset + session.chunk_size).arrayBuffer());
+                    const response = await emitWithAck('file_upload_chunk', {
+                        user_id: userId,
+                        upload_id: uploadId,
+                        offset: offset,
+                        crc32: crc32(bytes),
+                        data: bytes.buffer
+                    });
+                    offset = response.offset;
+                    retries = 0;
+                } catch (err) {
+                    if (++retries > 5) throw err;
+                    await waitForReconnect();
+                    session = await emitWithAck('file_upload_init', { user_id: userId, upload_id: uploadId });
+                    offset = session.offset;
+                }
+            }
+            return emitWithAck('file_upload_commit', { user_id: userId, upload_id: uploadId });
+        }
+
+        document.getElementById('send-file').addEventListener('click', async () => {
+            const file = document.getElementById('file-input').files[0];
+            if (!file) {
+                showError('Please select a file.');
+                return;
+            }
+            if (file.size > maxUploadSize) {
+                showError(`File size exceeds ${Math.floor(maxUploadSize / (1024 * 1024))}MB limit.`);
+                return;
+            }
+            if (!roomId) {
+                showError('Not connected to a room.');
+                return;
+            }
+            document.getElementById('file-input').value = '';
+            isFileTransferVisible = false;
+            document.getElementById('file-transfer-section').classList.add('hidden');
+            document.getElementById('toggle-file-transfer').innerHTML = '<i class="fas fa-file-upload"></i> File Transfer';
+            document.getElementById('toggle-file-transfer').classList.remove('active');
+            try {
+                await uploadFile(file);
+                showNotification(`You sent file: ${file.name}`);
+            } catch (err) {
+                showError(`Failed to send file: ${err.message}`);
+            }
+        });
+
+        document.getElementById('cancel-file').addEventListener('click', () => {
+            document.getElementById('file-input').value = '';
+            isFileTransferVisible = false;
+            document.getElementById('file-transfer-section').classList.add('hidden');
+            document.getElementById('toggle-file-transfer').innerHTML = '<i class="fas fa-file-upload"></i> File Transfer';
+            document.getElementById('toggle-file-transfer').classList.remove('active');
+        });
+
+        function queueIceCandidate(remoteUserId, candidate) {
+            let batch = outgoingIceCandidates[remoteUserId];
+            if (!batch) {
+                batch = outgoingIceCandidates[remoteUserId] = { candidates: [], timer: null };
+                batch.timer = setTimeout(() => flushIceCandidates(remoteUserId), ICE_BATCH_DELAY_MS);
+            }
+            batch.candidates.push(candidate);
+        }
+
+        function flushIceCandidates(remoteUserId) {
+            const batch = outgoingIceCandidates[remoteUserId];
+            if (!batch) return;
+            clearTimeout(batch.timer);
+            delete outgoingIceCandidates[remoteUserId];
+            if (!peers[remoteUserId] || !roomId || batch.candidates.length === 0) return;
+            socket.emit('ice-candidate', {
+                from: userId,
+                to: remoteUserId,
+                candidates: batch.candidates,
+                room: roomId
+            });
+        }
+
+        const ICE_SERVERS = [
+            { urls: 'stun:stun.l.google.com:19302' },
+            { urls: 'stun:stun1.l.google.com:19302' },
+            {
+                urls: [
+                    'turn:openrelay.metered.ca:80',
+                    'turn:openrelay.metered.ca:443',
+                    'turn:openrelay.metered.ca:443?transport=tcp'
+                ],
+                username: 'openrelayproject',
+                credential: 'openrelayproject'
+            }
+        ];
+
+        function showRemoteStream(remoteUserId, remoteStream) {
+            let container = document.getElementById(`video-container-${remoteUserId}`);
+            if (!container) {
+                container = document.createElement('div');
+                container.id = `video-container-${remoteUserId}`;
+                container.className = 'video-container';
+                container.classList.toggle('dominant-speaker', dominantSpeaker === remoteUserId);
+                const video = document.createElement('video');
+                video.id = `video-${remoteUserId}`;
+                video.autoplay = true;
+                video.playsInline = true;
+                const nameLabel = document.createElement('div');
+                nameLabel.className = 'user-name';
+                nameLabel.textContent = users[remoteUserId]?.username || `User ${remoteUserId.substring(0, 6)}`;
+                container.appendChild(nameLabel);
+                container.appendChild(video);
+                document.getElementById('videos').appendChild(container);
+            }
+
+            const video = container.querySelector('video');
+            if (video.srcObject !== remoteStream) {
+                video.srcObject = remoteStream;
+                monitorAudioLevels(remoteUserId, remoteStream);
+            }
+
+            updateVideoSizes();
+        }
+
+        // The SFU answers without trickle ICE, so our SDP has to carry the candidates
+        function waitForIceGathering(peer, timeout = 3000) {
+            if (peer.iceGatheringState === 'complete') return Promise.resolve();
+            return new Promise(resolve => {
+                const done = () => {
+                    clearTimeout(timer);
+                    peer.removeEventListener('icegatheringstatechange', check);
+                    resolve();
+                };
+                const check = () => {
+                    if (peer.iceGatheringState === 'complete') done();
+                };
+                const timer = setTimeout(done, timeout);
+                peer.addEventListener('icegatheringstatechange', check);
+            });
+        }
+
+        // Publish local tracks once; the server relays everyone else's back over the same connection
+        async function joinSfu() {
+            sfuPeer = new RTCPeerConnection({ iceServers: ICE_SERVERS });
+            sfuPeer.onconnectionstatechange = () => {
+                if (sfuPeer?.connectionState === 'failed') {
+                    showError('Lost the connection to the media server.');
+                }
+            };
+            let offer = null;
+            if (localStream) {
+                localStream.getTracks().forEach(track => {
+                    if (track.readyState === 'live') {
+                        sfuPeer.addTransceiver(track, { direction: 'sendonly', streams: [localStream] });
+                    }
+                });
+                await sfuPeer.setLocalDescription(await sfuPeer.createOffer());
+                await waitForIceGathering(sfuPeer);
+                offer = { sdp: sfuPeer.localDescription.sdp, type: sfuPeer.localDescription.type };
+            }
+            const response = await emitWithAck('sfu_publish', { room: roomId, user_id: userId, offer: offer });
+            if (response.answer) {
+                await sfuPeer.setRemoteDescription(response.answer);
+            }
+        }
+
+        async function applySfuOffer(data) {
+            if (!sfuPeer || data.room !== roomId) return;
+            await sfuPeer.setRemoteDescription(data.offer);
+            await sfuPeer.setLocalDescription(await sfuPeer.createAnswer());
+            await waitForIceGathering(sfuPeer);
+            await emitWithAck('sfu_answer', {
+                room: roomId,
+                user_id: userId,
+                answer: { sdp: sfuPeer.localDescription.sdp, type: sfuPeer.localDescription.type }
+            });
+            attachSfuTracks(data.tracks);
+        }
+
+        // The offer maps each server transceiver (by mid) to the participant whose media it carries
+        function attachSfuTracks(tracks) {
+            const byUser = {};
+            sfuPeer.getTransceivers().forEach(transceiver => {
+                const owner = tracks[transceiver.mid];
+                if (!owner || owner === userId || !transceiver.receiver.track) return;
+                (byUser[owner] = byUser[owner] || []).push(transceiver.receiver.track);
+            });
+            Object.entries(byUser).forEach(([owner, ownerTracks]) => {
+                const stream = sfuStreams[owner] || (sfuStreams[owner] = new MediaStream());
+                stream.getTracks().forEach(track => {
+                    if (!ownerTracks.includes(track)) stream.removeTrack(track);
+                });
+                ownerTracks.forEach(track => {
+                    if (!stream.getTracks().includes(track)) stream.addTrack(track);
+                });
+                showRemoteStream(owner, stream);
+            });
+        }
+
+        // Join the room on the signaling server; rejoining clients send the chat cursor they last saw
+        async function joinSignaling() {
+            const resuming = chatCursor.room === roomId;
+            const response = await emitWithAck('join_room', {
+                room: roomId,
+                user_id: userId,
+                username: username,
+                last_seq: resuming ? chatCursor.seq : 0,
+                history_epoch: resuming ? chatCursor.epoch : null
+            });
+            resumeToken = response?.resume_token || null;
+        }
+
+        // After the socket reconnects, resume the session the server held for us: peers never saw us
+        // leave, so every connection stays up. Past the grace window, drop them and join again.
+        async function resumeSession() {
+            const room = roomId;
+            try {
+                const response = await emitWithAck('resume_session', {
+                    room: room,
+                    user_id: userId,
+                    resume_token: resumeToken,
+                    last_seq: chatCursor.room === room ? chatCursor.seq : 0,
+                    history_epoch: chatCursor.room === room ? chatCursor.epoch : null
+                });
+                if (roomId !== room) return;
+                if (!response.resumed) {
+                    Object.keys(peers).forEach(removePeer);
+                    if (sfuPeer) {
+                        sfuPeer.close();
+                        sfuPeer = null;
+                    }
+                    Object.keys(sfuStreams).forEach(key => {
+                        delete sfuStreams[key];
+                        stopAudioMonitor(key);
+                        document.getElementById(`video-container-${key}`)?.remove();
+                    });
+                    updateVideoSizes();
+                    await joinSignaling();
+                    if (topology === 'sfu') {
+                        sfuQueue = sfuQueue.then(joinSfu).catch(err => {
+                            showError(`Failed to connect to the media server: ${err.message}`);
+                        });
+                    }
+                } else {
+                    participantCount = response.participant_count;
+                    document.getElementById('participant-count').innerHTML = `<i class="fas fa-users"></i> Participants: ${participantCount}`;
+                    document.getElementById('participant-count-modal').textContent = participantCount;
+                    reconcileMembers(response.members);
+                }
+                showNotification(`Rejoined room ${room}`);
+            } catch (err) {
+                showError(`Failed to rejoin room: ${err.message}`);
+            }
+        }
+
+        function isPolite(remoteUserId) {
+            return userId > remoteUserId;
+        }
+
+        // Offer to one peer; while makingOffer is set a remote offer counts as a collision
+        async function sendOffer(remoteUserId, options = {}) {
+            const peer = peers[remoteUserId];
+            const state = peerStates[remoteUserId];
+            if (!peer || !state) return;
+            try {
+                state.makingOffer = true;
+                const offer = await peer.createOffer({
+                    offerToReceiveAudio: true,
+                    offerToReceiveVideo: true,
+                    iceRestart: !!options.iceRestart
+                });
+                // The remote offer won the race and has already been answered
+                if (peer.signalingState !== 'stable') return;
+                await peer.setLocalDescription(offer);
+                socket.emit('offer', { from: userId, to: remoteUserId, offer: peer.localDescription, room: roomId });
+            } finally {
+                state.makingOffer = false;
+            }
+        }
+
+        function reportPeerReconnect(remoteUserId, stage) {
+            const state = peerStates[remoteUserId];
+            socket.emit('peer_reconnect', {
+                room: roomId,
+                user_id: userId,
+                peer: remoteUserId,
+                stage: stage,
+                attempts: state.restarts,
+                duration: state.troubleSince ? (Date.now() - state.troubleSince) / 1000 : 0
+            });
+        }
+
+        function clearPeerTimers(state) {
+            clearTimeout(state.graceTimer);
+            clearTimeout(state.restartTimer);
+            state.graceTimer = null;
+            state.restartTimer = null;
+        }
+
+        function removePeer(remoteUserId) {
+            peers[remoteUserId]?.close();
+            delete peers[remoteUserId];
+            delete pendingIceCandidates[remoteUserId];
+            if (peerStates[remoteUserId]) {
+                clearPeerTimers(peerStates[remoteUserId]);
+                delete peerStates[remoteUserId];
+            }
+            stopAudioMonitor(remoteUserId);
+            const container = document.getElementById(`video-container-${remoteUserId}`);
+            if (container) container.remove();
+            updateVideoSizes();
+        }
+
+        // Next ICE restart after an exponential, jittered backoff. Only the impolite side sends the
+        // restart offer so both ends don't offer at once; both count attempts and give up together.
+        function scheduleIceRestart(remoteUserId) {
+            const state = peerStates[remoteUserId];
+            if (!state || state.restartTimer) return;
+            clearTimeout(state.graceTimer);
+            state.graceTimer = null;
+            const backoff = Math.min(ICE_RESTART_BASE_MS * 2 ** state.restarts, ICE_RESTART_MAX_MS);
+            state.restartTimer = setTimeout(() => {
+                state.restartTimer = null;
+                const peer = peers[remoteUserId];
+                if (!peer || peerStates[remoteUserId] !== state || peer.connectionState === 'connected') return;
+                if (state.restarts >= ICE_RESTART_ATTEMPTS) {
+                    reportPeerReconnect(remoteUserId, 'failed');
+                    showError(`Lost connection to ${users[remoteUserId]?.username || remoteUserId}`);
+                    removePeer(remoteUserId);
+                    return;
+                }
+                state.restarts++;
+                reportPeerReconnect(remoteUserId, 'ice_restart');
+                if (!isPolite(remoteUserId)) {
+                    sendOffer(remoteUserId, { iceRestart: true }).catch(() => {});
+                }
+                scheduleIceRestart(remoteUserId);
+            }, backoff * (0.75 + Math.random() / 2));
+        }
+
+        function createPeer(remoteUserId) {
+            const peer = new RTCPeerConnection({ iceServers: ICE_SERVERS });
+
+            pendingIceCandidates[remoteUserId] = [];
+            if (peerStates[remoteUserId]) clearPeerTimers(peerStates[remoteUserId]);
+            const state = peerStates[remoteUserId] = {
+                makingOffer: false,
+                restarts: 0,
+                graceTimer: null,
+                restartTimer: null,
+                troubleSince: null
+            };
+
+            peer.ontrack = (event) => {
+                const [remoteStream] = event.streams;
+                if (remoteStream) showRemoteStream(remoteUserId, remoteStream);
+            };
+
+            if (localStream) {
+                localStream.getTracks().forEach(track => {
+                    if (track.readyState === 'live') {
+                        peer.addTrack(track, localStream);
+                    }
+                });
+            }
+
+            peer.onicecandidate = (event) => {
+                if (event.candidate) {
+                    const candidate = event.candidate.toJSON();
+                    if (!candidate.candidate || !candidate.sdpMid || candidate.sdpMLineIndex == null) return;
+                    queueIceCandidate(remoteUserId, candidate);
+                } else {
+                    // Gathering finished; don't hold the tail of the batch
+                    flushIceCandidates(remoteUserId);
+                }
+            };
+
+            peer.onconnectionstatechange = () => {
+                if (peers[remoteUserId] !== peer || peerStates[remoteUserId] !== state) return;
+                if (peer.connectionState === 'failed' || peer.connectionState === 'disconnected') {
+                    if (!state.troubleSince) {
+                        state.troubleSince = Date.now();
+                        reportPeerReconnect(remoteUserId, 'disconnected');
+                    }
+                    if (peer.connectionState === 'failed') {
+                        scheduleIceRestart(remoteUserId);
+                    } else if (!state.graceTimer && !state.restartTimer) {
+                        state.graceTimer = setTimeout(() => {
+                            state.graceTimer = null;
+                            if (peer.connectionState !== 'connected') scheduleIceRestart(remoteUserId);
+                        }, DISCONNECT_GRACE_MS);
+                    }
+                } else if (peer.connectionState === 'connected') {
+                    clearPeerTimers(state);
+                    if (state.troubleSince) {
+                        reportPeerReconnect(remoteUserId, 'recovered');
+                        state.troubleSince = null;
+                        state.restarts = 0;
+                        showNotification(`Reconnected to ${users[remoteUserId]?.username || remoteUserId}`);
+                    } else {
+                        showNotification(`Connected to ${users[remoteUserId]?.username || remoteUserId}`);
+                    }
+                    // A layer requested before negotiation finished could not be applied yet
+                    if (remoteLayers[remoteUserId]) {
+                        applySenderEncoding(peer, remoteUserId).catch(() => {});
+                    }
+                }
+            };
+
+            peer.onsignalingstatechange = () => {
+                if (peer.signalingState === 'stable' && pendingIceCandidates[remoteUserId]?.length > 0) {
+                    const candidates = pendingIceCandidates[remoteUserId].slice();
+                    pendingIceCandidates[remoteUserId] = [];
+                    candidates.forEach(async candidate => {
+                        try {
+                            await peer.addIceCandidate(new RTCIceCandidate(candidate));
+                        } catch (err) {}
+                    });
+                }
+            };
+
+            return peer;
+        }
+
+        document.getElementById('join-room').addEventListener('click', async () => {
+            const roomInput = document.getElementById('room-id');
+            const usernameInput = document.getElementById('username-input-room');
+            const joinButton = document.getElementById('join-room');
+            roomId = roomInput.value.trim();
+            username = usernameInput.value.trim() || `User ${userId.substring(0, 6)}`;
+            if (!roomId) {
+                showError('Please enter a valid room ID.');
+                return;
+            }
+            if (!socket.connected) {
+                showError('Not connected to the server. Please try again.');
+                return;
+            }
+            try {
+                roomInput.disabled = true;
+                usernameInput.disabled = true;
+                joinButton.disabled = true;
+                joinButton.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Joining...';
+
+                await startVideo();
+                await joinSignaling();
+
+                if (topology === 'sfu') {
+                    sfuQueue = sfuQueue.then(joinSfu).catch(err => {
+                        showError(`Failed to connect to the media server: ${err.message}`);
+                    });
+                }
+
+                document.getElementById('room-modal').classList.add('hidden');
+                document.getElementById('main-ui').classList.add('active');
+                document.getElementById('room-id-display').textContent = `${roomId}`;
+                participantCount = 1;
+                document.getElementById('participant-count').innerHTML = `<i class="fas fa-users"></i> Participants: ${participantCount}`;
+                document.getElementById('participant-count-modal').textContent = participantCount;
+                showNotification(`Joined room ${roomId} as ${username}`);
+                startVCTimer();
+            } catch (err) {
+                showError(`Failed to join room: ${err.message}`);
+                roomInput.disabled = false;
+                usernameInput.disabled = false;
+                joinButton.disabled = false;
+                joinButton.innerHTML = '<i class="fas fa-sign-in-alt"></i> Join Room';
+            }
+        });
+
+        document.getElementById('room-id').addEventListener('keypress', (e) => {
+            if (e.key === 'Enter') document.getElementById('join-room').click();
+        });
+
+        document.getElementById('username-input-room').addEventListener('keypress', (e) => {
+            if (e.key === 'Enter') document.getElementById('join-room').click();
+        });
+
+        document.getElementById('mute-audio').addEventListener('click', () => {
+            isAudioMuted = !isAudioMuted;
+            if (localStream) {
+                localStream.getAudioTracks().forEach(track => {
+                    track.enabled = !isAudioMuted;
+                });
+            }
+            document.getElementById('mute-audio').innerHTML = `<i class="fas fa-microphone${isAudioMuted ? '-slash' : ''}"></i> ${isAudioMuted ? 'Unmute' : 'Mute'} Audio`;
+            document.getElementById('mute-audio').classList.toggle('active', isAudioMuted);
+            updateMuteIndicators(userId, isAudioMuted, isVideoMuted);
+            socket.emit('update_mute_status', { user_id: userId, room: roomId, audioMuted: isAudioMuted, videoMuted: isVideoMuted });
+        });
+
+        document.getElementById('mute-video').addEventListener('click', () => {
+            isVideoMuted = !isVideoMuted;
+            if (localStream) {
+                localStream.getVideoTracks().forEach(track => {
+                    track.enabled = !isVideoMuted;
+                });
+            }
+            document.getElementById('mute-video').innerHTML = `<i class="fas fa-video${isVideoMuted ? '-slash' : ''}"></i> ${isVideoMuted ? 'Unmute' : 'Mute'} Video`;
+            document.getElementById('mute-video').classList.toggle('active', isVideoMuted);
+            updateMuteIndicators(userId, isAudioMuted, isVideoMuted);
+            socket.emit('update_mute_status', { user_id: userId, room: roomId, audioMuted: isAudioMuted, videoMuted: isVideoMuted });
+        });
+
+        document.getElementById('share-screen').addEventListener('click', () => {
+            if (isScreenSharing) {
+                stopScreenShare();
+            } else {
+                startScreenShare();
+            }
+        });
+
+        document.getElementById('record').addEventListener('click', toggleRecording);
+
+        document.getElementById('send-chat').addEventListener('click', () => {
+            const input = document.getElementById('chat-input');
+            const message = input.value.trim();
+            if (message && roomId) {
+                const timestamp = new Date().toLocaleTimeString();
+                socket.emit('chat_message', { user_id: userId, username: username, message: message, room: roomId, timestamp: timestamp });
+                input.value = '';
+            }
+        });
+
+        document.getElementById('chat-input').addEventListener('keypress', (e) => {
+            if (e.key === 'Enter') document.getElementById('send-chat').click();
+        });
+
+        function showChatAlert(message) {
+            const chatAlert = document.getElementById('chat-alert');
+            chatAlert.textContent = message;
+            chatAlert.style.display = 'block';
+            setTimeout(() => {
+                chatAlert.style.display = 'none';
+            }, 5000);
+        }
+
+        function addMessageToChat(user_id, username, message, fileId, fileName, timestamp, isNew = false) {
+            const chatMessages = document.getElementById('chat-messages');
+            const messageDiv = document.createElement('div');
+            messageDiv.className = 'message ' + (user_id === userId ? 'sent' : 'received');
+            const textSpan = document.createElement('span');
+            textSpan.className = 'text';
+            if (fileId) {
+                // Built node by node: names and ids come from other clients and must never be parsed as HTML
+                const link = document.createElement('a');
+                link.setAttribute('href', `/download/${encodeURIComponent(fileId)}`);
+                link.setAttribute('download', fileName);
+                link.className = 'text-blue-300 hover:underline';
+                link.textContent = fileName;
+                textSpan.textContent = `${username}: `;
+                textSpan.appendChild(link);
+            } else {
+                textSpan.textContent = `${username}: ${message}`;
+            }
+            const timeSpan = document.createElement('span');
+            timeSpan.className = 'timestamp';
+            timeSpan.textContent = timestamp;
+            messageDiv.appendChild(textSpan);
+            messageDiv.appendChild(timeSpan);
+            chatMessages.appendChild(messageDiv);
+            if (isNew) {
+                messageDiv.style.animation = 'pop 0.3s ease-out';
+                setTimeout(() => messageDiv.style.animation = '', 300);
+            }
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+            if (isNew && !isChatVisible && user_id !== userId) {
+                unreadMessages++;
+                document.getElementById('unread-badge').textContent = unreadMessages;
+                document.getElementById('unread-badge').style.display = 'flex';
+                showChatAlert(`New message from ${username}: ${message}`);
+            }
+        }
+
+        socket.on('connect', () => {
+            showNotification('Connected to server');
+            if (roomId && resumeToken) resumeSession();
+        });
+
+        socket.on('connect_error', () => {
+            showError('Failed to connect to server. Retrying...');
+        });
+
+        socket.on('disconnect', () => {
+            showError('Disconnected from server. Reconnecting...');
+            if (!roomId) {
+                document.getElementById('room-modal').classList.remove('hidden');
+                document.getElementById('main-ui').classList.remove('active');
+                document.getElementById('room-id').disabled = false;
+                document.getElementById('join-room').disabled = false;
+                document.getElementById('join-room').innerHTML = '<i class="fas fa-sign-in-alt"></i> Join Room';
+                stopVCTimer();
+            }
+        });
+
+        // Record a participant and, in mesh mode, offer them a connection (existing members offer
+        // to whoever joins)
+        async function addParticipant(member) {
+            users[member.user_id] = { 
+                username: member.username, 
+                connection_time: member.connection_time || new Date().toISOString(),
+                audioMuted: false,
+                videoMuted: false
+            };
+            if (topology === 'mesh' && member.user_id !== userId && localStream) {
+                try {
+                    showNotification(`Connecting to ${member.username}...`);
+                    // Someone who dropped and came back as a new session; their old connection is dead
+                    if (peers[member.user_id]) removePeer(member.user_id);
+                    peers[member.user_id] = createPeer(member.user_id);
+                    await sendOffer(member.user_id);
+                } catch (err) {
+                    showError(`Failed to connect to ${member.username}`);
+                }
+            }
+        }
+
+        function forgetParticipant(remoteUserId) {
+            delete requestedLayers[remoteUserId];
+            delete remoteLayers[remoteUserId];
+            delete qualityState[remoteUserId];
+            delete users[remoteUserId];
+            if (peers[remoteUserId]) {
+                removePeer(remoteUserId);
+            } else if (sfuStreams[remoteUserId]) {
+                delete sfuStreams[remoteUserId];
+                stopAudioMonitor(remoteUserId);
+                const container = document.getElementById(`video-container-${remoteUserId}`);
+                if (container) container.remove();
+                updateVideoSizes();
+            }
+        }
+
+        // A resumed socket missed the room's user_joined/user_left while it was away: drop whoever
+        // has gone and connect to whoever arrived
+        function reconcileMembers(members) {
+            const present = new Set(members.map(member => member.user_id));
+            new Set([...Object.keys(users), ...Object.keys(peers), ...Object.keys(sfuStreams)]).forEach(id => {
+                if (id !== userId && !present.has(id)) forgetParticipant(id);
+            });
+            members.forEach(member => {
+                const known = topology === 'mesh' ? peers[member.user_id] : users[member.user_id];
+                if (member.user_id !== userId && !known) addParticipant(member);
+            });
+            updateVideoSizes();
+        }
+
+        socket.on('user_joined', async (data) => {
+            if (data.room === roomId) {
+                participantCount = data.participant_count;
+                document.getElementById('participant-count').innerHTML = `<i class="fas fa-users"></i> Participants: ${participantCount}`;
+                document.getElementById('participant-count-modal').textContent = participantCount;
+                await addParticipant(data);
+                updateVideoSizes();
+            }
+        });
+
+        socket.on('user_left', (data) => {
+            if (data.room === roomId) {
+                participantCount = data.participant_count;
+                document.getElementById('participant-count').innerHTML = `<i class="fas fa-users"></i> Participants: ${participantCount}`;
+                document.getElementById('participant-count-modal').textContent = participantCount;
+                forgetParticipant(data.user_id);
+            }
+        });
+
+        socket.on('dominant_speaker', (data) => {
+            if (data.room === roomId && data.user_id !== dominantSpeaker) {
+                setDominantSpeaker(data.user_id);
+            }
+        });
+
+        socket.on('video_layer', (data) => {
+            if (data.to !== userId || data.room !== roomId || !VIDEO_LAYERS[data.layer]) return;
+            remoteLayers[data.from] = data.layer;
+            if (peers[data.from]) {
+                applySenderEncoding(peers[data.from], data.from).catch(() => {});
+            }
+        });
+
+        socket.on('sfu_offer', (data) => {
+            sfuQueue = sfuQueue.then(() => applySfuOffer(data)).catch(() => {
+                showError('Media server negotiation failed.');
+            });
+        });
+
+        socket.on('offer', async (data) => {
+            if (data.to === userId && data.room === roomId) {
+                let peer = peers[data.from];
+                if (!peer) {
+                    peer = createPeer(data.from);
+                    peers[data.from] = peer;
+                }
+                const state = peerStates[data.from];
+                try {
+                    // Glare: the impolite side ignores the remote offer and waits for its own answer;
+                    // the polite side rolls back its offer and answers instead
+                    const collision = state.makingOffer || peer.signalingState !== 'stable';
+                    if (collision && !isPolite(data.from)) return;
+                    if (peer.signalingState !== 'stable') {
+                        await peer.setLocalDescription({ type: 'rollback' });
+                    }
+                    await peer.setRemoteDescription(new RTCSessionDescription(data.offer));
+                    const answer = await peer.createAnswer({
+                        offerToReceiveAudio: true,
+                        offerToReceiveVideo: true
+                    });
+                    await peer.setLocalDescription(answer);
+                    socket.emit('answer', { from: userId, to: data.from, answer: peer.localDescription, room: roomId });
+                    if (pendingIceCandidates[data.from]?.length > 0) {
+                        for (const candidate of pendingIceCandidates[data.from]) {
+                            await peer.addIceCandidate(new RTCIceCandidate(candidate));
+                        }
+                        pendingIceCandidates[data.from] = [];
+                    }
+                } catch (err) {
+                    showError('WebRTC offer processing failed.');
+                }
+            }
+        });
+
+        socket.on('answer', async (data) => {
+            if (data.to === userId && data.room === roomId && peers[data.from]) {
+                const peer = peers[data.from];
+                // An answer to an offer we rolled back after losing a glare
+                if (peer.signalingState !== 'have-local-offer') return;
+                try {
+                    await peer.setRemoteDescription(new RTCSessionDescription(data.answer));
+                    if (pendingIceCandidates[data.from]?.length > 0) {
+                        for (const candidate of pendingIceCandidates[data.from]) {
+                            await peer.addIceCandidate(new RTCIceCandidate(candidate));
+                        }
+                        pendingIceCandidates[data.from] = [];
+                    }
+                } catch (err) {
+                    showError('WebRTC answer processing failed.');
+                }
+            }
+        });
+
+        socket.on('ice-candidate', async (data) => {
+            if (data.to === userId && data.room === roomId && peers[data.from]) {
+                const peer = peers[data.from];
+                const received = Array.isArray(data.candidates) ? data.candidates : [data.candidate];
+                const candidates = received.filter(c => c?.candidate && c?.sdpMid && c?.sdpMLineIndex != null);
+                if (candidates.length < received.length) {
+                    showError('Invalid ICE candidate received');
+                }
+                for (const init of candidates) {
+                    const candidate = new RTCIceCandidate(init);
+                    try {
+                        if (peer.remoteDescription && peer.remoteDescription.type && peer.signalingState === 'stable') {
+                            await peer.addIceCandidate(candidate);
+                        } else {
+                            pendingIceCandidates[data.from].push(candidate);
+                        }
+                    } catch (err) {}
+                }
+            }
+        });
+
+        // Render one page of history and keep paging until caught up with the server
+        function applyChatHistoryPage(page) {
+            if (page.room !== roomId) return;
+            if (chatCursor.room !== page.room || chatCursor.epoch !== page.epoch) {
+                document.getElementById('chat-messages').innerHTML = '';
+                chatCursor = { room: page.room, epoch: page.epoch, seq: 0 };
+            }
+            page.messages.forEach(msg => {
+                if (msg.seq <= chatCursor.seq) return;
+                addMessageToChat(msg.user_id, msg.username, msg.message, msg.file_id, msg.file_name, msg.timestamp, false);
+                chatCursor.seq = msg.seq;
+            });
+            if (page.has_more) {
+                socket.emit('chat_history_page', {
+                    room: roomId,
+                    user_id: userId,
+                    since: chatCursor.seq,
+                    history_epoch: chatCursor.epoch
+                }, (response) => {
+                    if (response && !response.error) applyChatHistoryPage(response);
+                });
+            }
+        }
+
+        socket.on('chat_history', applyChatHistoryPage);
+
+        socket.on('chat_message', (data) => {
+            if (data.room === roomId) {
+                if (data.seq && chatCursor.room === roomId) {
+                    // A room that was empty when we joined (or whose history was reclaimed since)
+                    // starts its epoch with this message; adopt it so resumes page from here
+                    if (data.epoch && chatCursor.epoch !== data.epoch) {
+                        chatCursor.epoch = data.epoch;
+                    } else if (data.seq <= chatCursor.seq) {
+                        return;
+                    }
+                    chatCursor.seq = data.seq;
+                }
+                addMessageToChat(data.user_id, data.username, data.message, data.file_id, data.file_name, data.timestamp, true);
+            }
+        });
+
+        socket.on('file_upload', (data) => {
+            if (data.room === roomId) {
+                addMessageToChat(data.user_id, data.username, null, data.file_id, data.file_name, data.timestamp, true);
+            }
+        });
+
+        socket.on('update_mute_status', (data) => {
+            if (data.room === roomId && users[data.user_id]) {
+                users[data.user_id].audioMuted = data.audioMuted;
+                users[data.user_id].videoMuted = data.videoMuted;
+                updateMuteIndicators(data.user_id, data.audioMuted, data.videoMuted);
+            }
+        });
+'''
+
+# Identity, gzip and (when available) brotli encodings of a static body, computed once
+def precompress(body):
+    bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9)}
+    if brotli is not None:
+        bodies['br'] = brotli.compress(body, quality=11)
+    return bodies
+
+# Pick the best precompressed body the client accepts and answer conditional requests
+def precompressed_response(entry, mimetype):
+    accepted = request.accept_encodings
+    encoding = next((e for e in ('br', 'gzip') if e in entry['bodies'] and accepted[e]), 'identity')
+    response = make_response(entry['bodies'][encoding])
+    response.mimetype = mimetype
+    # Each encoding is a different byte stream, so each gets its own strong ETag
+    response.set_etag(entry['etag'] if encoding == 'identity' else f"{entry['etag']}-{encoding}")
+    response.last_modified = entry['last_modified']
+    response.vary.add('Accept-Encoding')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+# Fingerprint CLIENT_CSS and CLIENT_JS; the content hash is in the file name, so browsers
+# can cache the bundles forever and a changed client simply gets a new URL
+def build_client_assets():
+    global client_assets, client_asset_urls
+    assets = {}
+    urls = {}
+    css = FONT_CSS[app.config['VENDOR_ASSETS']] + CLIENT_CSS + TAILWIND_CSS
+    for kind, source, mimetype in (('css', css, 'text/css'), ('js', CLIENT_JS, 'application/javascript')):
+        body = source.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        filename = f"app.{digest}.{kind}"
+        assets[filename] = {
+            'bodies': precompress(body),
+            'mimetype': mimetype,
+            'etag': digest,
+            'last_modified': time.time()
+        }
+        urls[kind] = f"{app.static_url_path}/bundles/{filename}"
+    client_assets = assets
+    client_asset_urls = urls
+    logger.info(f"Built client bundles: {', '.join(urls.values())}")
+
+# Render the INDEX_HTML shell once at startup and precompress it. The page does not depend on
+# the server's IP (the client connects back to whatever host served it), so it never needs
+# re-rendering when the address changes.
+def render_index_page():
+    global index_page
+    with app.app_context():
+        body = render_template_string(
+            INDEX_HTML,
+            max_upload_size=files.max_chunked_file_size,
+            topology=app.config['TOPOLOGY'],
+            css_url=client_asset_urls['css'],
+            js_url=client_asset_urls['js'],
+            **VENDOR_URLS[app.config['VENDOR_ASSETS']]
+        ).encode('utf-8')
+    index_page = {
+        'bodies': precompress(body),
+        'etag': hashlib.sha256(body).hexdigest()[:32],
+        'last_modified': time.time()
+    }
+    logger.info(f"Rendered index page ({len(body)} bytes)")
+
+# Download the pinned vendor files into static/vendor for the 'local' asset mode
+def fetch_vendor_assets():
+    vendor_dir = os.path.join(app.static_folder, 'vendor')
+    for path, url in VENDOR_FILES.items():
+        target = os.path.join(vendor_dir, path)
+        if os.path.exists(target):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        logger.info(f"Fetching {url}")
+        with urllib.request.urlopen(url, timeout=30) as response, open(target + '.part', 'wb') as f:
+            f.write(response.read())
+        os.replace(target + '.part', target)
+    logger.info(f"Vendor assets available in {vendor_dir}")
+
+def check_vendor_assets():
+    if app.config['VENDOR_ASSETS'] not in VENDOR_URLS:
+        raise ValueError(f"EDGE2_VENDOR_ASSETS must be one of {', '.join(VENDOR_URLS)}")
+    if app.config['VENDOR_ASSETS'] != 'local':
+        return
+    vendor_dir = os.path.join(app.static_folder, 'vendor')
+    missing = [path for path in VENDOR_FILES if not os.path.exists(os.path.join(vendor_dir, path))]
+    if missing:
+        logger.warning(f"{len(missing)} vendor assets missing from {vendor_dir} (e.g. {missing[0]}); run with --fetch-vendor")
+
+client_assets = {}
+client_asset_urls = {}
+index_page = {}
+check_vendor_assets()
+build_client_assets()
+render_index_page()
+logger.info(f"Server IP: {get_local_ip()}")
+
+@app.route('/')
+def index():
+    response = precompressed_response(index_page, 'text/html')
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/static/bundles/<filename>')
+def client_bundle(filename):
+    asset = client_assets.get(filename)
+    if asset is None:
+        return 'Not found', 404
+    response = precompressed_response(asset, asset['mimetype'])
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+# Vendor paths carry the pinned version, so their contents never change under a URL
+@app.route('/static/vendor/<path:filename>')
+def vendor_asset(filename):
+    response = send_from_directory(os.path.join(app.static_folder, 'vendor'), filename, max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/download/<file_id>')
+def download_file(file_id):
+    logger.info("Download request for file_id: %s", file_id)
+    entry = files.get(file_id)
+    if entry is not None:
+        try:
+            files.touch(file_id)
+            # conditional=True answers Range and If-None-Match/If-Modified-Since from the file on disk
+            return send_file(
+                entry.path,
+                mimetype='application/octet-stream',
+                as_attachment=True,
+                download_name=entry.name,
+                conditional=True,
+                etag=True,
+                last_modified=entry.timestamp
+            )
+        except Exception as e:
+            logger.error(f"Error downloading file {file_id}: {str(e)}")
+            return 'Error downloading file', 500
+    return 'File not found', 404
+
+# Keyed by room ID, and knowing a room ID is enough to join it, so this is admin-only;
+# the aggregate totals are public as counters in /metrics
+@app.route('/signaling_stats')
+def get_signaling_stats():
+    if not admin_authorized():
+        return 'Not found', 404
+    return jsonify(signaling_stats)
+
+@app.route('/file_stats')
+def get_file_stats():
+    return jsonify(files.snapshot())
+
+def admin_authorized():
+    # Header only, so the token does not end up in access logs or browser history
+    token = app.config['ADMIN_TOKEN']
+    supplied = request.headers.get('X-Admin-Token')
+    return token is not None and supplied is not None and hmac.compare_digest(supplied.encode(), token.encode())
+
+@app.route('/admin/instrumentation', methods=['GET', 'POST'])
+def admin_instrumentation():
+    if not admin_authorized():
+        return 'Not found', 404
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        if 'enabled' in body:
+            app.config['TRACE_HANDLERS'] = bool(body['enabled'])
+        if 'slow_event_ms' in body:
+            app.config['SLOW_EVENT_MS'] = float(body['slow_event_ms'])
+        logger.info("Handler tracing %s (slow threshold %.1f ms)",
+                    'enabled' if app.config['TRACE_HANDLERS'] else 'disabled', app.config['SLOW_EVENT_MS'])
+    return jsonify({'enabled': app.config['TRACE_HANDLERS'], 'slow_event_ms': app.config['SLOW_EVENT_MS']})
+
+@app.route('/admin/slow_events')
+def admin_slow_events():
+    if not admin_authorized():
+        return 'Not found', 404
+    return jsonify(list(slow_events))
+
+@app.route('/admin/profile')
+def admin_profile():
+    if not admin_authorized():
+        return 'Not found', 404
+    try:
+        seconds = float(request.args.get('seconds', 10))
+    except ValueError:
+        return 'seconds must be a number', 400
+    seconds = min(max(seconds, 0.1), 60)
+    if not 0.1 <= seconds <= 60:  # nan
+        return 'seconds must be a number', 400
+    logger.info("Sampling stacks for %.1f s", seconds)
+    response = make_response(sample_stacks(seconds))
+    response.mimetype = 'text/plain'
+    return response
+
+@app.route('/metrics')
+def get_metrics():
+    gauges = [
+        ('edge2_rooms_active', (), len(presence.rooms())),
+        ('edge2_participants', (), len(presence))
+    ]
+    # Signaling and file store totals are counters in metrics; only current levels are gauges
+    snapshot = files.snapshot()
+    gauges += [(f'edge2_file_store_{key}', (), snapshot[key]) for key in ('files', 'bytes', 'reserved_bytes', 'budget_bytes', 'uploads_in_progress')]
+    if app.config['TOPOLOGY'] == 'sfu':
+        gauges.append(('edge2_sfu_sessions', (), len(sfu.sessions)))
+    response = make_response(metrics.render(gauges))
+    response.mimetype = 'text/plain'
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+@on_event('connect')
+def handle_connect(auth=None):
+    start_background_tasks()
+
+@on_event('join_room')
+def handle_join_room(data):
+    try:
+        if not data.get('room') or not data.get('user_id'):
+            logger.error(f"Invalid join_room data: {data}")
+            emit('error', {'message': 'Missing room or user_id'})
+            return
+        room = data['room'].strip()
+        user_id = data['user_id'].strip()
+        username = data.get('username', f"User {user_id[:6]}").strip()
+        if not room or not user_id:
+            logger.error(f"Empty room or user_id: {data}")
+            emit('error', {'message': 'Room ID or user ID cannot be empty'})
+            return
+        previous = presence.get(user_id)
+        entry = presence.add(user_id, request.sid, room, username)
+        if previous is not None and previous.room != room and presence.count(previous.room) == 0:
+            release_room(previous.room)
+        join_room(room)
+        participant_count = presence.count(room)
+        emit('user_joined', {
+            'user_id': user_id,
+            'participant_count': participant_count,
+            'room': room,
+            'username': username,
+            'connection_time': entry.connection_time
+        }, room=room)
+        # Rejoining clients send the cursor they last saw and only receive what they missed;
+        # anything beyond the first page is fetched with chat_history_page
+        emit('chat_history', chat_history.history_since(
+            room, int(data.get('last_seq') or 0), epoch=data.get('history_epoch')
+        ), to=request.sid)
+        dominant = speakers.dominant(room)
+        if dominant is not None:
+            emit('dominant_speaker', {'room': room, 'user_id': dominant}, to=request.sid)
+        logger.info("User %s joined room %s with username %s. Total participants: %d", user_id, room, username, participant_count,
+                    extra={'event': 'join_room', 'room': room, 'user_id': user_id})
+        return {'resume_token': entry.resume_token}
+    except Exception as e:
+        logger.error(f"Error in join_room: {str(e)}")
+        emit('error', {'message': f'Failed to join room: {str(e)}'})
+
+@on_event('leave_room')
+def handle_leave_room(data):
+    try:
+        user_id = data['user_id']
+        room = data['room']
+        entry = presence.get(user_id)
+        if entry is not None and entry.room == room:
+            participant_count = remove_participant(user_id, room)
+            logger.info("User %s left room %s. Total participants: %d", user_id, room, participant_count,
+                        extra={'event': 'leave_room', 'room': room, 'user_id': user_id})
+    except Exception as e:
+        logger.error(f"Error in leave_room: {str(e)}")
+        emit('error', {'message': 'Failed to leave room'})
+
+# A dropped transport keeps the user's place for SESSION_RESUME_GRACE seconds, so a quick
+# reconnect resumes without the room seeing them leave; a deliberate client disconnect does not wait
+@on_event('disconnect')
+def handle_disconnect(reason=None):
+    try:
+        entry = presence.by_sid(request.sid)
+        if entry is None:
+            return
+        if app.config['SESSION_RESUME_GRACE'] > 0 and reason != 'client disconnect':
+            socketio.start_background_task(expire_session, entry.user_id, request.sid)
+            logger.info("User %s lost their connection to room %s; holding their place for %ss", entry.user_id, entry.room,
+                        app.config['SESSION_RESUME_GRACE'], extra={'event': 'disconnect', 'room': entry.room, 'user_id': entry.user_id})
+            return
+        participant_count = remove_participant(entry.user_id, entry.room)
+        logger.info("User %s disconnected from room %s. Total participants: %d", entry.user_id, entry.room, participant_count,
+                    extra={'event': 'disconnect', 'room': entry.room, 'user_id': entry.user_id})
+    except Exception as e:
+        logger.error(f"Error in disconnect: {str(e)}")
+
+# A reconnected socket picks its session back up with the token join_room returned. The room never
+# saw the user leave, so no peer connection is renegotiated; a rejected client joins again instead.
+@on_event('resume_session')
+def handle_resume_session(data):
+    try:
+        user_id = data.get('user_id')
+        room = data.get('room')
+        entry = presence.get(user_id) if user_id else None
+        if entry is None or entry.room != room or not entry.resume_token or \
+                not hmac.compare_digest(entry.resume_token, str(data.get('resume_token') or '')):
+            metrics.inc('edge2_session_resumes_total', (('outcome', 'rejected'),))
+            logger.info("Rejected session resume for user %s in room %s", user_id, room, extra={'event': 'resume_session'})
+            return {'resumed': False}
+        presence.rebind(user_id, request.sid)
+        join_room(room)
+        metrics.inc('edge2_session_resumes_total', (('outcome', 'resumed'),))
+        emit('chat_history', chat_history.history_since(
+            room, int(data.get('last_seq') or 0), epoch=data.get('history_epoch')
+        ), to=request.sid)
+        dominant = speakers.dominant(room)
+        if dominant is not None:
+            emit('dominant_speaker', {'room': room, 'user_id': dominant}, to=request.sid)
+        if app.config['TOPOLOGY'] == 'sfu':
+            offer = sfu.call(sfu.pending_offer(room, user_id))
+            if offer is not None:
+                emit('sfu_offer', offer, to=request.sid)
+        members = [{'user_id': member.user_id, 'username': member.username, 'connection_time': member.connection_time}
+                   for member in presence.members(room).values() if member is not None]
+        logger.info("User %s resumed their session in room %s. Total participants: %d", user_id, room, len(members),
+                    extra={'event': 'resume_session', 'room': room, 'user_id': user_id})
+        # The socket was outside the room meanwhile, so hand back who is in it now
+        return {'resumed': True, 'participant_count': len(members), 'members': members}
+    except Exception as e:
+        logger.error(f"Error in resume_session: {str(e)}")
+        return {'error': 'Failed to resume session'}
+
+@on_event('offer')
+def handle_offer(data):
+    try:
+        forward_signal('offer', data)
+        logger.debug("Offer forwarded for room %s from %s to %s", data['room'], data['from'], data['to'], extra={'event': 'offer'})
+    except Exception as e:
+        logger.error(f"Error in handle_offer: {str(e)}")
+        emit('error', {'message': 'Failed to process offer'})
+
+@on_event('answer')
+def handle_answer(data):
+    try:
+        forward_signal('answer', data)
+        logger.debug("Answer forwarded for room %s from %s to %s", data['room'], data['from'], data['to'], extra={'event': 'answer'})
+    except Exception as e:
+        logger.error(f"Error in handle_answer: {str(e)}")
+        emit('error', {'message': 'Failed to process answer'})
+
+@on_event('ice-candidate')
+def handle_ice_candidate(data):
+    try:
+        # Accepts a single 'candidate' or a 'candidates' array; the envelope is checked once per batch
+        required_fields = ['to', 'room', 'from']
+        missing_fields = [field for field in required_fields if not data.get(field)]
+        candidates = data.get('candidates')
+        if candidates is None:
+            candidates = [data['candidate']] if data.get('candidate') else []
+        if not candidates:
+            missing_fields.append('candidate')
+        if missing_fields:
+            logger.error("Missing ICE candidate fields: %s", missing_fields, extra={'event': 'ice-candidate'})
+            emit('error', {'message': f'Invalid ICE candidate data: missing {", ".join(missing_fields)}'})
+            return
+        if not isinstance(candidates, list) or len(candidates) > app.config['ICE_BATCH_MAX']:
+            logger.error("Rejected ICE candidate batch from %s", data['from'], extra={'event': 'ice-candidate'})
+            emit('error', {'message': f'Invalid ICE candidate data: expected at most {app.config["ICE_BATCH_MAX"]} candidates'})
+            return
+        valid = [candidate for candidate in candidates
+                 if isinstance(candidate, dict) and candidate.get('candidate') and candidate.get('sdpMid')
+                 and candidate.get('sdpMLineIndex') is not None]
+        if len(valid) < len(candidates):
+            logger.error("Dropped %s of %s malformed ICE candidates from %s", len(candidates) - len(valid),
+                         len(candidates), data['from'], extra={'event': 'ice-candidate'})
+            emit('error', {'message': f'Malformed ICE candidate: {len(candidates) - len(valid)} of {len(candidates)} dropped'})
+            if not valid:
+                return
+        metrics.inc('edge2_ice_candidates_total', value=len(valid))
+        if app.config['ICE_COALESCE_MS'] > 0:
+            coalesce_ice_candidates(data['room'], data['from'], data['to'], valid)
+        else:
+            forward_ice_candidates(data['room'], data['from'], data['to'], valid)
+        logger.debug("%s ICE candidates accepted for room %s from %s to %s", len(valid), data['room'], data['from'],
+                     data['to'], extra={'event': 'ice-candidate'})
+    except Exception as e:
+        logger.error(f"Error in handle_ice_candidate: {str(e)}")
+        emit('error', {'message': f'Failed to process ICE candidate: {str(e)}'})
+
+# SFU topology: the client's single publish offer; tracks from the rest of the room follow as sfu_offer
+@on_event('sfu_publish')
+def handle_sfu_publish(data):
+    try:
+        if app.config['TOPOLOGY'] != 'sfu':
+            return {'error': 'SFU mode is not enabled'}
+        room = data['room']
+        user_id = data['user_id']
+        entry = presence.get(user_id)
+        if entry is None or entry.room != room or entry.sid != request.sid:
+            return {'error': 'Not connected to this room'}
+        answer, offers = sfu.call(sfu.publish(room, user_id, data.get('offer')))
+        send_sfu_offers(room, offers)
+        logger.info("User %s publishing to the SFU in room %s", user_id, room, extra={'event': 'sfu_publish'})
+        return {'answer': answer}
+    except Exception as e:
+        logger.error(f"Error in handle_sfu_publish: {str(e)}")
+        return {'error': 'Failed to publish to the SFU'}
+
+@on_event('sfu_answer')
+def handle_sfu_answer(data):
+    try:
+        if app.config['TOPOLOGY'] != 'sfu':
+            return {'error': 'SFU mode is not enabled'}
+        entry = presence.get(data['user_id'])
+        if entry is None or entry.sid != request.sid:
+            return {'error': 'Not connected to this room'}
+        follow_up = sfu.call(sfu.answer(data['room'], data['user_id'], data['answer']))
+        if follow_up is not None:
+            send_sfu_offers(data['room'], [(data['user_id'], follow_up)])
+        return {}
+    except Exception as e:
+        logger.error(f"Error in handle_sfu_answer: {str(e)}")
+        return {'error': 'Failed to apply SFU answer'}
+
+# A receiver asks for the video layer that fits its tile. Mesh senders scale their own encoding;
+# in SFU mode the server scales the copy it relays to that receiver.
+@on_event('video_layer')
+def handle_video_layer(data):
+    try:
+        layer = data.get('layer')
+        if layer not in VIDEO_LAYERS or not data.get('from') or not data.get('to') or not data.get('room'):
+            emit('error', {'message': 'Invalid video layer request'})
+            return
+        metrics.inc('edge2_video_layer_requests_total', (('layer', layer),))
+        if app.config['TOPOLOGY'] == 'sfu':
+            sfu.submit(sfu.set_layer(data['room'], data['from'], data['to'], VIDEO_LAYERS[layer]))
+        else:
+            forward_signal('video_layer', data)
+        logger.debug("User %s asked %s for the %s video layer in room %s", data['from'], data['to'], layer, data['room'],
+                     extra={'event': 'video_layer'})
+    except Exception as e:
+        logger.error(f"Error in handle_video_layer: {str(e)}")
+        emit('error', {'message': 'Failed to process video layer request'})
+
+# A client's own throttled audio level; the room hears only when the dominant speaker changes
+@on_event('audio_level')
+def handle_audio_level(data):
+    try:
+        room = data['room']
+        user_id = data['user_id']
+        level = int(data['level'])
+        entry = presence.get(user_id)
+        if entry is None or entry.room != room or entry.sid != request.sid or not app.config['SERVER_DOMINANT_SPEAKER']:
+            return
+        dominant = speakers.report(room, user_id, min(max(level, 0), 127))
+        if dominant is not None:
+            metrics.inc('edge2_dominant_speaker_changes_total')
+            emit('dominant_speaker', {'room': room, 'user_id': dominant}, room=room)
+            logger.debug("Dominant speaker in room %s is now %s", room, dominant, extra={'event': 'audio_level'})
+    except Exception as e:
+        logger.error(f"Error in handle_audio_level: {str(e)}")
+
+# Clients report each step of their getStats-driven bandwidth controller; only counted and logged
+@on_event('quality_decision')
+def handle_quality_decision(data):
+    try:
+        direction = data.get('direction')
+        reason = data.get('reason')
+        if reason not in QUALITY_DECISIONS.get(direction, ()):
+            return
+        metrics.inc('edge2_quality_decisions_total', (('direction', direction), ('reason', reason)))
+        if isinstance(data.get('rtt'), (int, float)):
+            metrics.observe('edge2_quality_decision_rtt_seconds', (), float(data['rtt']))
+        logger.info("User %s stepped %s to level %s towards %s in room %s (%s; rtt %s, loss %s, available %s bps)",
+                    data.get('user_id'), direction, data.get('level'), data.get('peer'), data.get('room'), reason,
+                    data.get('rtt'), data.get('loss'), data.get('available_bitrate'), extra={'event': 'quality_decision'})
+    except Exception as e:
+        logger.error(f"Error in handle_quality_decision: {str(e)}")
+
+# Clients report each stage of a peer connection's reconnect cycle; only counted and logged
+@on_event('peer_reconnect')
+def handle_peer_reconnect(data):
+    try:
+        stage = data.get('stage')
+        if stage not in PEER_RECONNECT_STAGES:
+            return
+        metrics.inc('edge2_peer_reconnects_total', (('stage', stage),))
+        duration = data.get('duration')
+        if stage == 'recovered' and isinstance(duration, (int, float)) and duration >= 0:
+            metrics.inc('edge2_peer_recovery_seconds_total', (), float(duration))
+        logger.info("User %s connection to %s in room %s: %s (%s ICE restarts, %ss)",
+                    data.get('user_id'), data.get('peer'), data.get('room'), stage,
+                    data.get('attempts'), duration, extra={'event': 'peer_reconnect'})
+    except Exception as e:
+        logger.error(f"Error in handle_peer_reconnect: {str(e)}")
+
+@on_event('chat_message')
+def handle_chat_message(data):
+    try:
+        room = data['room']
+        entry = presence.get(data['user_id'])
+        if entry is None or entry.room != room or entry.sid != request.sid:
+            emit('error', {'message': 'Not connected to this room'})
+            return
+        # Only the fields a text message needs; file_id/file_name are set by announce_file alone
+        # and the name comes from presence, so a client cannot forge either
+        message, epoch = chat_history.append(room, {
+            'user_id': entry.user_id,
+            'username': entry.username,
+            'message': str(data['message']),
+            'timestamp': str(data.get('timestamp') or datetime.now().strftime("%H:%M:%S"))
+        })
+        emit('chat_message', dict(message, room=room, epoch=epoch), room=room)
+        logger.debug("Chat message %d in room %s from %s", message['seq'], room, entry.username, extra={'event': 'chat_message'})
+    except Exception as e:
+        logger.error(f"Error in handle_chat_message: {str(e)}")
+        emit('error', {'message': 'Failed to send chat message'})
+
+@on_event('chat_history_page')
+def handle_chat_history_page(data):
+    try:
+        room = data['room']
+        entry = presence.get(data.get('user_id'))
+        if entry is None or entry.room != room:
+            return {'error': 'Not in this room'}
+        limit = data.get('limit')
+        return chat_history.history_since(
+            room, int(data.get('since') or 0), int(limit) if limit else None, data.get('history_epoch')
+        )
+    except Exception as e:
+        logger.error(f"Error in handle_chat_history_page: {str(e)}")
+        return {'error': 'Failed to load chat history'}
+
+@on_event('file_upload')
+def handle_file_upload(data):
+    try:
+        room = data['room']
+        entry = presence.get(data['user_id'])
+        if entry is None or entry.room != room or entry.sid != request.sid:
+            emit('error', {'message': 'Not connected to this room'})
+            return
+        # Reject on the encoded length before paying for the decode
+        if len(data['file_data']) * 3 // 4 > files.max_file_size:
+            emit('error', {'message': f'File size exceeds {files.max_file_size // (1024 * 1024)}MB'})
+            return
+        stored = files.put(data['file_name'], base64.b64decode(data['file_data'], validate=True))
+        announce_file(room, entry, stored)
+        logger.info("File uploaded to room %s: %s", room, data['file_name'], extra={'event': 'file_upload'})
+    except Exception as e:
+        logger.error(f"Error in handle_file_upload: {str(e)}")
+        emit('error', {'message': 'Failed to upload file'})
+
+@on_event('file_upload_init')
+def handle_file_upload_init(data):
+    try:
+        # Resuming: report how many bytes the server already holds so the client continues from there
+        if data.get('upload_id'):
+            upload = files.get_upload(data['upload_id'])
+            if upload is None or upload.user_id != data['user_id']:
+                return {'error': 'Unknown upload'}
+            return {'upload_id': upload.upload_id, 'offset': upload.received, 'chunk_size': app.config['UPLOAD_CHUNK_SIZE']}
+        room = data['room']
+        entry = presence.get(data['user_id'])
+        if entry is None or entry.room != room or entry.sid != request.sid:
+            return {'error': 'Not connected to this room'}
+        upload = files.begin_upload(data['user_id'], room, data['file_name'], int(data['size']))
+        logger.info("Chunked upload %s started in room %s: %s (%d bytes)", upload.upload_id, room, upload.name, upload.size,
+                    extra={'event': 'file_upload_init'})
+        return {'upload_id': upload.upload_id, 'offset': 0, 'chunk_size': app.config['UPLOAD_CHUNK_SIZE']}
+    except ValueError as e:
+        return {'error': str(e)}
+    except Exception as e:
+        logger.error(f"Error in handle_file_upload_init: {str(e)}")
+        return {'error': 'Failed to start upload'}
+
+@on_event('file_upload_chunk')
+def handle_file_upload_chunk(data):
+    try:
+        upload = files.get_upload(data['upload_id'])
+        if upload is None or upload.user_id != data['user_id']:
+            return {'error': 'Unknown upload'}
+        chunk = data['data']
+        if len(chunk) > app.config['UPLOAD_CHUNK_SIZE']:
+            return {'error': 'Chunk too large', 'offset': upload.received}
+        if zlib.crc32(chunk) != data['crc32']:
+            return {'error': 'Checksum mismatch', 'offset': upload.received}
+        metrics.inc('edge2_upload_bytes_received_total', (), len(chunk))
+        try:
+            offset = files.append_chunk(upload.upload_id, int(data['offset']), chunk)
+        except ValueError as e:
+            return {'error': str(e), 'offset': upload.received}
+        return {'offset': offset}
+    except Exception as e:
+        logger.error(f"Error in handle_file_upload_chunk: {str(e)}")
+        return {'error': 'Failed to store chunk'}
+
+@on_event('file_upload_commit')
+def handle_file_upload_commit(data):
+    try:
+        upload = files.get_upload(data['upload_id'])
+        if upload is None or upload.user_id != data['user_id']:
+            return {'error': 'Unknown upload'}
+        room = upload.room
+        # The uploader may have left since init; announcing then would recreate the history of a
+        # room nobody is in, which release_room never frees again
+        entry = presence.get(upload.user_id)
+        if entry is None or entry.room != room or entry.sid != request.sid:
+            return {'error': 'Not connected to this room'}
+        stored = files.commit_upload(upload.upload_id)
+        announce_file(room, entry, stored)
+        logger.info("File uploaded to room %s: %s (%d bytes in chunks)", room, stored.name, stored.size,
+                    extra={'event': 'file_upload_commit'})
+        return {'file_id': stored.file_id}
+    except ValueError as e:
+        return {'error': str(e)}
+    except Exception as e:
+        logger.error(f"Error in handle_file_upload_commit: {str(e)}")
+        return {'error': 'Failed to finish upload'}
+
+@on_event('update_mute_status')
+def handle_update_mute_status(data):
+    try:
+        room = data['room']
+        user_id = data['user_id']
+        audio_muted = data['audioMuted']
+        video_muted = data['videoMuted']
+        emit('update_mute_status', {
+            'user_id': user_id,
+            'room': room,
+            'audioMuted': audio_muted,
+            'videoMuted': video_muted
+        }, room=room, include_self=False)
+        logger.debug("Mute status updated for user %s in room %s: audio=%s, video=%s", user_id, room, audio_muted, video_muted,
+                     extra={'event': 'update_mute_status'})
+    except Exception as e:
+        logger.error(f"Error in handle_update_mute_status: {str(e)}")
+        emit('error', {'message': 'Failed to update mute status'})
+
+def _percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+# Load test against a running server, to compare worker models: `clients` WebSocket-only clients
+# join rooms of room_size, ramping up `ramp` per second, and hold their connections for `seconds`
+# while each room's first member sends a chat message every second. Reports join (ack) latency,
+# broadcast delivery latency and how many connections survived. Uses python-socketio's asyncio
+# client, which needs aiohttp; run it from a second shell once per EDGE2_ASYNC_MODE.
+async def load_test(url, clients, room_size=10, seconds=30, ramp=500):
+    try:
+        import socketio as socketio_client  # the client package; `socketio` here is the server
+        import aiohttp  # noqa: F401
+    except ImportError:
+        logger.error("The load test needs python-socketio's asyncio client (pip install aiohttp)")
+        return False
+    joins, deliveries, sent = [], [], {}
+    outcome = {'failed': 0, 'held': 0}
+
+    async def participant(index):
+        client = socketio_client.AsyncClient(reconnection=False)
+        room = f"load-test-{index // room_size}"
+        user_id = f"load-test-{index}"
+
+        @client.on('chat_message')
+        async def on_chat_message(data):
+            started = sent.get(data.get('message'))
+            if started is not None:
+                deliveries.append(time.perf_counter() - started)
+
+        try:
+            await client.connect(url, transports=['websocket'], wait_timeout=30)
+            started = time.perf_counter()
+            await client.call('join_room', {'room': room, 'user_id': user_id, 'username': user_id}, timeout=30)
+            joins.append(time.perf_counter() - started)
+            for tick in range(seconds):
+                await asyncio.sleep(1)
+                if index % room_size == 0:
+                    message = f"{user_id}:{tick}"
+                    sent[message] = time.perf_counter()
+                    await client.emit('chat_message', {'room': room, 'user_id': user_id, 'username': user_id, 'message': message})
+            if client.connected:
+                outcome['held'] += 1
+        except Exception as e:
+            outcome['failed'] += 1
+            logger.debug("Load-test client %d failed: %s", index, e)
+        finally:
+            await client.disconnect()
+
+    logger.info("Load test: %d clients in rooms of %d against %s for %ss", clients, room_size, url, seconds)
+    started = time.perf_counter()
+    tasks = []
+    for index in range(clients):
+        tasks.append(asyncio.ensure_future(participant(index)))
+        if (index + 1) % ramp == 0:
+            await asyncio.sleep(1)
+    await asyncio.gather(*tasks)
+    logger.info("Load test: %d of %d connections held for %ss, %d failed (%.1fs total)", outcome['held'], clients,
+                seconds, outcome['failed'], time.perf_counter() - started)
+    logger.info("Load test: join ack p50 %.1f ms, p99 %.1f ms; chat delivery p50 %.1f ms, p99 %.1f ms (%d deliveries)",
+                _percentile(joins, 0.5) * 1000, _percentile(joins, 0.99) * 1000,
+                _percentile(deliveries, 0.5) * 1000, _percentile(deliveries, 0.99) * 1000, len(deliveries))
+    return outcome['failed'] == 0
+
+# Each greenlet-served WebSocket holds a file descriptor, so lift the soft limit to the hard one
+def raise_open_file_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            logger.info(f"Raised open file limit from {soft} to {hard}")
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"Could not raise open file limit: {str(e)}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Edge 2 Meet server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--production', action='store_true',
+                        help='disable debug and the reloader; needs the eventlet or gevent backend')
+    parser.add_argument('--fetch-vendor', action='store_true',
+                        help='download the pinned vendor assets into static/vendor and exit')
+    parser.add_argument('--sfu-selftest', type=int, metavar='N',
+                        help='relay synthetic media between N headless clients through the SFU and exit')
+    parser.add_argument('--load-test', type=int, metavar='N',
+                        help='connect N Socket.IO clients to the server at --host/--port, report latencies and exit')
+    parser.add_argument('--load-test-seconds', type=int, default=30,
+                        help='how long each load-test client stays connected (default 30)')
+    args = parser.parse_args()
+    if args.fetch_vendor:
+        fetch_vendor_assets()
+        sys.exit(0)
+    if args.sfu_selftest:
+        if RTCPeerConnection is None:
+            sys.exit('The SFU self-test needs aiortc')
+        sys.exit(0 if sfu.call(sfu_selftest(SfuRouter(), max(args.sfu_selftest, 2)), timeout=120) else 1)
+    if args.load_test:
+        if ASYNC_MODE != 'threading':
+            sys.exit('Run the load test with EDGE2_ASYNC_MODE=threading; its asyncio client does not run on a patched hub')
+        raise_open_file_limit()
+        url = f"http://{'127.0.0.1' if args.host == '0.0.0.0' else args.host}:{args.port}"
+        sys.exit(0 if asyncio.run(load_test(url, args.load_test, seconds=args.load_test_seconds)) else 1)
+    logger.info(f"Starting Edge 2 Meet Flask-SocketIO server (async mode: {socketio.async_mode})")
+    start_background_tasks()
+    if args.production:
+        if socketio.async_mode == 'threading':
+            sys.exit('Production mode needs the eventlet or gevent backend; threading would serve through the Werkzeug development server')
+        raise_open_file_limit()
+        socketio.run(app, host=args.host, port=args.port, debug=False, use_reloader=False, log_output=False)
+    else:
+        socketio.run(app, debug=True, host=args.host, port=args.port)
+